@@ -2,22 +2,40 @@
 FastAPI приложение для работы с LLM
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from app.routers import llm
-from app.services.analyzer import SiteAnalyzer
+from typing import List, Optional
+from app.routers import jobs, llm
+from app.services.batch import analyze_batch
+from app.services.container import get_services
+from app.services.rate_limiter import OverloadedError
+from app.services.metrics import MetricsMiddleware, render_metrics
+from app.services.profiling import ProfilingMiddleware
+import json
 import logging
 import os
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Сколько секунд при остановке ждать фоновые задачи с запросами к LLM
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Закрывает общие сервисы и пулы HTTP соединений при остановке приложения"""
+    yield
+    await get_services().aclose(drain_timeout=SHUTDOWN_DRAIN_TIMEOUT)
+
 # Создаем экземпляр FastAPI приложения
 app = FastAPI(
     title="LLM API",
     description="API для работы с языковыми моделями",
-    version="1.0.2"
+    version="1.0.2",
+    lifespan=lifespan
 )
 
 # Настройка CORS для фронтенда
@@ -35,12 +53,29 @@ app.add_middleware(
 # Подключаем роутер для работы с LLM
 app.include_router(llm.router, prefix="/api/v1", tags=["LLM"])
 
-# Создаем экземпляр анализатора сайтов
-site_analyzer = SiteAnalyzer()
+# Подключаем роутер фоновых задач анализа сайтов
+app.include_router(jobs.router, tags=["Jobs"])
+
+# Трассы стадий и профили запросов по заголовку x-profile или выборке, буфер медленных запросов
+app.add_middleware(ProfilingMiddleware)
+
+# Метрики HTTP запросов и метка endpoint для метрик сервисов
+app.add_middleware(MetricsMiddleware)
 
 # Модель для запроса анализа сайта
 class AnalyzeRequest(BaseModel):
     url: str
+    no_cache: bool = False
+
+# Модель для запроса пакетного анализа сайтов
+class AnalyzeBatchRequest(BaseModel):
+    urls: List[str]
+    concurrency: Optional[int] = None
+    no_cache: bool = False
+
+# Ограничения пакетного анализа
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "10"))
 
 @app.get("/")
 async def root():
@@ -52,6 +87,11 @@ async def health_check():
     """Проверка состояния API"""
     return {"status": "healthy", "service": "LLM API"}
 
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/analyze-site")
 async def analyze_site(request: AnalyzeRequest) -> dict:
     """
@@ -66,11 +106,38 @@ async def analyze_site(request: AnalyzeRequest) -> dict:
     try:
         logger.info(f"Получен запрос на анализ сайта: {request.url}")
         
-        result = site_analyzer.analyze_site(request.url)
+        result = await get_services().site_analyzer.aanalyze_site(request.url, no_cache=request.no_cache)
         
         logger.info("Анализ сайта выполнен успешно")
         return result
         
+    except OverloadedError as e:
+        logger.warning(f"Анализ сайта {request.url} отклонен: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
     except Exception as e:
         logger.error(f"Ошибка при анализе сайта {request.url}: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка при анализе сайта: {str(e)}")
+
+@app.post("/analyze-sites")
+async def analyze_sites(request: AnalyzeBatchRequest) -> StreamingResponse:
+    """
+    Пакетный анализ сайтов. Результаты отдаются в формате NDJSON
+    по мере готовности каждого URL
+    
+    Args:
+        request: Объект со списком URL и необязательным лимитом параллелизма
+        
+    Returns:
+        StreamingResponse: Поток строк JSON с результатом или ошибкой для каждого URL
+    """
+    if len(request.urls) > BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"Слишком много URL в запросе, максимум: {BATCH_MAX_URLS}")
+    
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    logger.info(f"Получен запрос на пакетный анализ {len(request.urls)} сайтов, параллелизм: {concurrency}")
+    
+    async def stream_results():
+        async for result in analyze_batch(get_services().site_analyzer, request.urls, concurrency, no_cache=request.no_cache):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
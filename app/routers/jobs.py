@@ -0,0 +1,119 @@
+"""
+Роутер фоновых задач анализа сайтов
+"""
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import AsyncIterator
+import json
+import logging
+
+from app.services.jobs import Job, JobQueueFullError, get_job_queue
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Создаем роутер
+router = APIRouter()
+
+# Интервал комментариев SSE, чтобы прокси не закрывали простаивающее соединение
+HEARTBEAT_INTERVAL = 15.0
+
+# Модель для постановки задачи
+class JobRequest(BaseModel):
+    url: str
+    no_cache: bool = False
+    crawl: bool = False
+
+def _get_job(job_id: str) -> Job:
+    """
+    Возвращает задачу по идентификатору
+
+    Args:
+        job_id: Идентификатор задачи
+
+    Returns:
+        Job: Задача
+
+    Raises:
+        HTTPException: 404, если задача не найдена или устарела
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Задача {job_id} не найдена")
+    return job
+
+@router.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest) -> dict:
+    """
+    Ставит анализ сайта в фоновую очередь и сразу возвращает идентификатор задачи.
+    С crawl=true обходится весь сайт, ход обхода и уже обработанные страницы
+    отдаются в поле progress задачи
+
+    Args:
+        request: Объект с URL сайта для анализа и режимом обхода
+
+    Returns:
+        dict: Идентификатор задачи, ее состояние и адреса для получения результата
+    """
+    try:
+        job = get_job_queue().submit(request.url, no_cache=request.no_cache, crawl=request.crawl)
+    except JobQueueFullError as e:
+        logger.warning(f"Задача для {request.url} отклонена: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> dict:
+    """
+    Состояние задачи и результат анализа, если он готов
+
+    Args:
+        job_id: Идентификатор задачи
+
+    Returns:
+        dict: Описание задачи
+    """
+    return _get_job(job_id).to_dict()
+
+async def _job_events(job_id: str) -> AsyncIterator[str]:
+    """
+    Отдает событие status при каждом изменении задачи, пока она не завершится
+
+    Args:
+        job_id: Идентификатор задачи
+
+    Yields:
+        str: Событие SSE или комментарий-пинг
+    """
+    async for snapshot in get_job_queue().watch(job_id, HEARTBEAT_INTERVAL):
+        if snapshot is None:
+            yield ": ping\n\n"
+            continue
+        yield f"event: status\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+    yield "event: done\ndata: {}\n\n"
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str) -> StreamingResponse:
+    """
+    Подписка на изменения задачи (SSE). Последнее событие status содержит результат
+
+    Args:
+        job_id: Идентификатор задачи
+
+    Returns:
+        StreamingResponse: События status, затем событие done
+    """
+    _get_job(job_id)
+    return StreamingResponse(
+        _job_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
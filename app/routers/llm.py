@@ -2,13 +2,26 @@
 Роутер для работы с LLM API
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, Optional
+import json
 import logging
 
-from app.services.openai_module import LLMClient
-from app.services.analyzer import SiteAnalyzer
+from app.services.openai_module import LLMClient, get_usage_stats
+from app.services.llm_cache import get_llm_cache
+from app.services.page_cache import get_page_cache
+from app.services.near_duplicates import get_near_duplicate_index
+from app.services.latency import all_latency_stats
+from app.services.singleflight import all_singleflight_stats
+from app.services.micro_batch import all_micro_batch_stats
+from app.services.profiling import ADMIN_HEADER, get_profiler
+from app.services.container import get_services
+from app.services.resilience import CircuitOpenError, get_call_policy
+from app.services.rate_limiter import OverloadedError, PRIORITY_INTERACTIVE, get_llm_scheduler
+from app.services.model_pool import get_model_pool
+from app.services.fetcher import get_fetcher
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -16,11 +29,21 @@ logger = logging.getLogger(__name__)
 # Создаем роутер
 router = APIRouter()
 
-# Создаем экземпляр клиента LLM
-llm_client = LLMClient()
-
-# Создаем экземпляр анализатора сайтов
-site_analyzer = SiteAnalyzer()
+def _llm_client() -> LLMClient:
+    """
+    Возвращает общий клиент LLM
+    
+    Returns:
+        LLMClient: Клиент LLM
+        
+    Raises:
+        HTTPException: 503, если клиент LLM не настроен
+    """
+    try:
+        return get_services().llm_client
+    except Exception as e:
+        logger.error(f"LLM клиент недоступен: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"LLM недоступен: {str(e)}")
 
 # Модели для запросов
 class ChatRequest(BaseModel):
@@ -34,9 +57,17 @@ class ChatJsonRequest(BaseModel):
     system_prompt: str
     user_prompt: str
     json_standard: str = ""
+    no_cache: bool = False
 
 class AnalyzeRequest(BaseModel):
     url: str
+    no_cache: bool = False
+
+class CrawlRequest(BaseModel):
+    url: str
+    no_cache: bool = False
+    max_depth: Optional[int] = None
+    max_pages: Optional[int] = None
 
 @router.post("/chat")
 async def chat(request: ChatRequest):
@@ -49,14 +80,21 @@ async def chat(request: ChatRequest):
     Returns:
         Ответ от LLM
     """
+    llm_client = _llm_client()
+    
     try:
         logger.info(f"Получен запрос на простой чат: {request.prompt[:50]}...")
         
-        response = llm_client.chat(request.prompt)
+        response = await llm_client.achat(request.prompt)
         
         logger.info("Запрос выполнен успешно")
         return {"response": response}
         
+    except CircuitOpenError as e:
+        logger.warning(f"LLM недоступен: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except OverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Ошибка при выполнении простого чата: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при выполнении запроса: {str(e)}")
@@ -72,10 +110,12 @@ async def chat_with_system(request: ChatWithSystemRequest):
     Returns:
         Ответ от LLM
     """
+    llm_client = _llm_client()
+    
     try:
         logger.info(f"Получен запрос с системным промптом: {request.user_prompt[:50]}...")
         
-        response = llm_client.chat_with_system(
+        response = await llm_client.achat_with_system(
             request.system_prompt, 
             request.user_prompt
         )
@@ -83,10 +123,126 @@ async def chat_with_system(request: ChatWithSystemRequest):
         logger.info("Запрос с системным промптом выполнен успешно")
         return {"response": response}
         
+    except CircuitOpenError as e:
+        logger.warning(f"LLM недоступен: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except OverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Ошибка при выполнении запроса с системным промптом: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при выполнении запроса: {str(e)}")
 
+def _overloaded(error: OverloadedError) -> HTTPException:
+    """
+    Формирует ответ 503 для запроса, отклоненного очередью запросов к LLM
+    
+    Args:
+        error: Ошибка перегрузки с расчетным временем ожидания
+        
+    Returns:
+        HTTPException: Ответ 503 с заголовком Retry-After
+    """
+    logger.warning(f"Запрос отклонен: {str(error)}")
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(int(error.retry_after) + 1)})
+
+async def _sse_events(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Преобразует поток фрагментов ответа LLM в события Server-Sent Events
+    
+    Args:
+        deltas: Поток фрагментов ответа
+        
+    Yields:
+        str: Событие SSE
+    """
+    try:
+        async for delta in deltas:
+            yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+        
+    except Exception as e:
+        # Заголовки уже отправлены, поэтому ошибку передаем отдельным событием
+        logger.error(f"Ошибка при потоковом запросе: {str(e)}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+def _sse_response(deltas: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Создает потоковый ответ в формате text/event-stream
+    
+    Args:
+        deltas: Поток фрагментов ответа
+        
+    Returns:
+        StreamingResponse: Потоковый ответ
+    """
+    return StreamingResponse(
+        _sse_events(deltas),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _start_stream(deltas: AsyncIterator[str]) -> StreamingResponse:
+    """
+    Начинает потоковый ответ: до отправки заголовков ждет очередь запросов к LLM и первый фрагмент,
+    чтобы перегрузка и недоступность LLM вернулись ответом 503, а не событием error после 200
+    
+    Args:
+        deltas: Поток фрагментов ответа
+        
+    Returns:
+        StreamingResponse: Потоковый ответ
+        
+    Raises:
+        HTTPException: 503 при перегрузке или недоступности LLM, 500 при другой ошибке до начала ответа
+    """
+    try:
+        first = await deltas.__anext__()
+    except StopAsyncIteration:
+        return _sse_response(deltas)
+    except CircuitOpenError as e:
+        logger.warning(f"LLM недоступен: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Ошибка при потоковом запросе: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при выполнении запроса: {str(e)}")
+    
+    async def with_first() -> AsyncIterator[str]:
+        yield first
+        async for delta in deltas:
+            yield delta
+    
+    return _sse_response(with_first())
+
+@router.post("/chat-stream")
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """
+    Простой запрос к LLM с потоковой выдачей токенов (SSE)
+    
+    Args:
+        request: Объект с промптом
+        
+    Returns:
+        StreamingResponse: События с фрагментами ответа, затем событие done
+    """
+    logger.info(f"Получен запрос на потоковый чат: {request.prompt[:50]}...")
+    return await _start_stream(_llm_client().astream_chat(request.prompt))
+
+@router.post("/chat-with-system-stream")
+async def chat_with_system_stream(request: ChatWithSystemRequest) -> StreamingResponse:
+    """
+    Запрос к LLM с системным промптом и потоковой выдачей токенов (SSE)
+    
+    Args:
+        request: Объект с системным и пользовательским промптами
+        
+    Returns:
+        StreamingResponse: События с фрагментами ответа, затем событие done
+    """
+    logger.info(f"Получен потоковый запрос с системным промптом: {request.user_prompt[:50]}...")
+    return await _start_stream(_llm_client().astream_chat_with_system(request.system_prompt, request.user_prompt))
+
 @router.post("/chat-json")
 async def chat_json(request: ChatJsonRequest):
     """
@@ -98,6 +254,8 @@ async def chat_json(request: ChatJsonRequest):
     Returns:
         Ответ от LLM в виде словаря
     """
+    llm_client = _llm_client()
+    
     try:
         logger.info(f"Получен JSON запрос: {request.user_prompt[:50]}...")
         
@@ -106,11 +264,16 @@ async def chat_json(request: ChatJsonRequest):
         if request.json_standard:
             system_prompt = f"{system_prompt}\n\nСтандарт JSON: {request.json_standard}"
         
-        response = llm_client.chat_json(system_prompt, request.user_prompt)
+        response = await llm_client.achat_json(system_prompt, request.user_prompt, no_cache=request.no_cache)
         
         logger.info("JSON запрос выполнен успешно")
         return {"response": response}
         
+    except CircuitOpenError as e:
+        logger.warning(f"LLM недоступен: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except OverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         logger.error(f"Ошибка при выполнении JSON запроса: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Ошибка при выполнении JSON запроса: {str(e)}")
@@ -129,11 +292,192 @@ async def analyze_site(request: AnalyzeRequest) -> dict:
     try:
         logger.info(f"Получен запрос на анализ сайта: {request.url}")
         
-        result = site_analyzer.analyze_site(request.url)
+        result = await get_services().site_analyzer.aanalyze_site(request.url, no_cache=request.no_cache)
         
         logger.info("Анализ сайта выполнен успешно")
         return result
         
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Ошибка при анализе сайта {request.url}: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Ошибка при анализе сайта: {str(e)}")
+
+@router.post("/crawl-site")
+async def crawl_site(request: CrawlRequest) -> dict:
+    """
+    Обход сайта (sitemap.xml и ссылки на тот же сайт) и генерация вопросов по общему тексту страниц.
+    Повторный обход скачивает и разбирает только изменившиеся страницы.
+    Для долгих обходов с ходом выполнения - POST /jobs с crawl=true
+    
+    Args:
+        request: Объект с URL начальной страницы и необязательными лимитами глубины и числа страниц
+        
+    Returns:
+        dict: URL, вопросы, страницы с состояниями (new, changed, not_modified, unchanged, fresh, failed)
+            и счетчики обхода
+    """
+    try:
+        logger.info(f"Получен запрос на обход сайта: {request.url}")
+        
+        result = await get_services().site_crawler.acrawl(
+            request.url, no_cache=request.no_cache, priority=PRIORITY_INTERACTIVE,
+            max_depth=request.max_depth, max_pages=request.max_pages
+        )
+        
+        logger.info("Обход сайта выполнен успешно")
+        return result
+        
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except Exception as e:
+        logger.error(f"Ошибка при обходе сайта {request.url}: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Ошибка при обходе сайта: {str(e)}")
+
+@router.post("/analyze-site-stream")
+async def analyze_site_stream(request: AnalyzeRequest) -> StreamingResponse:
+    """
+    Анализ сайта с потоковой выдачей вопросов (SSE): каждый вопрос отправляется,
+    как только LLM его сгенерировал
+    
+    Args:
+        request: Объект с URL сайта для анализа
+        
+    Returns:
+        StreamingResponse: События с вопросами, затем событие done с полным результатом
+    """
+    analyzer = get_services().site_analyzer
+    try:
+        logger.info(f"Получен запрос на потоковый анализ сайта: {request.url}")
+        
+        # Ошибку скачивания возвращаем обычным ответом, до начала потока
+        text = await analyzer.afetch_site_text(request.url)
+        if not text.strip():
+            raise Exception("Не удалось извлечь текст из сайта")
+        
     except Exception as e:
         logger.error(f"Ошибка при анализе сайта {request.url}: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Ошибка при анализе сайта: {str(e)}")
+    
+    async def events() -> AsyncIterator[str]:
+        questions = []
+        async for question in analyzer.astream_questions(text, no_cache=request.no_cache):
+            questions.append(question)
+            yield f"data: {json.dumps({'question': question}, ensure_ascii=False)}\n\n"
+        result = {"url": request.url, "questions": questions}
+        yield f"event: done\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """
+    Статистика кэша ответов LLM, кэша страниц, индекса почти одинаковых страниц
+    (avoided_llm_calls - анализы без запроса к LLM) и объединения одинаковых запросов
+    
+    Returns:
+        Счетчики попаданий и промахов кэшей и объединенных запросов
+    """
+    stats = {}
+    for name, cache in (("llm", get_llm_cache()), ("pages", get_page_cache()),
+                        ("near_duplicates", get_near_duplicate_index())):
+        stats[name] = {"enabled": True, **cache.get_stats()} if cache is not None else {"enabled": False}
+    stats["coalescing"] = all_singleflight_stats()
+    
+    return stats
+
+@router.get("/fetch-stats")
+async def fetch_stats():
+    """
+    Статистика скачивания сайтов: запросы, новые соединения, доля переиспользованных
+    соединений, ответы по HTTP/2 и кэш DNS
+    
+    Returns:
+        Счетчики клиентов скачивания и кэша DNS
+    """
+    return get_fetcher().get_stats()
+
+@router.get("/crawl-stats")
+async def crawl_stats():
+    """
+    Статистика обходов сайтов: обходы, страницы по состояниям и хранилище состояний обходов
+    
+    Returns:
+        Счетчики обходов и страниц
+    """
+    return get_services().site_crawler.get_stats()
+
+@router.get("/stream-stats")
+async def stream_stats():
+    """
+    Время до первого токена (TTFT) и полное время потоковых ответов
+    
+    Returns:
+        Сводки задержек в секундах (count, avg, p50, p95, p99)
+    """
+    return {name: summary for name, summary in all_latency_stats().items() if name.startswith("stream.")}
+
+@router.get("/llm-stats")
+async def llm_stats():
+    """
+    Статистика вызовов LLM: повторы, дублирующие запросы, выключатель,
+    очередь запросов (глубина, отклоненные), пул моделей (переключения, SLO),
+    пакетная генерация вопросов (размер пакетов), расход токенов с долей кэшированного префикса и задержки, включая ожидание в очереди
+    
+    Returns:
+        Счетчики политики, очереди, пула моделей, пакетов и токенов и сводки задержек в секундах
+    """
+    latency = {name: summary for name, summary in all_latency_stats().items() if name.startswith("llm.")}
+    return {
+        "policy": get_call_policy().get_stats(),
+        "scheduler": get_llm_scheduler().get_stats(),
+        "pool": get_model_pool().get_stats(),
+        "batching": all_micro_batch_stats(),
+        "usage": get_usage_stats(),
+        "latency": latency
+    }
+
+def _check_profile_access(token: Optional[str]):
+    """Проверяет заголовок x-admin-token для доступа к профилям запросов"""
+    if not get_profiler().is_admin(token):
+        raise HTTPException(status_code=403, detail="Нужен заголовок x-admin-token со значением PROFILE_ADMIN_TOKEN")
+
+@router.get("/slow-requests")
+async def slow_requests(admin_token: Optional[str] = Header(default=None, alias=ADMIN_HEADER)):
+    """
+    Медленные запросы (дольше PROFILE_SLOW_THRESHOLD) и профилированные запросы из кольцевых
+    буферов, от новых к старым. Нужен заголовок x-admin-token со значением PROFILE_ADMIN_TOKEN
+    
+    Returns:
+        Счетчики профилирования и сводки запросов: длительность и время стадий в секундах
+    """
+    _check_profile_access(admin_token)
+    profiler = get_profiler()
+    return {
+        "stats": profiler.get_stats(),
+        "slow": profiler.list_slow(),
+        "profiles": profiler.list_profiles()
+    }
+
+@router.get("/profiles/{trace_id}")
+async def get_profile(trace_id: str, admin_token: Optional[str] = Header(default=None, alias=ADMIN_HEADER)):
+    """
+    Трасса запроса: спаны стадий (download, extract, prompt, llm_queue, llm_request, json_parse
+    и другие) и, если запрос профилировался, самые частые стеки в формате flamegraph.
+    Идентификатор приходит в заголовке x-profile-id ответа или в списке /slow-requests
+    
+    Args:
+        trace_id: Идентификатор трассы
+        
+    Returns:
+        Трасса запроса
+    """
+    _check_profile_access(admin_token)
+    trace = get_profiler().get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Трасса {trace_id} не найдена")
+    return trace.to_dict()
@@ -0,0 +1,91 @@
+"""
+Продакшен-запуск API: несколько процессов uvicorn без слежения за файлами
+
+Запуск:
+    python -m app.server
+"""
+
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+
+import uvicorn
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+def _cpu_count() -> int:
+    """
+    Количество ядер, доступных процессу (с учетом ограничения CPU affinity в контейнере)
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _workers() -> int:
+    """
+    Количество процессов: WEB_CONCURRENCY или по одному на ядро.
+    Обработка запросов почти целиком ожидает сеть, а разбор страниц нагружает CPU,
+    поэтому процессов больше числа ядер не требуется
+    """
+    return max(1, int(os.environ.get("WEB_CONCURRENCY") or 0) or _cpu_count())
+
+
+def _loop() -> str:
+    """uvloop, если он установлен (uvicorn[standard]) и поддерживается платформой"""
+    if sys.platform != "win32" and importlib.util.find_spec("uvloop") is not None:
+        return "uvloop"
+    return "asyncio"
+
+
+def _http() -> str:
+    """Парсер HTTP на C (httptools), если он установлен, иначе h11"""
+    return "httptools" if importlib.util.find_spec("httptools") is not None else "h11"
+
+
+def main():
+    """
+    Запускает uvicorn с настройками из переменных окружения:
+    SERVER_HOST, SERVER_PORT, WEB_CONCURRENCY, SERVER_BACKLOG, SERVER_KEEP_ALIVE,
+    SERVER_GRACEFUL_TIMEOUT, SERVER_LIMIT_CONCURRENCY, SERVER_ACCESS_LOG, LOG_LEVEL
+    """
+    load_dotenv()
+    workers = _workers()
+
+    if workers > 1 and not os.environ.get("JOBS_DB_PATH"):
+        # Запрос состояния задачи может попасть в другой процесс, поэтому состояния
+        # задач хранятся в общем файле. Процессы uvicorn наследуют окружение
+        os.environ["JOBS_DB_PATH"] = os.path.join(tempfile.gettempdir(), "user_questions_jobs.sqlite3")
+
+    limit_concurrency = int(os.environ.get("SERVER_LIMIT_CONCURRENCY", "0"))
+    config = {
+        "host": os.environ.get("SERVER_HOST", "0.0.0.0"),
+        "port": int(os.environ.get("SERVER_PORT", "8000")),
+        "workers": workers,
+        "loop": _loop(),
+        "http": _http(),
+        "backlog": int(os.environ.get("SERVER_BACKLOG", "2048")),
+        # Дольше таймаута простоя прокси (nginx - 60 с), чтобы соединение закрывал прокси, а не мы
+        "timeout_keep_alive": int(os.environ.get("SERVER_KEEP_ALIVE", "75")),
+        # Столько ждем незавершенные запросы после SIGTERM, затем столько же - фоновые задачи
+        "timeout_graceful_shutdown": int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30")),
+        "limit_concurrency": limit_concurrency or None,
+        "access_log": os.environ.get("SERVER_ACCESS_LOG", "false").lower() == "true",
+        "log_level": os.environ.get("LOG_LEVEL", "info").lower(),
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    }
+    logger.info(
+        f"Запуск сервера: {config['workers']} процессов, loop={config['loop']}, http={config['http']}, "
+        f"backlog={config['backlog']}, keep-alive={config['timeout_keep_alive']} с"
+    )
+    uvicorn.run("app.main:app", **config)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(levelname)s:     %(message)s")
+    main()
@@ -2,38 +2,195 @@
 Сервис для анализа веб-сайтов
 """
 
-import requests
-from bs4 import BeautifulSoup
-from typing import List, Dict, Any
+import asyncio
+import os
+import time
+import httpx
+from contextlib import nullcontext
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from urllib.parse import urldefrag
 import logging
+from pydantic import BaseModel, Field
 
 from app.services.openai_module import LLMClient
+from app.services.model_pool import TASK_QUESTIONS
+from app.services.page_cache import CachedPage, PageCache, get_page_cache
+from app.services.fetcher import get_fetcher
+from app.services.prompts import PromptTemplate
+from app.services.batch import StageLimits
+from app.services.extractors import get_extractor
+from app.services.html_stream import HtmlStreamReader
+from app.services.content_selector import ContentSelector
+from app.services.singleflight import get_singleflight
+from app.services.near_duplicates import NearDuplicateEntry, canonicalize_url, get_near_duplicate_index, simhash
+from app.services.micro_batch import MicroBatcher, register_micro_batcher
+from app.services.rate_limiter import OverloadedError, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from app.services.metrics import (
+    ANALYZE_ERRORS, ANALYZE_STAGE_SECONDS, DOWNLOADED_BYTES, PAGE_BYTES, QUESTIONS, TEXT_CHARS, endpoint_label
+)
 
 logger = logging.getLogger(__name__)
 
 
+# Размер порции при потоковом скачивании
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Сколько символов текста извлекается со страницы для последующего отбора в промпт
+EXTRACT_MAX_CHARS = int(os.environ.get("EXTRACT_MAX_CHARS", "50000"))
+
+# Бюджет токенов текста сайта в промпте
+PROMPT_TEXT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TEXT_TOKEN_BUDGET", "2000"))
+
+# Сколько вопросов генерируется для сайта
+QUESTIONS_COUNT = 5
+
+# Примерный объем ответа LLM на одну страницу в токенах: ограничивает число страниц
+# в одном запросе при пакетной генерации, чтобы ответ поместился в OPENAI_MAX_TOKENS
+PAGE_OUTPUT_TOKENS = 200
+
+# Резервные вопросы на случай ошибки LLM
+FALLBACK_QUESTIONS = (
+    "Какова основная цель этого сайта?",
+    "Какие услуги или продукты предлагаются?",
+    "Как связаться с компанией?",
+    "Какие есть способы оплаты?",
+    "Есть ли скидки или специальные предложения?",
+)
+
+
+class QuestionsResponse(BaseModel):
+    """
+    Схема ответа LLM с вопросами (response_format json_schema и проверка ответа)
+    """
+    questions: List[str] = Field(min_length=QUESTIONS_COUNT)
+
+
+class PageQuestions(BaseModel):
+    """
+    Вопросы одной страницы в ответе на пакетный запрос
+    """
+    id: str
+    questions: List[str]
+
+
+class PackedQuestionsResponse(BaseModel):
+    """
+    Схема ответа LLM на пакетный запрос: вопросы по идентификаторам страниц.
+    Количество вопросов проверяется для каждой страницы отдельно, чтобы ошибка
+    в одной странице не отбрасывала ответы по остальным
+    """
+    pages: List[PageQuestions]
+
+
+# Промпт генерации вопросов: инструкции одинаковы для всех сайтов и образуют кэшируемый префикс,
+# текст сайта идет последним в пользовательском сообщении
+QUESTIONS_PROMPT = PromptTemplate(
+    "questions",
+    system="""Ты пользователь сайта. Тебе дают текст сайта, который ты посетил.
+
+В ответе в формате JSON выдай список из 5 вопросов, которые возникли после посещения сайта.
+
+Формат ответа:
+{
+    "questions": [
+        "Вопрос 1",
+        "Вопрос 2",
+        "Вопрос 3",
+        "Вопрос 4",
+        "Вопрос 5"
+    ]
+}""",
+    user="""Проанализируй текст сайта и сформулируй 5 вопросов, которые могут возникнуть у пользователя после его изучения.
+
+Текст сайта:
+{site_text}"""
+)
+
+# Промпт генерации вопросов сразу для нескольких сайтов (пакетный режим)
+PACKED_QUESTIONS_PROMPT = PromptTemplate(
+    "packed_questions",
+    system="""Ты пользователь сайтов. Тебе дают тексты нескольких сайтов, которые ты посетил.
+Текст каждого сайта находится в блоке <page id="...">...</page>.
+
+Для каждого сайта отдельно сформулируй 5 вопросов, которые возникли после посещения именно этого сайта.
+Не смешивай сайты между собой и не пропускай ни одного.
+
+Формат ответа:
+{
+    "pages": [
+        {
+            "id": "идентификатор из блока page",
+            "questions": ["Вопрос 1", "Вопрос 2", "Вопрос 3", "Вопрос 4", "Вопрос 5"]
+        }
+    ]
+}""",
+    user="""Проанализируй тексты сайтов и для каждого сформулируй 5 вопросов, которые могут возникнуть у пользователя после его изучения.
+
+{pages}"""
+)
+
+
 class SiteAnalyzer:
     """
     Класс для анализа веб-сайтов и генерации вопросов
     """
     
-    def __init__(self):
+    def __init__(self, llm_client: Optional[LLMClient] = None):
         """
         Инициализация анализатора сайтов
+        
+        Args:
+            llm_client (Optional[LLMClient]): Общий клиент LLM. Если не задан, создается собственный
         """
-        try:
-            self.llm_client = LLMClient()
+        if llm_client is not None:
+            self.llm_client = llm_client
             self.llm_available = True
-            logger.info("LLM клиент успешно инициализирован")
-        except Exception as e:
-            logger.warning(f"LLM клиент недоступен: {str(e)}")
-            self.llm_client = None
-            self.llm_available = False
+        else:
+            try:
+                self.llm_client = LLMClient()
+                self.llm_available = True
+                logger.info("LLM клиент успешно инициализирован")
+            except Exception as e:
+                logger.warning(f"LLM клиент недоступен: {str(e)}")
+                self.llm_client = None
+                self.llm_available = False
         
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        # Общие HTTP клиенты скачивания: пулы соединений, HTTP/2, кэш DNS и таймауты (FETCH_*)
+        self.fetcher = get_fetcher()
+        
+        # Общий кэш страниц для условных GET запросов (None, если отключен)
+        self.page_cache = get_page_cache()
+        
+        # Движок извлечения текста (HTML_EXTRACTOR: auto, lxml, streaming или soup)
+        self.extractor = get_extractor()
+        
+        # Лимит размера скачиваемой страницы и режим извлечения текста на лету
+        self.max_download_bytes = int(os.environ.get("DOWNLOAD_MAX_BYTES", str(5 * 1024 * 1024)))
+        self.streaming_download = os.environ.get("DOWNLOAD_STREAMING", "true").lower() not in ("0", "false", "no")
+        
+        # Отбор текста для промпта с подсчетом токенов для модели LLM
+        model = self.llm_client.model if self.llm_client is not None else os.environ.get("OPENAI_MODEL", "gpt-4o")
+        self.content_selector = ContentSelector(model, PROMPT_TEXT_TOKEN_BUDGET)
+        
+        # Объединение одновременных анализов одного URL
+        self.singleflight = get_singleflight("analyze_site")
+        
+        # Индекс почти одинаковых страниц: их вопросы используются без запроса к LLM (None, если отключен)
+        self.near_duplicates = get_near_duplicate_index()
+        
+        # Пакетная генерация вопросов: страницы пакетного режима, пришедшие за короткое окно,
+        # отправляются в LLM одним запросом (QUESTIONS_BATCH_*, None, если отключена)
+        self.question_batcher = None
+        if os.environ.get("QUESTIONS_BATCH_ENABLED", "true").lower() not in ("0", "false", "no"):
+            max_pages = int(os.environ.get("QUESTIONS_BATCH_MAX_PAGES", "8"))
+            if self.llm_client is not None:
+                max_pages = min(max_pages, self.llm_client.max_tokens // PAGE_OUTPUT_TOKENS)
+            self.question_batcher = register_micro_batcher("questions", MicroBatcher(
+                self._agenerate_packed_questions,
+                window=float(os.environ.get("QUESTIONS_BATCH_WINDOW", "0.05")),
+                max_items=max(1, max_pages),
+                max_cost=int(os.environ.get("QUESTIONS_BATCH_TOKEN_BUDGET", "8000"))
+            ))
     
     def download_html(self, url: str) -> str:
         """
@@ -48,19 +205,287 @@ class SiteAnalyzer:
         Raises:
             Exception: Если не удалось скачать сайт
         """
+        return self._download_page(url).body
+    
+    def _download_page(self, url: str, extract_text: bool = False) -> CachedPage:
+        """
+        Потоково скачивает страницу (условным GET запросом, если она уже есть в кэше).
+        Тело читается порциями не больше DOWNLOAD_MAX_BYTES; при extract_text порции
+        сразу передаются в движок извлечения текста, и чтение прекращается после бюджета
+        
+        Args:
+            url (str): URL сайта для скачивания
+            extract_text (bool): Извлекать текст на лету вместо накопления HTML
+            
+        Returns:
+            CachedPage: Страница (из кэша при ответе 304)
+            
+        Raises:
+            Exception: Если не удалось скачать сайт
+        """
+        cached = self._cached_page(url, extract_text)
+        
+        try:
+            logger.info(f"Скачивание HTML с URL: {url}")
+            
+            with self.fetcher.stream("GET", url, headers=PageCache.conditional_headers(cached)) as response:
+                # httpx считает 304 ошибкой, а для условного запроса это ожидаемый ответ
+                if response.status_code == 304 and cached is not None:
+                    return self._not_modified(url, cached)
+                response.raise_for_status()
+                
+                reader = self._stream_reader(response.headers, extract_text)
+                for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    if reader.feed(chunk):
+                        break
+            
+            return self._page_from_reader(url, reader, response.headers)
+            
+        except httpx.HTTPError as e:
+            logger.error(f"Ошибка при скачивании сайта {url}: {str(e)}")
+            raise Exception(f"Не удалось скачать сайт: {str(e)}")
+    
+    async def adownload_html(self, url: str) -> str:
+        """
+        Асинхронно скачивает HTML-код сайта по URL, не блокируя event loop
+        
+        Args:
+            url (str): URL сайта для скачивания
+            
+        Returns:
+            str: HTML-код сайта
+            
+        Raises:
+            Exception: Если не удалось скачать сайт
+        """
+        return (await self._adownload_page(url)).body
+    
+    async def _adownload_page(
+        self,
+        url: str,
+        extract_text: bool = False,
+        parse: Optional[asyncio.Semaphore] = None,
+    ) -> CachedPage:
+        """
+        Асинхронно и потоково скачивает страницу (условным GET запросом, если она уже есть в кэше).
+        Порции декодируются и разбираются по мере поступления в пуле потоков,
+        поэтому event loop не блокируется
+        
+        Args:
+            url (str): URL сайта для скачивания
+            extract_text (bool): Извлекать текст на лету вместо накопления HTML
+            parse (Optional[asyncio.Semaphore]): Лимит стадии разбора HTML,
+                занимается на время обработки каждой порции
+            
+        Returns:
+            CachedPage: Страница (из кэша при ответе 304)
+            
+        Raises:
+            Exception: Если не удалось скачать сайт
+        """
+        cached = self._cached_page(url, extract_text)
+        
         try:
             logger.info(f"Скачивание HTML с URL: {url}")
             
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
+            async with self.fetcher.astream("GET", url, headers=PageCache.conditional_headers(cached)) as response:
+                # httpx считает 304 ошибкой, а для условного запроса это ожидаемый ответ
+                if response.status_code == 304 and cached is not None:
+                    return self._not_modified(url, cached)
+                response.raise_for_status()
+                
+                reader = self._stream_reader(response.headers, extract_text)
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    if await self._ain_thread(reader, parse, reader.feed, chunk):
+                        break
             
-            logger.info(f"HTML успешно скачан, размер: {len(response.text)} символов")
-            return response.text
+            result = await self._ain_thread(reader, parse, reader.finish)
+            return self._page_from_reader(url, reader, response.headers, result)
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Ошибка при скачивании сайта {url}: {str(e)}")
             raise Exception(f"Не удалось скачать сайт: {str(e)}")
     
+    async def _ain_thread(self, reader: HtmlStreamReader, parse: Optional[asyncio.Semaphore], func, *args):
+        """
+        Выполняет шаг потокового чтения (определение кодировки, декодирование, извлечение текста)
+        в пуле потоков. Лимит разбора занимается только на время шага, а не на время
+        ожидания сети, чтобы медленные сайты не занимали слоты стадии разбора
+        
+        Args:
+            reader (HtmlStreamReader): Читатель тела ответа
+            parse (Optional[asyncio.Semaphore]): Лимит стадии разбора HTML
+            func: Метод читателя
+            *args: Аргументы метода
+            
+        Returns:
+            Any: Результат метода читателя
+        """
+        slot = parse if parse is not None and reader.session is not None else nullcontext()
+        async with slot:
+            return await asyncio.to_thread(func, *args)
+    
+    def _cached_page(self, url: str, extract_text: bool) -> Optional[CachedPage]:
+        """
+        Возвращает закэшированную страницу, которой можно ответить на 304
+        
+        Args:
+            url (str): URL страницы
+            extract_text (bool): Нужен только текст страницы
+            
+        Returns:
+            Optional[CachedPage]: Закэшированная страница
+        """
+        if self.page_cache is None:
+            return None
+        
+        cached = self.page_cache.get(url)
+        # Для выдачи HTML по ответу 304 нужно сохраненное тело страницы
+        if cached is not None and cached.body is None and not extract_text:
+            return None
+        return cached
+    
+    def _not_modified(self, url: str, cached: CachedPage) -> CachedPage:
+        """
+        Обрабатывает ответ 304 на условный запрос
+        
+        Args:
+            url (str): URL страницы
+            cached (CachedPage): Закэшированная страница
+            
+        Returns:
+            CachedPage: Закэшированная страница
+        """
+        self.page_cache.not_modified(cached)
+        logger.info(f"Страница не изменилась (304), используем кэш: {url}")
+        return cached
+    
+    def _stream_reader(self, headers: Any, extract_text: bool) -> HtmlStreamReader:
+        """
+        Создает потоковый читатель тела ответа
+        
+        Args:
+            headers (Any): Заголовки ответа
+            extract_text (bool): Передавать порции в движок извлечения текста
+            
+        Returns:
+            HtmlStreamReader: Читатель тела ответа
+        """
+        session = self.extractor.session(EXTRACT_MAX_CHARS) if extract_text else None
+        return HtmlStreamReader(headers, self.max_download_bytes, session)
+    
+    def _page_from_reader(
+        self,
+        url: str,
+        reader: HtmlStreamReader,
+        headers: Any,
+        result: Optional[str] = None,
+    ) -> CachedPage:
+        """
+        Завершает потоковое чтение и сохраняет страницу в кэш
+        
+        Args:
+            url (str): URL страницы
+            reader (HtmlStreamReader): Читатель тела ответа
+            headers (Any): Заголовки ответа
+            result (Optional[str]): Результат reader.finish(), если чтение уже завершено
+            
+        Returns:
+            CachedPage: Скачанная страница
+            
+        Raises:
+            Exception: Если HTML целиком не помещается в DOWNLOAD_MAX_BYTES
+        """
+        if result is None:
+            result = reader.finish()
+        extract_text = reader.session is not None
+        
+        if reader.truncated:
+            if not extract_text:
+                raise Exception(f"Размер страницы превышает лимит {self.max_download_bytes} байт")
+            logger.warning(f"Страница {url} обрезана по лимиту {self.max_download_bytes} байт")
+        
+        logger.info(f"HTML успешно скачан, прочитано: {reader.bytes_read} байт, кодировка: {reader.encoding}")
+        labels = self._metric_labels()
+        DOWNLOADED_BYTES.inc(reader.bytes_read, **labels)
+        PAGE_BYTES.observe(reader.bytes_read, **labels)
+        
+        body = None if extract_text else result
+        if self.page_cache is None:
+            page = CachedPage(body, None, None, reader.bytes_read)
+        else:
+            page = self.page_cache.store(url, body, headers, reader.bytes_read)
+        
+        if extract_text:
+            logger.info(f"Текст извлечен, длина: {len(result)} символов")
+            self._set_page_text(url, page, result)
+        return page
+    
+    def fetch_site_text(self, url: str) -> str:
+        """
+        Скачивает сайт и извлекает из него текст. Если страница не изменилась (304),
+        используется ранее извлеченный текст без повторного разбора HTML
+        
+        Args:
+            url (str): URL сайта
+            
+        Returns:
+            str: Очищенный текст сайта
+        """
+        labels = self._metric_labels()
+        with ANALYZE_STAGE_SECONDS.time(stage="download", **labels):
+            page = self._download_page(url, extract_text=self.streaming_download)
+        if page.text is None:
+            with ANALYZE_STAGE_SECONDS.time(stage="extract", **labels):
+                text = self.extract_text_from_html(page.body)
+            self._set_page_text(url, page, text)
+        TEXT_CHARS.observe(len(page.text), **labels)
+        return page.text
+    
+    async def afetch_site_text(self, url: str, limits: Optional[StageLimits] = None) -> str:
+        """
+        Асинхронно скачивает сайт и извлекает из него текст. Если страница не изменилась (304),
+        используется ранее извлеченный текст без повторного разбора HTML
+        
+        Args:
+            url (str): URL сайта
+            limits (Optional[StageLimits]): Лимиты параллелизма стадий (для пакетного анализа)
+            
+        Returns:
+            str: Очищенный текст сайта
+        """
+        labels = self._metric_labels()
+        async with (limits.fetch_slot(url) if limits else nullcontext()):
+            # При потоковом скачивании сюда входит и извлечение текста (под лимитом разбора)
+            with ANALYZE_STAGE_SECONDS.time(stage="download", **labels):
+                page = await self._adownload_page(
+                    url,
+                    extract_text=self.streaming_download,
+                    parse=limits.parse if limits else None,
+                )
+        
+        if page.text is None:
+            async with (limits.parse if limits else nullcontext()):
+                with ANALYZE_STAGE_SECONDS.time(stage="extract", **labels):
+                    text = await self.aextract_text_from_html(page.body)
+            self._set_page_text(url, page, text)
+        TEXT_CHARS.observe(len(page.text), **labels)
+        return page.text
+    
+    def _set_page_text(self, url: str, page: CachedPage, text: str):
+        """
+        Запоминает извлеченный текст страницы
+        
+        Args:
+            url (str): URL страницы
+            page (CachedPage): Страница
+            text (str): Извлеченный текст
+        """
+        if self.page_cache is not None:
+            self.page_cache.set_text(url, page, text)
+        else:
+            page.text = text
+    
     def extract_text_from_html(self, html: str) -> str:
         """
         Извлекает текст из HTML, удаляя все теги
@@ -74,19 +499,9 @@ class SiteAnalyzer:
         try:
             logger.info("Извлечение текста из HTML")
             
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Удаляем скрипты и стили
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Получаем текст
-            text = soup.get_text()
-            
-            # Очищаем от лишних пробелов и переносов строк
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
+            # Для отбора в промпт достаточно EXTRACT_MAX_CHARS символов,
+            # поэтому потоковые движки останавливают разбор после бюджета
+            text = self.extractor.extract(html, EXTRACT_MAX_CHARS)
             
             logger.info(f"Текст извлечен, длина: {len(text)} символов")
             return text
@@ -95,12 +510,26 @@ class SiteAnalyzer:
             logger.error(f"Ошибка при извлечении текста из HTML: {str(e)}")
             raise Exception(f"Не удалось извлечь текст из HTML: {str(e)}")
     
-    def generate_questions(self, text: str) -> List[str]:
+    async def aextract_text_from_html(self, html: str) -> str:
+        """
+        Извлекает текст из HTML в пуле потоков, чтобы разбор HTML
+        не занимал event loop
+        
+        Args:
+            html (str): HTML-код
+            
+        Returns:
+            str: Очищенный текст
+        """
+        return await asyncio.to_thread(self.extract_text_from_html, html)
+    
+    def generate_questions(self, text: str, no_cache: bool = False) -> List[str]:
         """
         Генерирует список из 5 вопросов на основе текста сайта
         
         Args:
             text (str): Текст сайта
+            no_cache (bool): Не брать ответ LLM из кэша
             
         Returns:
             List[str]: Список из 5 вопросов
@@ -113,48 +542,220 @@ class SiteAnalyzer:
         try:
             logger.info("Генерация вопросов с помощью LLM")
             
-            system_prompt = """Ты пользователь сайта. Вот текст сайта: {site_text}
-
-В ответе в формате JSON выдай список из 5 вопросов, которые возникли после посещения сайта.
-
-Формат ответа:
-{{
-    "questions": [
-        "Вопрос 1",
-        "Вопрос 2", 
-        "Вопрос 3",
-        "Вопрос 4",
-        "Вопрос 5"
-    ]
-}}"""
-
-            user_prompt = f"Проанализируй текст сайта и сформулируй 5 вопросов, которые могут возникнуть у пользователя после его изучения."
+            labels = self._metric_labels()
+            with ANALYZE_STAGE_SECONDS.time(stage="prompt", **labels):
+                system_prompt, user_prompt = self._build_question_prompts(text)
+            
+            with ANALYZE_STAGE_SECONDS.time(stage="chat_json", **labels):
+                response = self.llm_client.chat_json(system_prompt, user_prompt, no_cache=no_cache,
+                                                     schema=QuestionsResponse, task=TASK_QUESTIONS)
+            
+            return self._extract_questions(response)
+                
+        except Exception as e:
+            logger.error(f"Ошибка при генерации вопросов: {str(e)}")
+            return self._generate_fallback_questions()
+    
+    async def agenerate_questions(self, text: str, no_cache: bool = False,
+                                  priority: int = PRIORITY_INTERACTIVE) -> List[str]:
+        """
+        Асинхронно генерирует список из 5 вопросов на основе текста сайта
+        
+        Args:
+            text (str): Текст сайта
+            no_cache (bool): Не брать ответ LLM из кэша
+            priority (int): Приоритет в очереди запросов к LLM
             
-            # Ограничиваем длину текста для промпта (чтобы не превысить лимиты токенов)
-            if len(text) > 8000:
-                text = text[:8000] + "..."
+        Returns:
+            List[str]: Список из 5 вопросов
             
-            formatted_system_prompt = system_prompt.format(site_text=text)
+        Raises:
+            OverloadedError: Если очередь запросов к LLM переполнена
+        """
+        # Если LLM недоступен, сразу возвращаем резервные вопросы
+        if not self.llm_available:
+            logger.info("LLM недоступен, используем резервные вопросы")
+            return self._generate_fallback_questions()
+        
+        try:
+            logger.info("Генерация вопросов с помощью LLM")
             
-            response = self.llm_client.chat_json(formatted_system_prompt, user_prompt)
+            labels = self._metric_labels()
+            with ANALYZE_STAGE_SECONDS.time(stage="prompt", **labels):
+                system_prompt, user_prompt = self._build_question_prompts(text)
             
-            # Извлекаем вопросы из ответа
-            if isinstance(response, dict) and "questions" in response:
-                questions = response["questions"]
-                if isinstance(questions, list) and len(questions) >= 5:
-                    logger.info("Вопросы успешно сгенерированы")
-                    return questions[:5]  # Берем первые 5 вопросов
-                else:
-                    logger.warning("LLM вернул некорректный формат вопросов")
-                    return self._generate_fallback_questions()
-            else:
-                logger.warning("LLM вернул некорректный ответ")
-                return self._generate_fallback_questions()
-                
+            with ANALYZE_STAGE_SECONDS.time(stage="chat_json", **labels):
+                response = await self.llm_client.achat_json(system_prompt, user_prompt, no_cache=no_cache,
+                                                             priority=priority, schema=QuestionsResponse,
+                                                             task=TASK_QUESTIONS)
+            
+            return self._extract_questions(response)
+        
+        except OverloadedError:
+            # Перегрузку не маскируем запасными вопросами - клиент должен повторить запрос позже
+            raise
         except Exception as e:
             logger.error(f"Ошибка при генерации вопросов: {str(e)}")
             return self._generate_fallback_questions()
     
+    async def agenerate_questions_batched(self, text: str, no_cache: bool = False,
+                                          priority: int = PRIORITY_BATCH) -> List[str]:
+        """
+        Генерирует вопросы в пакетном режиме: текст ждет до QUESTIONS_BATCH_WINDOW секунд
+        тексты других страниц и уходит в LLM вместе с ними одним запросом (не больше
+        QUESTIONS_BATCH_MAX_PAGES страниц и QUESTIONS_BATCH_TOKEN_BUDGET токенов текста).
+        Страницы, для которых пакетный ответ не прошел проверку, запрашиваются по одной
+        
+        Args:
+            text (str): Текст сайта
+            no_cache (bool): Не брать ответ LLM из кэша
+            priority (int): Приоритет в очереди запросов к LLM
+            
+        Returns:
+            List[str]: Список из 5 вопросов
+            
+        Raises:
+            OverloadedError: Если очередь запросов к LLM переполнена
+        """
+        if self.question_batcher is None or not self.llm_available:
+            return await self.agenerate_questions(text, no_cache=no_cache, priority=priority)
+        
+        with ANALYZE_STAGE_SECONDS.time(stage="prompt", **self._metric_labels()):
+            selected = self.content_selector.select(text)
+        cost = self.content_selector.count_tokens(selected)
+        return await self.question_batcher.submit((no_cache, priority), selected, cost)
+    
+    async def _agenerate_packed_questions(self, key: Tuple[bool, int], texts: List[str]) -> List[List[str]]:
+        """
+        Генерирует вопросы для пакета страниц одним запросом к LLM
+        
+        Args:
+            key (Tuple[bool, int]): Параметры пакета: no_cache и приоритет
+            texts (List[str]): Отобранные тексты страниц
+            
+        Returns:
+            List[List[str]]: Вопросы для каждой страницы в порядке texts
+            
+        Raises:
+            OverloadedError: Если очередь запросов к LLM переполнена
+        """
+        no_cache, priority = key
+        if len(texts) == 1:
+            return [await self.agenerate_questions(texts[0], no_cache=no_cache, priority=priority)]
+        
+        ids = [str(index) for index in range(1, len(texts) + 1)]
+        pages = "\n\n".join(f'<page id="{page_id}">\n{text}\n</page>' for page_id, text in zip(ids, texts))
+        system_prompt, user_prompt = PACKED_QUESTIONS_PROMPT.render(pages=pages)
+        
+        packed: Dict[str, List[str]] = {}
+        try:
+            logger.info(f"Пакетная генерация вопросов для {len(texts)} страниц")
+            with ANALYZE_STAGE_SECONDS.time(stage="chat_json", **self._metric_labels()):
+                response = await self.llm_client.achat_json(system_prompt, user_prompt, no_cache=no_cache,
+                                                             priority=priority, schema=PackedQuestionsResponse,
+                                                             task=TASK_QUESTIONS)
+            for page in (response.get("pages") or []) if isinstance(response, dict) else []:
+                if isinstance(page, dict) and page.get("id") in ids:
+                    questions = page.get("questions")
+                    if isinstance(questions, list) and len(questions) >= QUESTIONS_COUNT:
+                        packed[page["id"]] = questions[:QUESTIONS_COUNT]
+        except OverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка при пакетной генерации вопросов: {str(e)}")
+        
+        missing = [index for index, page_id in enumerate(ids) if page_id not in packed]
+        if missing:
+            logger.warning(f"Пакетный ответ без вопросов для {len(missing)} из {len(texts)} страниц, "
+                           f"запрашиваем их по одной")
+        fallback = await asyncio.gather(*(
+            self.agenerate_questions(texts[index], no_cache=no_cache, priority=priority) for index in missing
+        ))
+        results = [packed.get(page_id) for page_id in ids]
+        for index, questions in zip(missing, fallback):
+            results[index] = questions
+        QUESTIONS.inc(len(texts) - len(missing), source="llm", **self._metric_labels())
+        return results
+    
+    async def astream_questions(self, text: str, no_cache: bool = False) -> AsyncIterator[str]:
+        """
+        Генерирует вопросы потоково: каждый вопрос отдается, как только LLM его закончил.
+        Если LLM недоступен или ответил меньше чем 5 вопросами, недостающие берутся из резервных
+        
+        Args:
+            text (str): Текст сайта
+            no_cache (bool): Не брать ответ LLM из кэша
+            
+        Yields:
+            str: Очередной вопрос
+        """
+        questions = []
+        if self.llm_available:
+            labels = self._metric_labels()
+            try:
+                with ANALYZE_STAGE_SECONDS.time(stage="prompt", **labels):
+                    system_prompt, user_prompt = self._build_question_prompts(text)
+                
+                with ANALYZE_STAGE_SECONDS.time(stage="chat_json", **labels):
+                    async for question in self.llm_client.astream_json_items(
+                        system_prompt, user_prompt, "questions", schema=QuestionsResponse, no_cache=no_cache,
+                        task=TASK_QUESTIONS
+                    ):
+                        # Поток дочитывается до конца, чтобы полный ответ попал в кэш
+                        if isinstance(question, str) and len(questions) < QUESTIONS_COUNT:
+                            questions.append(question)
+                            yield question
+            except Exception as e:
+                logger.error(f"Ошибка при потоковой генерации вопросов: {str(e)}")
+        else:
+            logger.info("LLM недоступен, используем резервные вопросы")
+        
+        if len(questions) == QUESTIONS_COUNT:
+            logger.info("Вопросы успешно сгенерированы")
+            QUESTIONS.inc(source="llm", **self._metric_labels())
+            return
+        
+        for question in self._generate_fallback_questions()[len(questions):]:
+            yield question
+    
+    def _build_question_prompts(self, text: str) -> Tuple[str, str]:
+        """
+        Формирует системный и пользовательский промпты для генерации вопросов по QUESTIONS_PROMPT
+        
+        Args:
+            text (str): Текст сайта
+            
+        Returns:
+            Tuple[str, str]: Системный и пользовательский промпты
+        """
+        # Убираем служебные и повторяющиеся блоки и укладываемся в бюджет токенов
+        text = self.content_selector.select(text)
+        
+        return QUESTIONS_PROMPT.render(site_text=text)
+    
+    def _extract_questions(self, response: Any) -> List[str]:
+        """
+        Извлекает вопросы из ответа LLM
+        
+        Args:
+            response (Any): Ответ LLM, распарсенный из JSON
+            
+        Returns:
+            List[str]: Список из 5 вопросов
+        """
+        if isinstance(response, dict) and "questions" in response:
+            questions = response["questions"]
+            if isinstance(questions, list) and len(questions) >= QUESTIONS_COUNT:
+                logger.info("Вопросы успешно сгенерированы")
+                QUESTIONS.inc(source="llm", **self._metric_labels())
+                return questions[:QUESTIONS_COUNT]  # Берем первые 5 вопросов
+            else:
+                logger.warning("LLM вернул некорректный формат вопросов")
+                return self._generate_fallback_questions()
+        else:
+            logger.warning("LLM вернул некорректный ответ")
+            return self._generate_fallback_questions()
+    
     def _generate_fallback_questions(self) -> List[str]:
         """
         Генерирует резервные вопросы в случае ошибки LLM
@@ -162,20 +763,16 @@ class SiteAnalyzer:
         Returns:
             List[str]: Список из 5 стандартных вопросов
         """
-        return [
-            "Какова основная цель этого сайта?",
-            "Какие услуги или продукты предлагаются?",
-            "Как связаться с компанией?",
-            "Какие есть способы оплаты?",
-            "Есть ли скидки или специальные предложения?"
-        ]
+        QUESTIONS.inc(source="fallback", **self._metric_labels())
+        return list(FALLBACK_QUESTIONS)
     
-    def analyze_site(self, url: str) -> Dict[str, Any]:
+    def analyze_site(self, url: str, no_cache: bool = False) -> Dict[str, Any]:
         """
         Полный анализ сайта: скачивание, извлечение текста и генерация вопросов
         
         Args:
             url (str): URL сайта для анализа
+            no_cache (bool): Не брать ответ LLM из кэша
             
         Returns:
             Dict[str, Any]: Результат анализа с URL и списком вопросов
@@ -183,29 +780,193 @@ class SiteAnalyzer:
         Raises:
             Exception: Если анализ не удался
         """
+        labels = self._metric_labels()
         try:
             logger.info(f"Начало анализа сайта: {url}")
+            started = time.perf_counter()
             
-            # Скачиваем HTML
-            html = self.download_html(url)
-            
-            # Извлекаем текст
-            text = self.extract_text_from_html(html)
+            # Скачиваем страницу по исходному URL (без фрагмента): канонический URL с убранными
+            # метками - только ключ индекса похожих страниц, сайт может различать и такие параметры
+            canonical_url = canonicalize_url(url)
+            text = self.fetch_site_text(urldefrag(url.strip())[0])
             
             if not text.strip():
                 raise Exception("Не удалось извлечь текст из сайта")
             
-            # Генерируем вопросы
-            questions = self.generate_questions(text)
+            # Генерируем вопросы, если почти такая же страница еще не анализировалась
+            fingerprint, duplicate = self._find_near_duplicate(text, no_cache)
+            if duplicate is not None:
+                questions = list(duplicate.questions)
+            else:
+                questions = self.generate_questions(text, no_cache=no_cache)
+                self._remember_questions(canonical_url, fingerprint, questions)
             
             result = {
                 "url": url,
                 "questions": questions
             }
+            if duplicate is not None:
+                result["duplicate_of"] = duplicate.url
             
+            ANALYZE_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total", **labels)
             logger.info(f"Анализ сайта {url} завершен успешно")
             return result
             
         except Exception as e:
+            ANALYZE_ERRORS.inc(**labels)
             logger.error(f"Ошибка при анализе сайта {url}: {str(e)}")
             raise Exception(f"Ошибка при анализе сайта: {str(e)}")
+    
+    async def aanalyze_site(self, url: str, no_cache: bool = False,
+                            limits: Optional[StageLimits] = None,
+                            priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+        """
+        Асинхронный полный анализ сайта: скачивание, извлечение текста и генерация вопросов.
+        Сетевые вызовы не блокируют event loop, разбор HTML выполняется в пуле потоков.
+        Одновременные запросы анализа одного и того же URL (с точностью до меток рекламы
+        и порядка параметров) выполняются один раз
+        
+        Args:
+            url (str): URL сайта для анализа
+            no_cache (bool): Не брать ответ LLM из кэша
+            limits (Optional[StageLimits]): Лимиты параллелизма стадий (для пакетного анализа)
+            priority (int): Приоритет в очереди запросов к LLM
+            
+        Returns:
+            Dict[str, Any]: Результат анализа с URL и списком вопросов
+            
+        Raises:
+            OverloadedError: Если очередь запросов к LLM переполнена
+            Exception: Если анализ не удался
+        """
+        # Интерактивный запрос не присоединяется к анализу пакетного приоритета: тот ждет
+        # в очереди и сборщике пакетов. URL в ответе - тот, что передал сам вызывающий
+        result = await self.singleflight.do(
+            (canonicalize_url(url), no_cache, priority >= PRIORITY_BATCH),
+            lambda: self._aanalyze_site(url, no_cache, limits, priority)
+        )
+        return {**result, "url": url}
+    
+    async def _aanalyze_site(self, url: str, no_cache: bool, limits: Optional[StageLimits],
+                             priority: int) -> Dict[str, Any]:
+        """
+        Выполняет асинхронный анализ сайта (см. aanalyze_site)
+        
+        Args:
+            url (str): URL сайта для анализа
+            no_cache (bool): Не брать ответ LLM из кэша
+            limits (Optional[StageLimits]): Лимиты параллелизма стадий
+            priority (int): Приоритет в очереди запросов к LLM
+            
+        Returns:
+            Dict[str, Any]: Результат анализа с URL и списком вопросов
+            
+        Raises:
+            Exception: Если анализ не удался
+        """
+        labels = self._metric_labels()
+        try:
+            logger.info(f"Начало анализа сайта: {url}")
+            started = time.perf_counter()
+            
+            # Скачиваем страницу по исходному URL (без фрагмента), см. analyze_site
+            canonical_url = canonicalize_url(url)
+            text = await self.afetch_site_text(urldefrag(url.strip())[0], limits=limits)
+            
+            if not text.strip():
+                raise Exception("Не удалось извлечь текст из сайта")
+            
+            # Генерируем вопросы, если почти такая же страница еще не анализировалась
+            duplicate, fingerprint = None, None
+            if self.near_duplicates is not None:
+                async with (limits.parse if limits else nullcontext()):
+                    fingerprint, duplicate = await asyncio.to_thread(self._find_near_duplicate, text, no_cache)
+            if duplicate is not None:
+                questions = list(duplicate.questions)
+            else:
+                async with (limits.llm if limits else nullcontext()):
+                    if priority >= PRIORITY_BATCH:
+                        # Массовые анализы (пакеты и фоновые задачи) упаковываются по нескольку страниц в запрос
+                        questions = await self.agenerate_questions_batched(text, no_cache=no_cache,
+                                                                           priority=priority)
+                    else:
+                        questions = await self.agenerate_questions(text, no_cache=no_cache, priority=priority)
+                self._remember_questions(canonical_url, fingerprint, questions)
+            
+            result = {
+                "url": url,
+                "questions": questions
+            }
+            if duplicate is not None:
+                result["duplicate_of"] = duplicate.url
+            
+            ANALYZE_STAGE_SECONDS.observe(time.perf_counter() - started, stage="total", **labels)
+            logger.info(f"Анализ сайта {url} завершен успешно")
+            return result
+        
+        except OverloadedError:
+            ANALYZE_ERRORS.inc(**labels)
+            raise
+        except Exception as e:
+            ANALYZE_ERRORS.inc(**labels)
+            logger.error(f"Ошибка при анализе сайта {url}: {str(e)}")
+            raise Exception(f"Ошибка при анализе сайта: {str(e)}")
+    
+    def _find_near_duplicate(self, text: str, no_cache: bool) -> Tuple[Optional[int], Optional[NearDuplicateEntry]]:
+        """
+        Вычисляет отпечаток текста и ищет почти такую же проанализированную страницу
+        
+        Args:
+            text (str): Текст страницы
+            no_cache (bool): Не использовать вопросы других страниц (отпечаток все равно вычисляется)
+            
+        Returns:
+            Tuple[Optional[int], Optional[NearDuplicateEntry]]: Отпечаток (None для короткого текста
+                или без индекса) и найденная страница
+        """
+        if self.near_duplicates is None:
+            return None, None
+        
+        fingerprint = simhash(text)
+        if fingerprint is None or no_cache:
+            return fingerprint, None
+        
+        match = self.near_duplicates.lookup(fingerprint)
+        if match is None:
+            return fingerprint, None
+        
+        duplicate, distance = match
+        logger.info(f"Страница почти совпадает с {duplicate.url} (отличие {distance} бит), используем ее вопросы")
+        self.near_duplicates.count_avoided()
+        QUESTIONS.inc(source="near_duplicate", **self._metric_labels())
+        return fingerprint, duplicate
+    
+    def _remember_questions(self, url: str, fingerprint: Optional[int], questions: List[str]):
+        """
+        Добавляет вопросы, сгенерированные LLM, в индекс почти одинаковых страниц
+        
+        Args:
+            url (str): Канонический URL страницы
+            fingerprint (Optional[int]): Отпечаток текста страницы
+            questions (List[str]): Вопросы
+        """
+        # Резервные вопросы не сохраняем, иначе похожие страницы не дойдут до LLM
+        if self.near_duplicates is None or fingerprint is None or tuple(questions) == FALLBACK_QUESTIONS:
+            return
+        self.near_duplicates.add(url, fingerprint, questions)
+    
+    def _metric_labels(self) -> Dict[str, str]:
+        """
+        Метки метрик анализатора: эндпоинт текущего запроса и модель LLM
+        
+        Returns:
+            Dict[str, str]: Значения меток endpoint и model
+        """
+        return {"endpoint": endpoint_label(), "model": self.content_selector.model}
+    
+    async def aclose(self):
+        """
+        Закрывает HTTP клиенты скачивания (при следующем запросе они создаются заново).
+        Общий пул соединений LLM закрывается через aclose_shared_async_http_client
+        """
+        await self.fetcher.aclose()
@@ -0,0 +1,129 @@
+"""
+Пакетный анализ сайтов с ограничением параллелизма по стадиям
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from app.services.rate_limiter import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class StageLimits:
+    """
+    Лимиты параллелизма для стадий конвейера анализа:
+    скачивание, разбор HTML, запрос к LLM и вежливость по отношению к одному хосту
+    """
+    
+    def __init__(self, fetch: int = 20, parse: int = 4, llm: int = 10, per_host: int = 2):
+        """
+        Инициализация лимитов
+        
+        Args:
+            fetch (int): Максимум одновременных скачиваний
+            parse (int): Максимум одновременных разборов HTML
+            llm (int): Максимум одновременных запросов к LLM
+            per_host (int): Максимум одновременных скачиваний с одного хоста
+        """
+        self.fetch = asyncio.Semaphore(fetch)
+        self.parse = asyncio.Semaphore(parse)
+        self.llm = asyncio.Semaphore(llm)
+        self.per_host = per_host
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+    
+    @classmethod
+    def from_env(cls) -> "StageLimits":
+        """
+        Создает лимиты из переменных окружения:
+        BATCH_FETCH_CONCURRENCY, BATCH_PARSE_CONCURRENCY, BATCH_LLM_CONCURRENCY и BATCH_PER_HOST_CONCURRENCY
+        
+        Returns:
+            StageLimits: Лимиты стадий
+        """
+        load_dotenv()
+        return cls(
+            fetch=int(os.environ.get("BATCH_FETCH_CONCURRENCY", "20")),
+            parse=int(os.environ.get("BATCH_PARSE_CONCURRENCY", "4")),
+            llm=int(os.environ.get("BATCH_LLM_CONCURRENCY", "10")),
+            per_host=int(os.environ.get("BATCH_PER_HOST_CONCURRENCY", "2"))
+        )
+    
+    def host(self, url: str) -> asyncio.Semaphore:
+        """
+        Возвращает семафор хоста, которому принадлежит URL
+        
+        Args:
+            url (str): URL страницы
+        
+        Returns:
+            asyncio.Semaphore: Семафор хоста
+        """
+        host = urlparse(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+    
+    @asynccontextmanager
+    async def fetch_slot(self, url: str):
+        """
+        Занимает слот скачивания с учетом лимита на хост
+        
+        Args:
+            url (str): URL страницы
+        """
+        async with self.host(url), self.fetch:
+            yield
+
+
+async def analyze_batch(analyzer: Any, urls: List[str], concurrency: int,
+                        limits: Optional[StageLimits] = None, no_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Анализирует список сайтов и отдает результаты по мере готовности, а не в порядке списка
+
+    Args:
+        analyzer (Any): Экземпляр SiteAnalyzer
+        urls (List[str]): Список URL для анализа
+        concurrency (int): Максимум одновременно анализируемых URL
+        limits (Optional[StageLimits]): Лимиты стадий (по умолчанию из окружения)
+        no_cache (bool): Не брать ответы LLM из кэша
+
+    Yields:
+        Dict[str, Any]: Результат анализа с индексом URL в запросе или описание ошибки
+    """
+    limits = limits or StageLimits.from_env()
+    pending: asyncio.Queue = asyncio.Queue()
+    results: asyncio.Queue = asyncio.Queue()
+
+    for index, url in enumerate(urls):
+        pending.put_nowait((index, url))
+
+    async def worker():
+        while True:
+            try:
+                index, url = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            try:
+                # Пакетные запросы уступают очередь к LLM интерактивным
+                result = await analyzer.aanalyze_site(url, no_cache=no_cache, limits=limits, priority=PRIORITY_BATCH)
+                await results.put({"index": index, **result})
+            except Exception as e:
+                await results.put({"index": index, "url": url, "error": str(e)})
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(urls))))]
+    try:
+        for _ in range(len(urls)):
+            yield await results.get()
+    finally:
+        # Клиент мог отключиться: останавливаем оставшуюся работу
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
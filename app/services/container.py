@@ -0,0 +1,104 @@
+"""
+Контейнер общих сервисов приложения: один LLMClient и один SiteAnalyzer на процесс
+"""
+
+import logging
+import threading
+from typing import Optional
+
+from app.services.analyzer import SiteAnalyzer
+from app.services.crawler import SiteCrawler
+from app.services.jobs import aclose_job_queue
+from app.services.openai_module import LLMClient, aclose_shared_async_http_client
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Хранит общие клиенты сервисов. Клиенты создаются лениво при первом обращении,
+    поэтому импорт приложения не требует OPENAI_API_KEY и не открывает соединений
+    """
+
+    def __init__(self):
+        self._llm_client: Optional[LLMClient] = None
+        self._site_analyzer: Optional[SiteAnalyzer] = None
+        self._site_crawler: Optional[SiteCrawler] = None
+        self._lock = threading.Lock()
+
+    @property
+    def llm_client(self) -> LLMClient:
+        """
+        Общий клиент LLM
+
+        Raises:
+            ValueError: Если клиент не настроен (например, нет OPENAI_API_KEY)
+        """
+        if self._llm_client is None:
+            with self._lock:
+                if self._llm_client is None:
+                    self._llm_client = LLMClient()
+                    logger.info("LLM клиент успешно инициализирован")
+        return self._llm_client
+
+    @property
+    def site_analyzer(self) -> SiteAnalyzer:
+        """
+        Общий анализатор сайтов, использующий общий клиент LLM.
+        Без настроенного LLM анализатор работает с запасными вопросами
+        """
+        if self._site_analyzer is None:
+            try:
+                llm_client = self.llm_client
+            except Exception:
+                # Анализатор сам сообщит, что LLM недоступен
+                llm_client = None
+
+            with self._lock:
+                if self._site_analyzer is None:
+                    self._site_analyzer = SiteAnalyzer(llm_client)
+        return self._site_analyzer
+
+    @property
+    def site_crawler(self) -> SiteCrawler:
+        """
+        Общий обходчик сайтов поверх общего анализатора, хранит состояния прошлых обходов
+        """
+        if self._site_crawler is None:
+            site_analyzer = self.site_analyzer
+            with self._lock:
+                if self._site_crawler is None:
+                    self._site_crawler = SiteCrawler.from_env(site_analyzer)
+        return self._site_crawler
+
+    async def aclose(self, drain_timeout: float = 0.0):
+        """
+        Закрывает очередь задач, созданные клиенты и общий пул соединений к LLM
+
+        Args:
+            drain_timeout (float): Сколько секунд ждать выполняемые фоновые задачи
+        """
+        await aclose_job_queue(drain_timeout)
+        if self._site_analyzer is not None:
+            await self._site_analyzer.aclose()
+            self._site_analyzer = None
+        self._site_crawler = None
+        self._llm_client = None
+        await aclose_shared_async_http_client()
+
+
+_services: Optional[ServiceContainer] = None
+
+
+def get_services() -> ServiceContainer:
+    """
+    Возвращает контейнер общих сервисов процесса
+
+    Returns:
+        ServiceContainer: Контейнер сервисов
+    """
+    global _services
+
+    if _services is None:
+        _services = ServiceContainer()
+    return _services
@@ -0,0 +1,245 @@
+"""
+Отбор содержимого страницы для промпта с учетом бюджета токенов
+"""
+
+import heapq
+import logging
+import math
+import re
+from typing import List, Optional, Set
+
+try:
+    import tiktoken
+except ImportError:  # без tiktoken токены оцениваются приближенно
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+
+# Короткие служебные блоки. Совпадать должна форма строки, а не отдельное слово:
+# рецепт печенья (cookie) или статья о политике конфиденциальности остаются в тексте
+BOILERPLATE_TEXT_RES = (
+    # Строка копирайта: "© 2024 ...", "(c) 2024 ...", "Copyright © ...", "Copyright 2024 ..."
+    re.compile(r"^(?:©|\(c\)\s*\d{4}|copyright\s*(?:©|\(c\)\s*)?\d{4}|copyright\s*©)", re.IGNORECASE),
+    re.compile(r"(?:all rights reserved|все права защищены)\.?$", re.IGNORECASE),
+    # Баннер cookie: упоминание cookie вместе с согласием или кнопкой принятия
+    re.compile(
+        r"^(?=.*\b(?:cookies?|куки|cookie-файл\w*)\b)"
+        r"(?=.*\b(?:accept|agree|consent|согла\w*|принять|принимаю|продолжая|using this (?:site|website))\b)",
+        re.IGNORECASE
+    ),
+    # Строка ссылок подвала из одних названий документов
+    re.compile(
+        r"^(?:(?:политика конфиденциальности|privacy policy|terms of use|terms of service|"
+        r"cookie policy|пользовательское соглашение)\s*[|·•/,]?\s*)+$",
+        re.IGNORECASE
+    ),
+)
+
+# Блоки длиннее этого не считаются служебными, даже если содержат такие фразы
+BOILERPLATE_MAX_CHARS = 300
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _load_encoding(model: str):
+    """
+    Загружает токенизатор для модели
+
+    Args:
+        model (str): Имя модели
+
+    Returns:
+        Токенизатор tiktoken или None, если он недоступен
+    """
+    if tiktoken is None:
+        logger.warning("tiktoken не установлен, количество токенов оценивается приближенно")
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Например, нет доступа к файлам словаря
+        logger.warning(f"Не удалось загрузить токенизатор для {model}, токены оцениваются приближенно: {str(e)}")
+        return None
+
+
+class ContentSelector:
+    """
+    Готовит текст сайта для промпта: убирает служебные и повторяющиеся блоки
+    и выбирает самые информативные блоки в пределах бюджета токенов
+    """
+
+    def __init__(self, model: str, token_budget: int = 2000):
+        """
+        Инициализация отбора содержимого
+
+        Args:
+            model (str): Модель LLM, для которой считаются токены
+            token_budget (int): Максимальное количество токенов текста сайта в промпте
+        """
+        self.model = model
+        self.token_budget = token_budget
+        self._encoding = None
+        self._encoding_loaded = False
+
+    @property
+    def encoding(self):
+        """
+        Токенизатор модели (None, если недоступен). Загружается при первом подсчете токенов,
+        так как загрузка словаря может занимать заметное время при старте
+        """
+        if not self._encoding_loaded:
+            self._encoding = _load_encoding(self.model)
+            self._encoding_loaded = True
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Считает токены текста
+
+        Args:
+            text (str): Текст
+
+        Returns:
+            int: Количество токенов (приближенное, если токенизатор недоступен)
+        """
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        # Для смешанного русского и английского текста около 3 символов на токен
+        return len(text) // 3 + 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Обрезает текст до заданного количества токенов
+
+        Args:
+            text (str): Текст
+            max_tokens (int): Максимальное количество токенов
+
+        Returns:
+            str: Обрезанный текст
+        """
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return self.encoding.decode(tokens[:max_tokens]) + "..."
+
+        max_chars = max_tokens * 3
+        return text if len(text) <= max_chars else text[:max_chars] + "..."
+
+    def select(self, text: str, token_budget: Optional[int] = None) -> str:
+        """
+        Отбирает блоки текста (строки) для промпта
+
+        Args:
+            text (str): Текст сайта, блоки разделены переводами строк
+            token_budget (Optional[int]): Бюджет токенов (по умолчанию из конструктора)
+
+        Returns:
+            str: Отобранный текст в исходном порядке блоков
+        """
+        budget = token_budget or self.token_budget
+        blocks = self._clean_blocks(text)
+        tokens = [self.count_tokens(block) for block in blocks]
+        total = sum(tokens)
+
+        if total <= budget:
+            return "\n".join(blocks)
+
+        # Жадный отбор с ленивым пересчетом: ценность блока - новые (еще не покрытые)
+        # содержательные слова на токен, поэтому однотипные блоки не вытесняют остальное
+        words = [self._content_words(block) for block in blocks]
+        covered: Set[str] = set()
+        heap = [(-self._gain(words[i], covered, tokens[i], i), i) for i in range(len(blocks))]
+        heapq.heapify(heap)
+        
+        chosen = {}
+        remaining = budget
+        while heap and remaining >= 20:
+            _, index = heapq.heappop(heap)
+            gain = self._gain(words[index], covered, tokens[index], index)
+            if gain <= 0:
+                continue
+            if heap and gain < -heap[0][0]:
+                # Оценка устарела и блок уже не лучший - возвращаем с новой оценкой
+                heapq.heappush(heap, (-gain, index))
+                continue
+
+            if tokens[index] <= remaining:
+                chosen[index] = blocks[index]
+                remaining -= tokens[index]
+            elif remaining >= 50:
+                chosen[index] = self.truncate(blocks[index], remaining)
+                remaining = 0
+            else:
+                continue
+            covered |= words[index]
+
+        logger.info(f"Отобрано {budget - remaining} токенов текста из {total}")
+        return "\n".join(chosen[i] for i in sorted(chosen))
+
+    @staticmethod
+    def _clean_blocks(text: str) -> List[str]:
+        """
+        Разбивает текст на блоки, убирая служебные блоки и повторы
+
+        Args:
+            text (str): Текст сайта
+
+        Returns:
+            List[str]: Блоки текста
+        """
+        blocks = []
+        seen = set()
+        for line in text.split("\n"):
+            block = line.strip()
+            if not block:
+                continue
+            if len(block) <= BOILERPLATE_MAX_CHARS and any(regex.search(block) for regex in BOILERPLATE_TEXT_RES):
+                continue
+
+            key = " ".join(block.lower().split())
+            if key in seen:
+                continue
+            seen.add(key)
+            blocks.append(block)
+        return blocks
+
+    @staticmethod
+    def _content_words(block: str) -> Set[str]:
+        """
+        Возвращает множество содержательных слов блока (длиннее трех символов)
+
+        Args:
+            block (str): Блок текста
+
+        Returns:
+            Set[str]: Слова блока в нижнем регистре
+        """
+        return {word for word in _WORD_RE.findall(block.lower()) if len(word) > 3}
+
+    @staticmethod
+    def _gain(words: Set[str], covered: Set[str], tokens: int, index: int) -> float:
+        """
+        Оценивает ценность блока: количество еще не покрытых слов на корень из числа токенов
+        с приоритетом начала страницы (заголовки, вводный текст)
+
+        Args:
+            words (Set[str]): Содержательные слова блока
+            covered (Set[str]): Слова уже отобранных блоков
+            tokens (int): Количество токенов блока
+            index (int): Позиция блока на странице
+
+        Returns:
+            float: Ценность блока (0 - блок не нужен)
+        """
+        # Одиночные слова дальше заголовка - обычно остатки меню и кнопок
+        if len(words) < 2 and index > 2:
+            return 0.0
+        novel = len(words - covered)
+        return novel / math.sqrt(max(tokens, 1)) * (1.0 + 1.0 / (1 + index))
@@ -0,0 +1,743 @@
+"""
+Обход сайта целиком: поиск страниц через sitemap.xml и ссылки, инкрементальный повторный обход
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+from xml.etree import ElementTree
+
+import httpx
+from dotenv import load_dotenv
+
+from app.services.batch import StageLimits
+from app.services.html_stream import HtmlStreamReader
+from app.services.metrics import register_collector, stats_lines
+from app.services.near_duplicates import canonicalize_url
+from app.services.rate_limiter import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+# Расширения ссылок, которые заведомо не являются HTML-страницами
+SKIP_EXTENSIONS = frozenset({
+    ".7z", ".avi", ".bmp", ".css", ".csv", ".doc", ".docx", ".exe", ".gif", ".gz", ".ico", ".jpeg", ".jpg",
+    ".js", ".json", ".mp3", ".mp4", ".pdf", ".png", ".ppt", ".pptx", ".rar", ".rss", ".svg", ".tar", ".txt",
+    ".webm", ".webp", ".woff", ".woff2", ".xls", ".xlsx", ".xml", ".zip",
+})
+
+# Максимальный размер файла sitemap в байтах
+SITEMAP_MAX_BYTES = 10 * 1024 * 1024
+
+# Сколько вложенных sitemap читается из индекса sitemap
+SITEMAP_MAX_FILES = 5
+
+# Состояния страниц в результате обхода
+PAGE_NEW = "new"                    # страницы не было в прошлом обходе
+PAGE_CHANGED = "changed"            # содержимое изменилось
+PAGE_NOT_MODIFIED = "not_modified"  # сервер ответил 304 на условный запрос
+PAGE_UNCHANGED = "unchanged"        # скачана заново, но хэш содержимого не изменился
+PAGE_FRESH = "fresh"                # по lastmod из sitemap не менялась, запрос не отправлялся
+PAGE_FAILED = "failed"              # не удалось скачать (используется текст прошлого обхода, если он есть)
+
+PAGE_STATUSES = (PAGE_NEW, PAGE_CHANGED, PAGE_NOT_MODIFIED, PAGE_UNCHANGED, PAGE_FRESH, PAGE_FAILED)
+
+# Счетчики обходов и страниц по состояниям для /metrics
+_crawl_stats: Dict[str, int] = {"crawls": 0, "failed": 0, **{status: 0 for status in PAGE_STATUSES}}
+
+
+class LinkCollector(HTMLParser):
+    """
+    Собирает адреса ссылок <a href> страницы с учетом <base href>
+    """
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]):
+        if tag == "base":
+            href = dict(attrs).get("href")
+            if href:
+                self.base_url = urljoin(self.base_url, href.strip())
+        elif tag == "a":
+            attributes = dict(attrs)
+            href = attributes.get("href")
+            if href and "nofollow" not in (attributes.get("rel") or "").lower():
+                self.links.append(urljoin(self.base_url, href.strip()))
+
+
+def extract_links(html: str, base_url: str) -> List[str]:
+    """
+    Извлекает ссылки страницы
+
+    Args:
+        html (str): HTML-код страницы
+        base_url (str): URL страницы для разрешения относительных ссылок
+
+    Returns:
+        List[str]: Абсолютные адреса ссылок в порядке появления
+    """
+    collector = LinkCollector(base_url)
+    try:
+        collector.feed(html)
+        collector.close()
+    except Exception as e:
+        # Ссылки, найденные до ошибки разбора, все равно полезны
+        logger.warning(f"Ошибка при разборе ссылок {base_url}: {str(e)}")
+    return collector.links
+
+
+def normalize_url(url: str) -> Optional[str]:
+    """
+    Приводит URL страницы к виду, по которому страницы сравниваются при обходе
+    (канонический URL без меток рекламы, см. canonicalize_url)
+
+    Args:
+        url (str): URL
+
+    Returns:
+        Optional[str]: Нормализованный URL или None, если это не http(s) страница
+    """
+    url = canonicalize_url(url)
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    if os.path.splitext(parts.path)[1].lower() in SKIP_EXTENSIONS:
+        return None
+    return url
+
+
+def site_key(url: str) -> str:
+    """
+    Возвращает ключ сайта: хост без www. Страницы с тем же ключом считаются страницами сайта
+
+    Args:
+        url (str): URL страницы
+
+    Returns:
+        str: Хост в нижнем регистре без префикса www.
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[float]:
+    """
+    Разбирает дату lastmod из sitemap (W3C Datetime)
+
+    Args:
+        value (Optional[str]): Значение lastmod
+
+    Returns:
+        Optional[float]: Время изменения (unix time) или None, если дата не разобрана.
+            Для даты без времени берется конец дня, чтобы не пропустить изменения этого дня
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    timestamp = parsed.timestamp()
+    if len(value) == 10:
+        timestamp += 24 * 3600
+    return timestamp
+
+
+def parse_sitemap(xml: bytes) -> Tuple[List[Tuple[str, Optional[str]]], List[str]]:
+    """
+    Разбирает sitemap или индекс sitemap
+
+    Args:
+        xml (bytes): Содержимое файла sitemap
+
+    Returns:
+        Tuple[List[Tuple[str, Optional[str]]], List[str]]: Страницы со значением lastmod
+            и адреса вложенных sitemap (для индекса)
+
+    Raises:
+        Exception: Если файл не является корректным XML
+    """
+    try:
+        root = ElementTree.fromstring(xml)
+    except ElementTree.ParseError as e:
+        raise Exception(f"Некорректный sitemap: {str(e)}")
+
+    pages, sitemaps = [], []
+    for entry in root:
+        kind = entry.tag.rsplit("}", 1)[-1]
+        fields = {child.tag.rsplit("}", 1)[-1]: (child.text or "").strip() for child in entry}
+        if not fields.get("loc"):
+            continue
+        if kind == "url":
+            pages.append((fields["loc"], fields.get("lastmod") or None))
+        elif kind == "sitemap":
+            sitemaps.append(fields["loc"])
+    return pages, sitemaps
+
+
+class CrawledPage:
+    """
+    Страница из прошлого обхода: валидаторы, хэш содержимого, текст и ссылки
+    """
+
+    __slots__ = ("url", "etag", "last_modified", "content_hash", "text", "links", "fetched_at")
+
+    def __init__(self, url: str, etag: Optional[str], last_modified: Optional[str], content_hash: str,
+                 text: str, links: List[str]):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.text = text
+        self.links = links
+        self.fetched_at = time.time()
+
+    @property
+    def size(self) -> int:
+        """Примерный объем памяти, занимаемый страницей, в байтах"""
+        return (len(self.url) + len(self.text) + sum(len(link) for link in self.links)
+                + len(self.content_hash) + len(self.etag or "") + len(self.last_modified or ""))
+
+
+class CrawlState:
+    """
+    Состояние обхода сайта для инкрементального повторного обхода
+    """
+
+    __slots__ = ("pages", "depths", "sitemap_etag", "sitemap_last_modified", "sitemap_pages", "crawled_at")
+
+    def __init__(self):
+        self.pages: Dict[str, CrawledPage] = {}
+        # Глубина страниц в порядке обнаружения
+        self.depths: Dict[str, int] = {}
+        self.sitemap_etag: Optional[str] = None
+        self.sitemap_last_modified: Optional[str] = None
+        self.sitemap_pages: List[Tuple[str, Optional[str]]] = []
+        self.crawled_at = 0.0
+
+    @property
+    def size(self) -> int:
+        """Примерный объем памяти, занимаемый состоянием, в байтах"""
+        return (sum(page.size for page in self.pages.values()) + sum(len(url) for url in self.depths)
+                + sum(len(url) + len(lastmod or "") for url, lastmod in self.sitemap_pages))
+
+
+class CrawlStateStore:
+    """
+    LRU хранилище состояний обхода по сайтам с ограничением по числу сайтов и объему памяти
+    """
+
+    def __init__(self, max_sites: int = 100, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Инициализация хранилища
+
+        Args:
+            max_sites (int): Сколько сайтов хранится, самые давно обходившиеся вытесняются
+            max_bytes (int): Максимальный объем состояний в байтах (тексты страниц, ссылки, sitemap)
+        """
+        self.max_sites = max_sites
+        self.max_bytes = max_bytes
+        self._states: "OrderedDict[str, CrawlState]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, site: str) -> Optional[CrawlState]:
+        """
+        Возвращает состояние прошлого обхода сайта
+
+        Args:
+            site (str): Ключ сайта (см. site_key)
+
+        Returns:
+            Optional[CrawlState]: Состояние или None, если сайт не обходился
+        """
+        state = self._states.get(site)
+        if state is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._states.move_to_end(site)
+        return state
+
+    def put(self, site: str, state: CrawlState):
+        """
+        Сохраняет состояние обхода сайта
+
+        Args:
+            site (str): Ключ сайта
+            state (CrawlState): Состояние обхода
+        """
+        size = state.size
+        # Состояние больше всего хранилища не сохраняем, следующий обход будет полным
+        if size > self.max_bytes:
+            logger.warning(f"Состояние обхода {site} ({size} байт) превышает лимит {self.max_bytes} байт")
+            self.discard(site)
+            return
+
+        self._states[site] = state
+        self._states.move_to_end(site)
+        self._bytes += size - self._sizes.get(site, 0)
+        self._sizes[site] = size
+        while len(self._states) > self.max_sites or self._bytes > self.max_bytes:
+            evicted, _ = self._states.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted)
+            self.stats["evictions"] += 1
+
+    def discard(self, site: str):
+        """
+        Удаляет состояние обхода сайта
+
+        Args:
+            site (str): Ключ сайта
+        """
+        if self._states.pop(site, None) is not None:
+            self._bytes -= self._sizes.pop(site)
+
+    @property
+    def bytes(self) -> int:
+        """Объем хранимых состояний в байтах"""
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class SiteCrawler:
+    """
+    Обходит страницы сайта в пределах глубины и числа страниц и анализирует их общий текст.
+    Страницы берутся из sitemap.xml и ссылок на тот же сайт и скачиваются параллельно.
+    При повторном обходе страницы, lastmod которых в sitemap не изменился с прошлого обхода,
+    не запрашиваются, остальные запрашиваются условным GET, а HTML разбирается заново
+    только если изменился хэш содержимого
+    """
+
+    def __init__(self, analyzer: Any, max_depth: int = 2, max_pages: int = 50, concurrency: int = 8,
+                 max_text_chars: int = 200000, store: Optional[CrawlStateStore] = None):
+        """
+        Инициализация обходчика
+
+        Args:
+            analyzer (Any): Экземпляр SiteAnalyzer (клиенты скачивания, извлечение текста, LLM)
+            max_depth (int): Максимальная глубина ссылок от начальной страницы
+            max_pages (int): Максимальное количество страниц
+            concurrency (int): Сколько страниц скачивается одновременно
+            max_text_chars (int): Сколько символов общего текста передается на отбор в промпт
+            store (Optional[CrawlStateStore]): Состояния прошлых обходов
+        """
+        self.analyzer = analyzer
+        self.max_depth = max(0, max_depth)
+        self.max_pages = max(1, max_pages)
+        self.concurrency = max(1, concurrency)
+        self.max_text_chars = max_text_chars
+        self.store = store if store is not None else CrawlStateStore()
+
+    @classmethod
+    def from_env(cls, analyzer: Any) -> "SiteCrawler":
+        """
+        Создает обходчик из переменных окружения CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES,
+        CRAWL_CONCURRENCY, CRAWL_MAX_TEXT_CHARS, CRAWL_STATE_MAX_SITES и CRAWL_STATE_MAX_BYTES
+
+        Args:
+            analyzer (Any): Экземпляр SiteAnalyzer
+
+        Returns:
+            SiteCrawler: Обходчик сайтов
+        """
+        load_dotenv()
+        return cls(
+            analyzer,
+            max_depth=int(os.environ.get("CRAWL_MAX_DEPTH", "2")),
+            max_pages=int(os.environ.get("CRAWL_MAX_PAGES", "50")),
+            concurrency=int(os.environ.get("CRAWL_CONCURRENCY", "8")),
+            max_text_chars=int(os.environ.get("CRAWL_MAX_TEXT_CHARS", "200000")),
+            store=CrawlStateStore(
+                int(os.environ.get("CRAWL_STATE_MAX_SITES", "100")),
+                int(os.environ.get("CRAWL_STATE_MAX_BYTES", str(64 * 1024 * 1024)))
+            )
+        )
+
+    async def acrawl(self, url: str, no_cache: bool = False, priority: int = PRIORITY_BATCH,
+                     max_depth: Optional[int] = None, max_pages: Optional[int] = None,
+                     progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Обходит сайт и генерирует вопросы по общему тексту его страниц
+
+        Args:
+            url (str): Начальная страница
+            no_cache (bool): Не брать ответ LLM из кэша
+            priority (int): Приоритет в очереди запросов к LLM
+            max_depth (Optional[int]): Глубина обхода, не больше заданной в настройках
+            max_pages (Optional[int]): Количество страниц, не больше заданного в настройках
+            progress (Optional[Callable[[Dict[str, Any]], None]]): Вызывается после каждой страницы
+                и смены стадии с текущим ходом обхода и уже обработанными страницами
+
+        Returns:
+            Dict[str, Any]: URL, вопросы, страницы с их состояниями и счетчики обхода
+
+        Raises:
+            OverloadedError: Если очередь запросов к LLM переполнена
+            Exception: Если не удалось получить текст ни одной страницы
+        """
+        start = normalize_url(url)
+        if start is None:
+            raise Exception(f"Некорректный URL для обхода: {url}")
+
+        crawl = _Crawl(
+            self, start,
+            min(self.max_depth, max_depth) if max_depth is not None else self.max_depth,
+            min(self.max_pages, max_pages) if max_pages is not None else self.max_pages,
+            progress
+        )
+        _crawl_stats["crawls"] += 1
+        try:
+            return await crawl.run(no_cache, priority)
+        except Exception:
+            _crawl_stats["failed"] += 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает счетчики обходов, страниц по состояниям и хранилища состояний
+
+        Returns:
+            Dict[str, Any]: Статистика обходов
+        """
+        return {**_crawl_stats, "sites": len(self.store), "state_bytes": self.store.bytes,
+                **{f"state_{k}": v for k, v in self.store.stats.items()}}
+
+
+class _Crawl:
+    """
+    Один обход сайта (см. SiteCrawler.acrawl)
+    """
+
+    def __init__(self, crawler: SiteCrawler, start: str, max_depth: int, max_pages: int,
+                 progress: Optional[Callable[[Dict[str, Any]], None]]):
+        self.crawler = crawler
+        self.analyzer = crawler.analyzer
+        self.start = start
+        self.site = site_key(start)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.progress = progress
+        self.previous = crawler.store.get(self.site)
+        self.state = CrawlState()
+        self.limits = StageLimits(fetch=crawler.concurrency, parse=min(crawler.concurrency, os.cpu_count() or 1),
+                                  llm=1, per_host=crawler.concurrency)
+        # Страницы в порядке обнаружения: URL -> глубина
+        self.depths = self.state.depths
+        # lastmod страниц из sitemap этого и прошлого обходов
+        self.lastmod: Dict[str, Optional[str]] = {}
+        self.previous_lastmod: Dict[str, Optional[str]] = {}
+        if self.previous is not None:
+            for page_url, lastmod in self.previous.sitemap_pages:
+                self.previous_lastmod[normalize_url(page_url)] = lastmod
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.counts = {status: 0 for status in PAGE_STATUSES}
+        self.stage = "sitemap"
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def run(self, no_cache: bool, priority: int) -> Dict[str, Any]:
+        started = time.perf_counter()
+        logger.info(f"Начало обхода сайта {self.start}: глубина {self.max_depth}, страниц не больше {self.max_pages}")
+
+        self._discover(self.start, 0)
+        self._report()
+        await self._read_sitemap()
+        if self.previous is not None:
+            # Страницы прошлого обхода ставятся в очередь сразу, не дожидаясь ответов
+            # на страницы со ссылками на них: повторный обход не идет по уровням
+            for page_url, depth in self.previous.depths.items():
+                self._discover(page_url, depth)
+
+        self.stage = "fetch"
+        self._report()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.crawler.concurrency)]
+        try:
+            await self.queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        texts = [self.state.pages[url].text for url in self.depths if url in self.state.pages]
+        if not any(text.strip() for text in texts):
+            raise Exception(f"Не удалось извлечь текст ни с одной страницы сайта {self.start}")
+
+        self.state.crawled_at = time.time()
+        self.crawler.store.put(self.site, self.state)
+
+        self.stage = "analyze"
+        self._report()
+        async with self.limits.llm:
+            questions = await self.analyzer.agenerate_questions(self._merge(texts), no_cache=no_cache,
+                                                                priority=priority)
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Обход сайта {self.start} завершен за {elapsed:.2f}s: {self.counts}")
+        return {
+            "url": self.start,
+            "questions": questions,
+            "pages": self._pages(),
+            "crawl": {**self.counts, "pages": len(self.results), "elapsed": round(elapsed, 3)},
+        }
+
+    def _discover(self, url: str, depth: int) -> bool:
+        """
+        Добавляет страницу сайта в очередь, если она еще не встречалась и не превышены лимиты
+        """
+        url = normalize_url(url)
+        if url is None or url in self.depths or depth > self.max_depth or len(self.depths) >= self.max_pages:
+            return False
+        if site_key(url) != self.site:
+            return False
+        self.depths[url] = depth
+        self.queue.put_nowait(url)
+        return True
+
+    async def _read_sitemap(self):
+        """
+        Добавляет страницы из sitemap.xml сайта (глубина 1) и запоминает их lastmod.
+        Сам sitemap запрашивается условным GET, при 304 используется прошлый список
+        """
+        parts = urlsplit(self.start)
+        sitemap_url = f"{parts.scheme}://{parts.netloc}/sitemap.xml"
+        previous = self.previous
+        try:
+            headers = {}
+            if previous is not None:
+                if previous.sitemap_etag:
+                    headers["If-None-Match"] = previous.sitemap_etag
+                if previous.sitemap_last_modified:
+                    headers["If-Modified-Since"] = previous.sitemap_last_modified
+            body, response_headers = await self._fetch_raw(sitemap_url, headers)
+            if body is None and previous is not None:
+                pages = previous.sitemap_pages
+                self.state.sitemap_etag = previous.sitemap_etag
+                self.state.sitemap_last_modified = previous.sitemap_last_modified
+            elif body is None:
+                pages = []
+            else:
+                pages, nested = parse_sitemap(body)
+                # Вложенные sitemap только этого сайта: индекс не должен заставлять сервис
+                # запрашивать чужие хосты, в том числе внутренние адреса
+                nested = [index_url for index_url in nested if self._is_site_sitemap(index_url)]
+                for index_url in nested[:SITEMAP_MAX_FILES]:
+                    nested_body, _ = await self._fetch_raw(index_url, {})
+                    if nested_body is not None:
+                        pages += parse_sitemap(nested_body)[0]
+                self.state.sitemap_etag = response_headers.get("ETag")
+                self.state.sitemap_last_modified = response_headers.get("Last-Modified")
+        except Exception as e:
+            logger.info(f"Sitemap сайта {self.start} недоступен, обход только по ссылкам: {str(e)}")
+            return
+
+        self.state.sitemap_pages = pages
+        for page_url, lastmod in pages:
+            normalized = normalize_url(page_url)
+            if normalized is not None:
+                self.lastmod[normalized] = lastmod
+            if len(self.depths) >= self.max_pages:
+                break
+            self._discover(page_url, 1)
+        logger.info(f"Sitemap сайта {self.start}: {len(pages)} страниц")
+
+    def _is_site_sitemap(self, url: str) -> bool:
+        """
+        Проверяет, что вложенный sitemap - http(s) файл того же сайта, что и обход
+        (normalize_url не подходит: он отбрасывает файлы .xml)
+        """
+        parts = urlsplit(canonicalize_url(url))
+        return parts.scheme in ("http", "https") and bool(parts.netloc) and site_key(url) == self.site
+
+    async def _fetch_raw(self, url: str, headers: Dict[str, str]) -> Tuple[Optional[bytes], Any]:
+        """
+        Скачивает файл целиком (не больше SITEMAP_MAX_BYTES)
+
+        Returns:
+            Tuple[Optional[bytes], Any]: Тело (None при 304 или 404) и заголовки ответа
+
+        Raises:
+            Exception: Если запрос не удался или файл слишком большой
+        """
+        async with self.limits.fetch_slot(url):
+            async with self.analyzer.fetcher.astream("GET", url, headers=headers) as response:
+                if response.status_code in (304, 404, 410):
+                    return None, response.headers
+                response.raise_for_status()
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > SITEMAP_MAX_BYTES:
+                        raise Exception(f"Файл больше {SITEMAP_MAX_BYTES} байт")
+                    chunks.append(chunk)
+                return b"".join(chunks), response.headers
+
+    async def _worker(self):
+        while True:
+            url = await self.queue.get()
+            try:
+                try:
+                    status, error = await self._crawl_page(url)
+                except Exception as e:
+                    status, error = PAGE_FAILED, str(e)
+
+                # Новые страницы ставятся в очередь до task_done, иначе обход может завершиться раньше
+                page = self.state.pages.get(url)
+                if page is not None:
+                    # Ссылки неизменившихся страниц берутся из прошлого обхода без разбора HTML
+                    for link in page.links:
+                        self._discover(link, self.depths[url] + 1)
+                self._record(url, status, error)
+            finally:
+                self.queue.task_done()
+
+    async def _crawl_page(self, url: str) -> Tuple[str, Optional[str]]:
+        """
+        Получает страницу: из прошлого обхода без запроса, по 304 или скачиванием
+
+        Returns:
+            Tuple[str, Optional[str]]: Состояние страницы и описание ошибки
+        """
+        previous = self.previous.pages.get(url) if self.previous is not None else None
+        if previous is not None and self._fresh(url, previous):
+            self.state.pages[url] = previous
+            return PAGE_FRESH, None
+
+        headers = {}
+        if previous is not None:
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+
+        try:
+            async with self.limits.fetch_slot(url):
+                async with self.analyzer.fetcher.astream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and previous is not None:
+                        previous.fetched_at = time.time()
+                        self.state.pages[url] = previous
+                        return PAGE_NOT_MODIFIED, None
+                    response.raise_for_status()
+
+                    reader = HtmlStreamReader(response.headers, self.analyzer.max_download_bytes)
+                    async for chunk in response.aiter_bytes():
+                        if reader.feed(chunk):
+                            break
+                    html = reader.finish()
+        except Exception as e:
+            gone = isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (404, 410)
+            if previous is not None and not gone:
+                # Временная ошибка не должна выбрасывать страницу из анализа сайта
+                self.state.pages[url] = previous
+            logger.warning(f"Не удалось скачать страницу {url}: {str(e)}")
+            return PAGE_FAILED, str(e)
+
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        content_hash = hashlib.sha256(html.encode("utf-8")).hexdigest()
+        if previous is not None and previous.content_hash == content_hash:
+            page = CrawledPage(url, etag, last_modified, content_hash, previous.text, previous.links)
+            self.state.pages[url] = page
+            return PAGE_UNCHANGED, None
+
+        async with self.limits.parse:
+            text, links = await asyncio.to_thread(self._parse, html, str(response.url))
+        self.state.pages[url] = CrawledPage(url, etag, last_modified, content_hash, text, links)
+        return (PAGE_CHANGED if previous is not None else PAGE_NEW), None
+
+    def _fresh(self, url: str, previous: CrawledPage) -> bool:
+        """
+        Проверяет по sitemap, что страница не менялась после прошлого скачивания.
+        lastmod сравнивается со значением из прошлого sitemap, а не с часами обходчика,
+        поэтому расхождение часов сайта не мешает. Дата без времени не различает изменения
+        в течение дня, поэтому такая страница считается свежей, только если скачана после конца этого дня
+        """
+        lastmod = self.lastmod.get(url)
+        if lastmod is None or lastmod != self.previous_lastmod.get(url):
+            return False
+        if len(lastmod) > 10:
+            return True
+        changed_at = parse_lastmod(lastmod)
+        return changed_at is not None and changed_at <= previous.fetched_at
+
+    def _parse(self, html: str, url: str) -> Tuple[str, List[str]]:
+        """
+        Извлекает текст и ссылки страницы (выполняется в пуле потоков)
+        """
+        return self.analyzer.extract_text_from_html(html), extract_links(html, url)
+
+    def _merge(self, texts: List[str]) -> str:
+        """
+        Объединяет тексты страниц в порядке обнаружения в пределах max_text_chars.
+        Повторяющиеся на всех страницах блоки (меню, подвал) убирает отбор текста для промпта
+        """
+        merged, size = [], 0
+        for text in texts:
+            if size >= self.crawler.max_text_chars:
+                break
+            text = text[:self.crawler.max_text_chars - size]
+            merged.append(text)
+            size += len(text)
+        return "\n\n".join(merged)
+
+    def _record(self, url: str, status: str, error: Optional[str]):
+        entry = {"url": url, "depth": self.depths[url], "status": status}
+        if error is not None:
+            entry["error"] = error
+        self.results[url] = entry
+        self.counts[status] += 1
+        _crawl_stats[status] += 1
+        self._report()
+
+    def _pages(self) -> List[Dict[str, Any]]:
+        return [self.results[url] for url in self.depths if url in self.results]
+
+    def _report(self):
+        """
+        Передает ход обхода и уже обработанные страницы в progress
+        """
+        if self.progress is None:
+            return
+        try:
+            self.progress({
+                "stage": self.stage,
+                "discovered": len(self.depths),
+                "done": len(self.results),
+                **self.counts,
+                "pages": self._pages(),
+            })
+        except Exception as e:
+            logger.warning(f"Ошибка обработчика хода обхода {self.start}: {str(e)}")
+
+
+def _crawler_stats() -> List[str]:
+    """
+    Обходы сайтов и страницы по состояниям
+    """
+    lines = stats_lines(
+        "crawl_events_total", "Обходы сайтов: выполненные и завершившиеся ошибкой", "counter", "kind",
+        {"crawl": {k: _crawl_stats[k] for k in ("crawls", "failed")}}
+    )
+    lines += stats_lines(
+        "crawl_pages_total", "Страницы обходов по состояниям: новые, измененные, 304, без изменений, "
+        "пропущенные по lastmod из sitemap и с ошибкой", "counter", "kind",
+        {"crawl": {status: _crawl_stats[status] for status in PAGE_STATUSES}}, key_label="status"
+    )
+    return lines
+
+
+register_collector(_crawler_stats)
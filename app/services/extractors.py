@@ -0,0 +1,418 @@
+"""
+Движки извлечения текста из HTML
+
+Все движки работают через сессию: HTML подается частями через feed(),
+а close() возвращает текст. Потоковые движки не строят DOM, пропускают
+script/style/noscript/svg и служебные блоки (навигация, подвал, cookie-баннеры),
+разделяют блоки переводами строк и прекращают разбор, как только набран бюджет символов.
+"""
+
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+try:
+    from lxml import etree
+except ImportError:  # lxml - необязательная зависимость
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+
+# Теги, содержимое которых не является текстом страницы
+SKIP_TAGS = frozenset({"script", "style", "noscript", "svg", "template"})
+
+# Блочные теги: между их содержимым вставляется перевод строки
+BLOCK_TAGS = frozenset({
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "title",
+    "tr", "ul",
+})
+
+# Служебные области страницы, текст которых не нужен для анализа.
+# role="banner" не входит в список: это шапка сайта, в ней обычно заголовок h1
+BOILERPLATE_TAGS = frozenset({"nav", "footer", "aside"})
+BOILERPLATE_ROLES = frozenset({"navigation", "contentinfo", "dialog"})
+
+# Слово в id или классе, по которому блок считается служебным: токен целиком
+# или его первая часть до - или _ (cookie-banner, share_buttons, но не has-social-menu)
+BOILERPLATE_ATTR_RE = re.compile(
+    r"^(?:cookie|cookies|consent|gdpr|breadcrumbs?|share|sharing|social|newsletter|subscribe|popup|modal)(?:[-_]|$)",
+    re.IGNORECASE
+)
+
+# Элементы-обертки всей страницы: к ним эвристики по id, классу и role не применяются
+# (<body class="modal-open">, <body class="cookie-consent-pending">)
+CONTENT_ROOT_TAGS = frozenset({"html", "body", "main", "article"})
+
+# Блок, отмеченный служебным только по id или классу, пропускается, если его текст
+# не длиннее этого числа символов: большой блок с таким классом - обертка содержимого
+BOILERPLATE_ATTR_MAX_CHARS = 1500
+
+# Теги без закрывающей пары
+VOID_TAGS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+})
+
+# Размер порции, которой HTML подается парсеру при извлечении из строки
+FEED_CHUNK_SIZE = 16 * 1024
+
+
+class TextCollector:
+    """
+    Собирает текст из событий парсера, нормализуя пробелы.
+    Блочные элементы разделяются переводом строки
+    """
+
+    def __init__(self, max_chars: Optional[int] = None, drop_boilerplate: bool = True):
+        """
+        Инициализация сборщика
+
+        Args:
+            max_chars (Optional[int]): Бюджет символов, после которого текст больше не нужен
+            drop_boilerplate (bool): Пропускать навигацию, подвал и cookie-баннеры
+        """
+        self.max_chars = max_chars
+        self.drop_boilerplate = drop_boilerplate
+        self._parts: List[str] = []
+        self._length = 0
+        self._skip_depth = 0
+        self._boilerplate_tag: Optional[str] = None
+        self._boilerplate_depth = 0
+        # Блок, служебный по id или классу: его текст собирается и отбрасывается
+        # при закрытии, если оказался коротким (позиция начала блока в _parts)
+        self._candidate_tag: Optional[str] = None
+        self._candidate_depth = 0
+        self._candidate_mark = (0, 0, "")
+        self._separator = ""
+
+    @property
+    def done(self) -> bool:
+        """True, если бюджет символов уже набран"""
+        return self.max_chars is not None and self._length >= self.max_chars and self._candidate_tag is None
+
+    def start(self, tag: str, attrs: Optional[Dict[str, Optional[str]]] = None):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif self._boilerplate_tag is not None:
+            if tag == self._boilerplate_tag:
+                self._boilerplate_depth += 1
+        elif self.drop_boilerplate and tag not in VOID_TAGS and tag not in CONTENT_ROOT_TAGS:
+            if self._is_boilerplate(tag, attrs):
+                self._boilerplate_tag = tag
+                self._boilerplate_depth = 1
+            elif tag == self._candidate_tag:
+                self._candidate_depth += 1
+            elif self._candidate_tag is None and self._is_boilerplate_attr(attrs):
+                self._candidate_tag = tag
+                self._candidate_depth = 1
+                self._candidate_mark = (len(self._parts), self._length, self._separator)
+
+        if tag in BLOCK_TAGS:
+            self._separator = "\n"
+
+    def end(self, tag: str):
+        if tag in SKIP_TAGS:
+            if self._skip_depth:
+                self._skip_depth -= 1
+        elif tag == self._boilerplate_tag:
+            self._boilerplate_depth -= 1
+            if not self._boilerplate_depth:
+                self._boilerplate_tag = None
+        elif tag == self._candidate_tag:
+            self._candidate_depth -= 1
+            if not self._candidate_depth:
+                # Короткий служебный блок (cookie-баннер, кнопки «поделиться») отбрасывается
+                parts, length, separator = self._candidate_mark
+                del self._parts[parts:]
+                self._length = length
+                self._separator = separator
+                self._candidate_tag = None
+
+        if tag in BLOCK_TAGS:
+            self._separator = "\n"
+
+    def data(self, text: str):
+        if self._skip_depth or self._boilerplate_tag is not None or self.done or not text:
+            return
+
+        normalized = " ".join(text.split())
+        if not normalized:
+            if not self._separator:
+                self._separator = " "
+            return
+
+        if self._parts:
+            separator = self._separator or (" " if text[0].isspace() else "")
+            if separator:
+                self._parts.append(separator)
+                self._length += 1
+        self._parts.append(normalized)
+        self._length += len(normalized)
+        self._separator = " " if text[-1].isspace() else ""
+
+        if self._candidate_tag is not None and self._length - self._candidate_mark[1] > BOILERPLATE_ATTR_MAX_CHARS:
+            # Длинный блок - не служебный, его текст остается
+            self._candidate_tag = None
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @staticmethod
+    def _is_boilerplate(tag: str, attrs: Optional[Dict[str, Optional[str]]]) -> bool:
+        if tag in BOILERPLATE_TAGS:
+            return True
+        return bool(attrs) and (attrs.get("role") or "").lower() in BOILERPLATE_ROLES
+
+    @staticmethod
+    def _is_boilerplate_attr(attrs: Optional[Dict[str, Optional[str]]]) -> bool:
+        if not attrs:
+            return False
+        tokens = f"{attrs.get('id') or ''} {attrs.get('class') or ''}".split()
+        return any(BOILERPLATE_ATTR_RE.match(token) for token in tokens)
+
+
+class ExtractionSession(ABC):
+    """
+    Сессия инкрементального извлечения текста
+    """
+
+    @abstractmethod
+    def feed(self, chunk: str) -> bool:
+        """
+        Подает очередную порцию HTML
+
+        Args:
+            chunk (str): Порция HTML
+
+        Returns:
+            bool: True, если бюджет набран и дальнейшие порции не нужны
+        """
+
+    @abstractmethod
+    def close(self) -> str:
+        """
+        Завершает разбор
+
+        Returns:
+            str: Извлеченный текст
+        """
+
+
+class TextExtractor(ABC):
+    """
+    Базовый класс движка извлечения текста
+    """
+
+    name = ""
+
+    @abstractmethod
+    def session(self, max_chars: Optional[int] = None) -> ExtractionSession:
+        """
+        Создает сессию инкрементального извлечения
+
+        Args:
+            max_chars (Optional[int]): Бюджет символов
+
+        Returns:
+            ExtractionSession: Сессия извлечения
+        """
+
+    def extract(self, html: str, max_chars: Optional[int] = None) -> str:
+        """
+        Извлекает текст из HTML-строки
+
+        Args:
+            html (str): HTML-код
+            max_chars (Optional[int]): Бюджет символов (текст может немного превышать его)
+
+        Returns:
+            str: Очищенный текст
+        """
+        session = self.session(max_chars)
+        for offset in range(0, len(html), FEED_CHUNK_SIZE):
+            if session.feed(html[offset:offset + FEED_CHUNK_SIZE]):
+                break
+        return session.close()
+
+
+class _SoupSession(ExtractionSession):
+
+    def __init__(self, max_chars: Optional[int]):
+        self.max_chars = max_chars
+        self._chunks: List[str] = []
+
+    def feed(self, chunk: str) -> bool:
+        self._chunks.append(chunk)
+        return False
+
+    def close(self) -> str:
+        # bs4 импортируется только при выборе этого движка
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup("".join(self._chunks), 'html.parser')
+
+        # Удаляем скрипты и стили
+        for script in soup(["script", "style"]):
+            script.decompose()
+
+        # Получаем текст
+        text = soup.get_text()
+
+        # Очищаем от лишних пробелов и переносов строк
+        lines = (line.strip() for line in text.splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        return ' '.join(chunk for chunk in chunks if chunk)
+
+
+class SoupExtractor(TextExtractor):
+    """
+    Исходный движок: полное DOM-дерево BeautifulSoup. Бюджет символов не ускоряет разбор
+    """
+
+    name = "soup"
+
+    def session(self, max_chars: Optional[int] = None) -> ExtractionSession:
+        return _SoupSession(max_chars)
+
+
+class _StreamingParser(HTMLParser):
+
+    def __init__(self, collector: TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        # Самозакрывающийся тег (<svg/>, <br/>) открывается и сразу закрывается
+        self.collector.start(tag, dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+class _StreamingSession(ExtractionSession):
+
+    def __init__(self, max_chars: Optional[int]):
+        self.collector = TextCollector(max_chars)
+        self.parser = _StreamingParser(self.collector)
+
+    def feed(self, chunk: str) -> bool:
+        if not self.collector.done:
+            self.parser.feed(chunk)
+        return self.collector.done
+
+    def close(self) -> str:
+        if not self.collector.done:
+            self.parser.close()
+        return self.collector.text()
+
+
+class StreamingExtractor(TextExtractor):
+    """
+    SAX-подобный движок на html.parser из стандартной библиотеки: без DOM и с ранней остановкой
+    """
+
+    name = "streaming"
+
+    def session(self, max_chars: Optional[int] = None) -> ExtractionSession:
+        return _StreamingSession(max_chars)
+
+
+class _LxmlTarget:
+
+    def __init__(self, collector: TextCollector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        self.collector.start(tag, attrib)
+
+    def end(self, tag):
+        self.collector.end(tag)
+
+    def data(self, data):
+        self.collector.data(data)
+
+    def close(self):
+        return None
+
+
+class _LxmlSession(ExtractionSession):
+
+    def __init__(self, max_chars: Optional[int]):
+        self.collector = TextCollector(max_chars)
+        self.parser = etree.HTMLParser(target=_LxmlTarget(self.collector), remove_comments=True)
+
+    def feed(self, chunk: str) -> bool:
+        if not self.collector.done:
+            self.parser.feed(chunk)
+        return self.collector.done
+
+    def close(self) -> str:
+        try:
+            self.parser.close()
+        except etree.LxmlError:
+            # При ранней остановке документ не завершен - это ожидаемо
+            pass
+        return self.collector.text()
+
+
+class LxmlExtractor(TextExtractor):
+    """
+    Потоковый движок на событиях парсера lxml (libxml2): самый быстрый, если lxml установлен
+    """
+
+    name = "lxml"
+
+    def session(self, max_chars: Optional[int] = None) -> ExtractionSession:
+        return _LxmlSession(max_chars)
+
+
+EXTRACTORS: Dict[str, type] = {
+    SoupExtractor.name: SoupExtractor,
+    StreamingExtractor.name: StreamingExtractor,
+    LxmlExtractor.name: LxmlExtractor,
+}
+
+
+def get_extractor(name: Optional[str] = None) -> TextExtractor:
+    """
+    Возвращает движок извлечения текста по имени или из переменной окружения HTML_EXTRACTOR.
+    Значение auto (по умолчанию) выбирает lxml, если он установлен, иначе streaming
+
+    Args:
+        name (Optional[str]): Имя движка: auto, lxml, streaming или soup
+
+    Returns:
+        TextExtractor: Движок извлечения текста
+
+    Raises:
+        ValueError: Если движок неизвестен
+    """
+    if name is None:
+        load_dotenv()
+        name = os.environ.get("HTML_EXTRACTOR", "auto")
+
+    if name == "auto":
+        name = LxmlExtractor.name if etree is not None else StreamingExtractor.name
+
+    if name not in EXTRACTORS:
+        raise ValueError(f"Неизвестный движок извлечения текста: {name}")
+
+    if name == LxmlExtractor.name and etree is None:
+        logger.warning("lxml не установлен, используем потоковый движок на html.parser")
+        name = StreamingExtractor.name
+
+    return EXTRACTORS[name]()
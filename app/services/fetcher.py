@@ -0,0 +1,776 @@
+"""
+HTTP клиенты для скачивания сайтов: пулы соединений с повторным использованием,
+HTTP/2, кэш DNS с TTL, раздельные таймауты подключения и чтения и статистика соединений
+"""
+
+import asyncio
+import importlib.util
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncContextManager, AsyncIterator, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+import httpcore
+import httpx
+from dotenv import load_dotenv
+
+from app.services.metrics import register_collector, stats_lines
+
+logger = logging.getLogger(__name__)
+
+
+# Заголовки, с которыми скачиваются сайты
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class DnsCache:
+    """
+    Кэш разрешения имен в процессе: адреса хоста хранятся ttl секунд,
+    поэтому повторные скачивания с одного домена не ждут DNS
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024):
+        """
+        Инициализация кэша
+
+        Args:
+            ttl (float): Время жизни записи в секундах (0 - кэш выключен)
+            max_entries (int): Максимум хранимых хостов, лишние вытесняются по LRU
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "errors": 0,
+        }
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        """
+        Возвращает адреса хоста, разрешая имя блокирующим getaddrinfo при промахе
+
+        Args:
+            host (str): Имя хоста
+            port (int): Порт
+
+        Returns:
+            List[str]: IP адреса в порядке, который вернул резолвер
+        """
+        addresses = self._lookup(host, port)
+        if addresses is None:
+            addresses = self._store(host, port, self._getaddrinfo(socket.getaddrinfo, host, port))
+        return addresses
+
+    async def aresolve(self, host: str, port: int) -> List[str]:
+        """
+        Асинхронный вариант resolve: при промахе имя разрешается в пуле потоков event loop
+
+        Args:
+            host (str): Имя хоста
+            port (int): Порт
+
+        Returns:
+            List[str]: IP адреса в порядке, который вернул резолвер
+        """
+        addresses = self._lookup(host, port)
+        if addresses is None:
+            infos = await self._agetaddrinfo(host, port)
+            addresses = self._store(host, port, infos)
+        return addresses
+
+    def _lookup(self, host: str, port: int) -> Optional[List[str]]:
+        if self.ttl <= 0 or self._is_ip(host):
+            return [host]
+
+        key = (host.lower(), port)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, addresses = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return addresses
+                del self._entries[key]
+                self.stats["expired"] += 1
+            self.stats["misses"] += 1
+        return None
+
+    def _store(self, host: str, port: int, infos: list) -> List[str]:
+        # Порядок адресов сохраняется, дубли (разные типы сокетов) убираются
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[(host.lower(), port)] = (time.monotonic() + self.ttl, addresses)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return addresses
+
+    def _getaddrinfo(self, getaddrinfo, host: str, port: int) -> list:
+        try:
+            return getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            self.stats["errors"] += 1
+            raise httpcore.ConnectError(f"Не удалось разрешить имя {host}: {str(e)}")
+
+    async def _agetaddrinfo(self, host: str, port: int) -> list:
+        try:
+            return await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError as e:
+            self.stats["errors"] += 1
+            raise httpcore.ConnectError(f"Не удалось разрешить имя {host}: {str(e)}")
+
+    @staticmethod
+    def _is_ip(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _CachingBackend(httpcore.NetworkBackend):
+    """
+    Сетевой backend httpcore, который подключается к адресам из DnsCache
+    и считает открытые соединения. TLS (SNI и проверка сертификата) по-прежнему
+    использует имя хоста из URL, подменяется только адрес TCP подключения
+    """
+
+    def __init__(self, backend: httpcore.NetworkBackend, fetcher: "Fetcher"):
+        self._backend = backend
+        self._fetcher = fetcher
+
+    def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                    local_address: Optional[str] = None, socket_options=None) -> httpcore.NetworkStream:
+        error: Optional[Exception] = None
+        for address in self._fetcher.dns.resolve(host, port):
+            try:
+                stream = self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+                continue
+            self._fetcher.stats["connections"] += 1
+            return stream
+        raise error or httpcore.ConnectError(f"Нет адресов для {host}")
+
+    def connect_unix_socket(self, path: str, timeout: Optional[float] = None,
+                            socket_options=None) -> httpcore.NetworkStream:
+        return self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds: float):
+        self._backend.sleep(seconds)
+
+
+class _AsyncCachingBackend(httpcore.AsyncNetworkBackend):
+    """
+    Асинхронный вариант _CachingBackend
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, fetcher: "Fetcher"):
+        self._backend = backend
+        self._fetcher = fetcher
+
+    async def connect_tcp(self, host: str, port: int, timeout: Optional[float] = None,
+                          local_address: Optional[str] = None, socket_options=None) -> httpcore.AsyncNetworkStream:
+        error: Optional[Exception] = None
+        for address in await self._fetcher.dns.aresolve(host, port):
+            try:
+                stream = await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+                continue
+            self._fetcher.stats["connections"] += 1
+            return stream
+        raise error or httpcore.ConnectError(f"Нет адресов для {host}")
+
+    async def connect_unix_socket(self, path: str, timeout: Optional[float] = None,
+                                  socket_options=None) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+# Ошибки httpcore и соответствующие им ошибки httpx; более конкретные классы идут раньше общих
+_HTTPCORE_ERRORS: Tuple[Tuple[type, type], ...] = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+_CORE_ERRORS = tuple(core_error for core_error, _ in _HTTPCORE_ERRORS)
+
+
+def _httpx_error(error: Exception) -> Exception:
+    """
+    Переводит ошибку httpcore в ошибку httpx, которую ожидают вызывающие
+
+    Args:
+        error (Exception): Ошибка httpcore
+
+    Returns:
+        Exception: Ошибка httpx или исходная ошибка, если соответствия нет
+    """
+    for core_error, httpx_error in _HTTPCORE_ERRORS:
+        if isinstance(error, core_error):
+            return httpx_error(str(error))
+    return error
+
+
+def _core_request(request: httpx.Request) -> httpcore.Request:
+    return httpcore.Request(
+        method=request.method,
+        url=httpcore.URL(
+            scheme=request.url.raw_scheme,
+            host=request.url.raw_host,
+            port=request.url.port,
+            target=request.url.raw_path,
+        ),
+        headers=request.headers.raw,
+        content=request.stream,
+        extensions=request.extensions,
+    )
+
+
+class _CoreStream(httpx.SyncByteStream):
+    """
+    Тело ответа httpcore с ошибками httpx
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            yield from self._stream
+        except _CORE_ERRORS as e:
+            raise _httpx_error(e) from e
+
+    def close(self):
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+
+
+class _AsyncCoreStream(httpx.AsyncByteStream):
+    """
+    Асинхронный вариант _CoreStream
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except _CORE_ERRORS as e:
+            raise _httpx_error(e) from e
+
+    async def aclose(self):
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class _PoolTransport(httpx.BaseTransport):
+    """
+    Транспорт httpx поверх пула соединений httpcore. httpx.HTTPTransport не принимает
+    сетевой backend, поэтому пул с _CachingBackend создается здесь через публичный API httpcore
+    """
+
+    def __init__(self, pool: httpcore.ConnectionPool):
+        self._pool = pool
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            response = self._pool.handle_request(_core_request(request))
+        except _CORE_ERRORS as e:
+            raise _httpx_error(e) from e
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_CoreStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    def close(self):
+        self._pool.close()
+
+
+class _AsyncPoolTransport(httpx.AsyncBaseTransport):
+    """
+    Асинхронный вариант _PoolTransport
+    """
+
+    def __init__(self, pool: httpcore.AsyncConnectionPool):
+        self._pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            response = await self._pool.handle_async_request(_core_request(request))
+        except _CORE_ERRORS as e:
+            raise _httpx_error(e) from e
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_AsyncCoreStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._pool.aclose()
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """
+    Тело ответа, которое при закрытии освобождает пул хоста
+    """
+
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """
+    Асинхронный вариант _ReleasingStream
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class _HostPool:
+    """
+    Пул соединений одного хоста и число запросов, которые его используют
+    """
+
+    __slots__ = ("transport", "users")
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.users = 0
+
+
+class _HostPools:
+    """
+    Отдельный пул соединений httpcore на каждый хост (схема, имя, порт). Размер пула ограничивает
+    число соединений с хостом, а поиск свободного соединения не перебирает соединения других хостов.
+    Хранится не больше max_hosts пулов: лишние пулы без активных запросов закрываются по LRU
+    """
+
+    def __init__(self, fetcher: "Fetcher", factory: Callable[[], object]):
+        self._fetcher = fetcher
+        self._factory = factory
+        self._pools: "OrderedDict[Tuple[bytes, str, Optional[int]], _HostPool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, url: httpx.URL) -> Tuple[_HostPool, list]:
+        """
+        Возвращает пул хоста URL, отмеченный как используемый, и вытесненные пулы, которые нужно закрыть
+        """
+        key = (url.raw_scheme, url.host, url.port)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = _HostPool(self._factory())
+            self._pools.move_to_end(key)
+            pool.users += 1
+
+            excess = len(self._pools) - self._fetcher.max_hosts
+            idle = [key for key, entry in self._pools.items() if entry.users == 0][:max(excess, 0)]
+            evicted = [self._pools.pop(key).transport for key in idle]
+            self._fetcher.stats["evicted_pools"] += len(evicted)
+        return pool, evicted
+
+    def release(self, pool: _HostPool) -> Callable[[], None]:
+        """
+        Возвращает функцию, которая один раз освобождает пул после ответа
+        """
+        released = False
+
+        def release():
+            nonlocal released
+            with self._lock:
+                if not released:
+                    released = True
+                    pool.users -= 1
+        return release
+
+    def drain(self) -> list:
+        """
+        Забирает все пулы для закрытия
+        """
+        with self._lock:
+            transports = [pool.transport for pool in self._pools.values()]
+            self._pools.clear()
+        return transports
+
+    def __len__(self) -> int:
+        return len(self._pools)
+
+
+class _HostTransport(httpx.BaseTransport):
+    """
+    Транспорт синхронного клиента: направляет запрос в пул соединений его хоста
+    """
+
+    def __init__(self, pools: _HostPools):
+        self.pools = pools
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        pool, evicted = self.pools.acquire(request.url)
+        for transport in evicted:
+            transport.close()
+
+        release = self.pools.release(pool)
+        try:
+            response = pool.transport.handle_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    def close(self):
+        for transport in self.pools.drain():
+            transport.close()
+
+
+class _AsyncHostTransport(httpx.AsyncBaseTransport):
+    """
+    Транспорт асинхронного клиента: направляет запрос в пул соединений его хоста
+    """
+
+    def __init__(self, pools: _HostPools):
+        self.pools = pools
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        pool, evicted = self.pools.acquire(request.url)
+        for transport in evicted:
+            await transport.aclose()
+
+        release = self.pools.release(pool)
+        try:
+            response = await pool.transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _AsyncReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        for transport in self.pools.drain():
+            await transport.aclose()
+
+
+def _parse_http2(value: str) -> Optional[bool]:
+    """
+    Разбирает FETCH_HTTP2: auto - HTTP/2 при наличии пакета h2, true/false - включить или выключить
+
+    Args:
+        value (str): Значение переменной окружения
+
+    Returns:
+        Optional[bool]: None для auto, иначе явный выбор
+    """
+    value = value.strip().lower()
+    if value == "auto":
+        return None
+    return value not in ("0", "false", "no")
+
+
+class Fetcher:
+    """
+    Синхронный и асинхронный HTTP клиенты для скачивания сайтов с общим кэшем DNS.
+    У каждого хоста свой пул соединений на max_per_host соединений, которые переиспользуются
+    между запросами (keep-alive, HTTP/2 при наличии пакета h2)
+    """
+
+    def __init__(self, max_per_host: int = 6, max_hosts: int = 64, keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 20.0, http2: Optional[bool] = None,
+                 dns: Optional[DnsCache] = None):
+        """
+        Инициализация клиентов
+
+        Args:
+            max_per_host (int): Максимум соединений с одним хостом; остальные запросы к хосту ждут свободное
+            max_hosts (int): Сколько пулов хостов держать открытыми
+            keepalive_expiry (float): Через сколько секунд простоя соединение закрывается
+            connect_timeout (float): Таймаут подключения (вместе с TLS) в секундах
+            read_timeout (float): Таймаут чтения ответа и записи запроса в секундах
+            http2 (Optional[bool]): Использовать HTTP/2; None - если установлен пакет h2,
+                True - обязательно (без пакета h2 клиенты не создаются)
+            dns (Optional[DnsCache]): Кэш DNS (по умолчанию с TTL 300 секунд)
+        """
+        self.max_per_host = max_per_host
+        self.max_hosts = max_hosts
+        self.host_limits = httpx.Limits(
+            max_connections=max_per_host,
+            max_keepalive_connections=max_per_host,
+            keepalive_expiry=keepalive_expiry
+        )
+        # Ожидание соединения хоста не ограничено: это очередь вежливости, а не зависший сервер
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=None)
+        h2_installed = importlib.util.find_spec("h2") is not None
+        if http2 and not h2_installed:
+            raise Exception("HTTP/2 включен (FETCH_HTTP2=true), но пакет h2 не установлен: pip install h2")
+        self.http2 = h2_installed if http2 is None else http2
+        if http2 is None and not h2_installed:
+            logger.warning("Пакет h2 не установлен, сайты скачиваются по HTTP/1.1")
+        self.dns = dns if dns is not None else DnsCache()
+
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._host_pools = _HostPools(self, self._transport)
+        self._async_host_pools = _HostPools(self, self._async_transport)
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "connections": 0,
+            "http2": 0,
+            "evicted_pools": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "Fetcher":
+        """
+        Создает клиенты из переменных окружения: FETCH_MAX_PER_HOST, FETCH_MAX_HOSTS,
+        FETCH_KEEPALIVE_EXPIRY, FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT, FETCH_HTTP2,
+        FETCH_DNS_TTL и FETCH_DNS_MAX_ENTRIES
+
+        Returns:
+            Fetcher: Клиенты скачивания
+        """
+        load_dotenv()
+        return cls(
+            max_per_host=int(os.environ.get("FETCH_MAX_PER_HOST", "6")),
+            max_hosts=int(os.environ.get("FETCH_MAX_HOSTS", "64")),
+            keepalive_expiry=float(os.environ.get("FETCH_KEEPALIVE_EXPIRY", "30")),
+            connect_timeout=float(os.environ.get("FETCH_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.environ.get("FETCH_READ_TIMEOUT", "20")),
+            http2=_parse_http2(os.environ.get("FETCH_HTTP2", "auto")),
+            dns=DnsCache(
+                ttl=float(os.environ.get("FETCH_DNS_TTL", "300")),
+                max_entries=int(os.environ.get("FETCH_DNS_MAX_ENTRIES", "1024"))
+            )
+        )
+
+    @property
+    def client(self) -> httpx.Client:
+        """
+        Синхронный клиент. Создается при первом обращении и заново после close
+        """
+        with self._lock:
+            if self._client is None or self._client.is_closed:
+                self._client = httpx.Client(
+                    transport=_HostTransport(self._host_pools),
+                    headers=DEFAULT_HEADERS,
+                    follow_redirects=True,
+                    timeout=self.timeout,
+                    event_hooks={"response": [self._count_response]}
+                )
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """
+        Асинхронный клиент. Создается при первом обращении и заново после aclose
+        """
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                transport=_AsyncHostTransport(self._async_host_pools),
+                headers=DEFAULT_HEADERS,
+                follow_redirects=True,
+                timeout=self.timeout,
+                event_hooks={"response": [self._acount_response]}
+            )
+        return self._async_client
+
+    def _pool_options(self) -> dict:
+        return {
+            "ssl_context": httpx.create_ssl_context(),
+            "max_connections": self.host_limits.max_connections,
+            "max_keepalive_connections": self.host_limits.max_keepalive_connections,
+            "keepalive_expiry": self.host_limits.keepalive_expiry,
+            "http1": True,
+            "http2": self.http2,
+        }
+
+    def _transport(self) -> _PoolTransport:
+        return _PoolTransport(httpcore.ConnectionPool(
+            network_backend=_CachingBackend(httpcore.SyncBackend(), self),
+            **self._pool_options()
+        ))
+
+    def _async_transport(self) -> _AsyncPoolTransport:
+        return _AsyncPoolTransport(httpcore.AsyncConnectionPool(
+            network_backend=_AsyncCachingBackend(httpcore.AnyIOBackend(), self),
+            **self._pool_options()
+        ))
+
+    def stream(self, method: str, url: str, headers: Optional[dict] = None) -> ContextManager[httpx.Response]:
+        """
+        Потоковый запрос синхронным клиентом
+
+        Args:
+            method (str): HTTP метод
+            url (str): URL
+            headers (Optional[dict]): Дополнительные заголовки
+
+        Returns:
+            ContextManager[httpx.Response]: Ответ с непрочитанным телом
+        """
+        return self.client.stream(method, url, headers=headers)
+
+    def astream(self, method: str, url: str,
+                headers: Optional[dict] = None) -> AsyncContextManager[httpx.Response]:
+        """
+        Потоковый запрос асинхронным клиентом
+
+        Args:
+            method (str): HTTP метод
+            url (str): URL
+            headers (Optional[dict]): Дополнительные заголовки
+
+        Returns:
+            AsyncContextManager[httpx.Response]: Ответ с непрочитанным телом
+        """
+        return self.async_client.stream(method, url, headers=headers)
+
+    def _count_response(self, response: httpx.Response):
+        self.stats["requests"] += 1
+        if response.http_version == "HTTP/2":
+            self.stats["http2"] += 1
+
+    async def _acount_response(self, response: httpx.Response):
+        self._count_response(response)
+
+    def reuse_ratio(self) -> float:
+        """
+        Доля запросов, которые обошлись без нового соединения (DNS, TCP и TLS)
+
+        Returns:
+            float: Значение от 0 до 1
+        """
+        requests = self.stats["requests"]
+        if not requests:
+            return 0.0
+        return max(requests - self.stats["connections"], 0) / requests
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Возвращает счетчики запросов и соединений, долю переиспользования, число пулов хостов
+        и статистику кэша DNS
+
+        Returns:
+            Dict[str, object]: Статистика скачивания
+        """
+        return {
+            **self.stats,
+            "reuse_ratio": self.reuse_ratio(),
+            "host_pools": len(self._host_pools) + len(self._async_host_pools),
+            "http2_enabled": self.http2,
+            "dns": {**self.dns.stats, "entries": len(self.dns)},
+        }
+
+    def close(self):
+        """Закрывает синхронный клиент и его соединения"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        """Закрывает оба клиента и их соединения"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
+
+
+_fetcher: Optional[Fetcher] = None
+
+
+def get_fetcher() -> Fetcher:
+    """
+    Возвращает общие для процесса клиенты скачивания сайтов
+
+    Returns:
+        Fetcher: Клиенты скачивания
+    """
+    global _fetcher
+
+    if _fetcher is None:
+        _fetcher = Fetcher.from_env()
+    return _fetcher
+
+
+def _fetcher_stats() -> List[str]:
+    """
+    Запросы, новые соединения и HTTP/2 ответы при скачивании сайтов, кэш DNS
+    """
+    if _fetcher is None:
+        return []
+    lines = stats_lines(
+        "fetch_events_total", "Скачивание сайтов: запросы, новые соединения, ответы по HTTP/2 и закрытые пулы хостов", "counter",
+        "client", {"sites": _fetcher.stats}
+    )
+    lines += stats_lines(
+        "fetch_dns_events_total", "Кэш DNS скачивания сайтов: попадания, промахи, устаревшие записи, ошибки",
+        "counter", "cache", {"dns": _fetcher.dns.stats}
+    )
+    lines += [
+        "# HELP fetch_connection_reuse_ratio Доля запросов скачивания без нового соединения",
+        "# TYPE fetch_connection_reuse_ratio gauge",
+        f"fetch_connection_reuse_ratio {_fetcher.reuse_ratio()}",
+        "# HELP fetch_dns_cache_entries Хосты в кэше DNS скачивания сайтов",
+        "# TYPE fetch_dns_cache_entries gauge",
+        f"fetch_dns_cache_entries {len(_fetcher.dns)}",
+        "# HELP fetch_host_pools Открытые пулы соединений хостов",
+        "# TYPE fetch_host_pools gauge",
+        f"fetch_host_pools {_fetcher.get_stats()['host_pools']}",
+    ]
+    return lines
+
+
+register_collector(_fetcher_stats)
@@ -0,0 +1,179 @@
+"""
+Потоковое чтение HTML: ограничение размера, проверка Content-Type и определение кодировки
+"""
+
+import codecs
+import logging
+import re
+from typing import Any, List, Optional
+
+from charset_normalizer import from_bytes
+
+from app.services.extractors import ExtractionSession
+
+logger = logging.getLogger(__name__)
+
+
+# Типы содержимого, которые имеет смысл разбирать как HTML
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+# Сколько байт накапливается до выбора кодировки (BOM, meta charset, эвристика)
+SNIFF_BYTES = 4096
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+_HEADER_CHARSET_RE = re.compile(r"""charset\s*=\s*["']?([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+
+
+def check_content_type(content_type: Optional[str]):
+    """
+    Проверяет, что ответ похож на HTML
+
+    Args:
+        content_type (Optional[str]): Значение заголовка Content-Type
+
+    Raises:
+        Exception: Если тип содержимого не HTML
+    """
+    if not content_type:
+        return
+    mime = content_type.split(";", 1)[0].strip().lower()
+    if mime not in HTML_CONTENT_TYPES:
+        raise Exception(f"Неподдерживаемый тип содержимого: {mime}")
+
+
+def _normalize_encoding(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.strip()).name
+    except LookupError:
+        return None
+
+
+def sniff_encoding(prefix: bytes, content_type: Optional[str]) -> str:
+    """
+    Определяет кодировку по BOM, заголовку Content-Type, тегу meta и, в крайнем случае, эвристикой
+
+    Args:
+        prefix (bytes): Начало тела ответа
+        content_type (Optional[str]): Значение заголовка Content-Type
+
+    Returns:
+        str: Имя кодировки
+    """
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding
+
+    if content_type:
+        match = _HEADER_CHARSET_RE.search(content_type)
+        encoding = _normalize_encoding(match.group(1)) if match else None
+        if encoding:
+            return encoding
+
+    match = _META_CHARSET_RE.search(prefix)
+    encoding = _normalize_encoding(match.group(1).decode("ascii")) if match else None
+    if encoding:
+        return encoding
+
+    best = from_bytes(prefix).best() if prefix else None
+    return _normalize_encoding(best.encoding if best else None) or "utf-8"
+
+
+class HtmlStreamReader:
+    """
+    Принимает тело ответа порциями байт, декодирует их инкрементально
+    и либо накапливает HTML, либо сразу передает его в движок извлечения текста
+    """
+
+    def __init__(self, headers: Any, max_bytes: int, session: Optional[ExtractionSession] = None):
+        """
+        Инициализация читателя
+
+        Args:
+            headers (Any): Заголовки ответа
+            max_bytes (int): Максимальное количество байт, которое будет прочитано
+            session (Optional[ExtractionSession]): Сессия извлечения текста.
+                Если не задана, HTML накапливается целиком
+
+        Raises:
+            Exception: Если тип содержимого не HTML
+        """
+        self.content_type = headers.get("Content-Type")
+        check_content_type(self.content_type)
+
+        self.max_bytes = max_bytes
+        self.session = session
+        self.bytes_read = 0
+        self.truncated = False
+        self.encoding: Optional[str] = None
+
+        self._prefix = b""
+        self._decoder = None
+        self._chunks: List[str] = []
+        self._done = False
+
+    def feed(self, data: bytes) -> bool:
+        """
+        Подает очередную порцию байт
+
+        Args:
+            data (bytes): Порция тела ответа
+
+        Returns:
+            bool: True, если дальше читать не нужно (набран бюджет текста или лимит размера)
+        """
+        if self._done:
+            return True
+
+        remaining = self.max_bytes - self.bytes_read
+        if len(data) > remaining:
+            data = data[:remaining]
+            self.truncated = True
+        self.bytes_read += len(data)
+
+        if self._decoder is None:
+            self._prefix += data
+            if len(self._prefix) < SNIFF_BYTES and not self.truncated:
+                return False
+            data, self._prefix = self._prefix, b""
+            self._start_decoding(data)
+
+        self._emit(self._decoder.decode(data))
+        if self.truncated:
+            self._done = True
+        return self._done
+
+    def finish(self) -> str:
+        """
+        Завершает чтение
+
+        Returns:
+            str: Извлеченный текст (если задана сессия) или HTML целиком
+        """
+        if self._decoder is None:
+            self._start_decoding(self._prefix)
+            self._emit(self._decoder.decode(self._prefix))
+        self._emit(self._decoder.decode(b"", final=True))
+
+        if self.session is not None:
+            return self.session.close()
+        return "".join(self._chunks)
+
+    def _start_decoding(self, prefix: bytes):
+        self.encoding = sniff_encoding(prefix, self.content_type)
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+
+    def _emit(self, text: str):
+        if not text or self._done:
+            return
+        if self.session is not None:
+            self._done = self.session.feed(text)
+        else:
+            self._chunks.append(text)
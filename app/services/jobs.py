@@ -0,0 +1,588 @@
+"""
+Фоновая очередь задач анализа сайтов: задача ставится сразу, результат забирается позже
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.services.analyzer import SiteAnalyzer
+from app.services.crawler import SiteCrawler
+from app.services.metrics import current_trace, register_collector, stats_lines
+from app.services.rate_limiter import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(Exception):
+    """
+    В очереди слишком много невыполненных задач
+    """
+
+
+class Job:
+    """
+    Задача анализа сайта
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    __slots__ = ("id", "url", "no_cache", "crawl", "status", "result", "error", "progress",
+                 "created_at", "updated_at", "context", "_changed")
+
+    def __init__(self, url: str, no_cache: bool, crawl: bool = False):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.no_cache = no_cache
+        # Обход всего сайта вместо анализа одной страницы
+        self.crawl = crawl
+        self.status = self.QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        # Ход выполнения и промежуточные результаты (для обхода сайта)
+        self.progress: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # Контекст запроса, поставившего задачу (метки метрик; трасса профилирования сбрасывается в _run)
+        self.context = contextvars.copy_context()
+        self._changed = asyncio.Event()
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "Job":
+        """
+        Восстанавливает снимок задачи из строки SqliteJobStore
+
+        Args:
+            row (tuple): Поля задачи в порядке SqliteJobStore.COLUMNS
+
+        Returns:
+            Job: Снимок задачи без контекста запроса
+        """
+        job = cls.__new__(cls)
+        (job.id, job.url, no_cache, job.status, result, job.error,
+         job.created_at, job.updated_at, crawl, progress) = row
+        job.no_cache = bool(no_cache)
+        job.crawl = bool(crawl)
+        job.result = json.loads(result) if result is not None else None
+        job.progress = json.loads(progress) if progress is not None else None
+        job.context = None
+        job._changed = asyncio.Event()
+        return job
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.DONE, self.FAILED)
+
+    def set_status(self, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        """
+        Меняет состояние задачи и будит ожидающих изменений
+
+        Args:
+            status (str): Новое состояние
+            result (Optional[Dict[str, Any]]): Результат анализа
+            error (Optional[str]): Описание ошибки
+        """
+        self.status = status
+        self.result = result
+        self.error = error
+        self._touch()
+
+    def set_progress(self, progress: Dict[str, Any]):
+        """
+        Обновляет ход выполнения задачи и будит ожидающих изменений
+
+        Args:
+            progress (Dict[str, Any]): Ход выполнения и промежуточные результаты
+        """
+        self.progress = progress
+        self._touch()
+
+    def _touch(self):
+        self.updated_at = time.time()
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_changed(self, timeout: float) -> bool:
+        """
+        Ждет изменения состояния задачи
+
+        Args:
+            timeout (float): Максимальное ожидание в секундах
+
+        Returns:
+            bool: True, если состояние изменилось
+        """
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Возвращает описание задачи для ответа API
+
+        Returns:
+            Dict[str, Any]: Идентификатор, URL, состояние, результат или ошибка
+        """
+        data = {
+            "job_id": self.id,
+            "url": self.url,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.crawl:
+            data["crawl"] = True
+        if self.progress is not None:
+            data["progress"] = self.progress
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class SqliteJobStore:
+    """
+    Состояния задач в файле SQLite, общем для всех процессов сервера.
+    Задачу выполняет процесс, который ее принял, а узнать ее состояние можно в любом
+    """
+
+    COLUMNS = ("id", "url", "no_cache", "status", "result", "error", "created_at", "updated_at", "crawl", "progress")
+
+    def __init__(self, path: str):
+        """
+        Открывает или создает базу задач
+
+        Args:
+            path (str): Путь к файлу базы
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, url TEXT, no_cache INTEGER, status TEXT, "
+            "result TEXT, error TEXT, created_at REAL, updated_at REAL, crawl INTEGER, progress TEXT)"
+        )
+        # Базы, созданные до появления обхода сайтов, дополняются новыми столбцами
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("crawl", "INTEGER"), ("progress", "TEXT")):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    def save(self, job: Job):
+        """
+        Сохраняет текущее состояние задачи
+
+        Args:
+            job (Job): Задача
+        """
+        result = json.dumps(job.result, ensure_ascii=False) if job.result is not None else None
+        progress = json.dumps(job.progress, ensure_ascii=False) if job.progress is not None else None
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+            (job.id, job.url, int(job.no_cache), job.status, result, job.error, job.created_at, job.updated_at,
+             int(job.crawl), progress)
+        )
+
+    def load(self, job_id: str) -> Optional[Job]:
+        """
+        Загружает снимок задачи
+
+        Args:
+            job_id (str): Идентификатор задачи
+
+        Returns:
+            Optional[Job]: Снимок задачи или None
+        """
+        row = self._conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return Job.from_row(row) if row is not None else None
+
+    def expire(self, deadline: float, stale_deadline: Optional[float] = None) -> int:
+        """
+        Удаляет завершенные задачи, не менявшиеся с момента deadline, и незавершенные,
+        не менявшиеся с момента stale_deadline (их процесс был остановлен аварийно)
+
+        Args:
+            deadline (float): Граница времени последнего изменения завершенных задач
+            stale_deadline (Optional[float]): Граница для задач в очереди и в работе (None - не удалять)
+
+        Returns:
+            int: Количество удаленных задач
+        """
+        cursor = self._conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (Job.DONE, Job.FAILED, deadline)
+        )
+        removed = cursor.rowcount
+        if stale_deadline is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (Job.QUEUED, Job.RUNNING, stale_deadline)
+            )
+            removed += cursor.rowcount
+        return removed
+
+    def close(self):
+        self._conn.close()
+
+
+class JobQueue:
+    """
+    Очередь задач в памяти процесса с пулом фоновых обработчиков.
+    Завершенные задачи хранятся ttl секунд, затем удаляются.
+    С SqliteJobStore состояние задач доступно всем процессам сервера
+    """
+
+    def __init__(self, analyzer_factory: Callable[[], SiteAnalyzer], workers: int = 4,
+                 ttl: float = 3600.0, max_pending: int = 1000, store: Optional[SqliteJobStore] = None,
+                 poll_interval: float = 1.0, crawler_factory: Optional[Callable[[], SiteCrawler]] = None,
+                 stale_timeout: float = 3600.0):
+        """
+        Инициализация очереди
+
+        Args:
+            analyzer_factory (Callable[[], SiteAnalyzer]): Возвращает общий анализатор сайтов
+            workers (int): Количество обработчиков
+            ttl (float): Время хранения завершенных задач в секундах
+            max_pending (int): Максимальное количество невыполненных задач
+            store (Optional[SqliteJobStore]): Общее хранилище состояний задач
+            poll_interval (float): Интервал опроса хранилища для задач других процессов
+                (и минимальный интервал сохранения хода выполнения в хранилище)
+            crawler_factory (Optional[Callable[[], SiteCrawler]]): Возвращает общий обходчик сайтов
+                для задач обхода. Если не задан, обходчик создается поверх анализатора
+            stale_timeout (float): Через сколько секунд без изменений незавершенная задача в хранилище
+                считается брошенной остановленным процессом и удаляется
+        """
+        self.analyzer_factory = analyzer_factory
+        self.crawler_factory = crawler_factory or (lambda: SiteCrawler.from_env(self.analyzer_factory()))
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.store = store
+        self.poll_interval = poll_interval
+        self.stale_timeout = stale_timeout
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: set = set()
+        self._closing = False
+        self.stats = {
+            "submitted": 0,
+            "done": 0,
+            "failed": 0,
+            "expired": 0,
+            "rejected": 0,
+        }
+
+    @classmethod
+    def from_env(cls, analyzer_factory: Callable[[], SiteAnalyzer],
+                 crawler_factory: Optional[Callable[[], SiteCrawler]] = None) -> "JobQueue":
+        """
+        Создает очередь из переменных окружения JOBS_WORKERS, JOBS_TTL, JOBS_MAX_PENDING,
+        JOBS_STALE_TIMEOUT и JOBS_DB_PATH (файл SQLite для общего состояния задач нескольких процессов)
+
+        Args:
+            analyzer_factory (Callable[[], SiteAnalyzer]): Возвращает общий анализатор сайтов
+            crawler_factory (Optional[Callable[[], SiteCrawler]]): Возвращает общий обходчик сайтов
+
+        Returns:
+            JobQueue: Очередь задач
+        """
+        load_dotenv()
+        db_path = os.environ.get("JOBS_DB_PATH", "")
+        return cls(
+            analyzer_factory,
+            workers=int(os.environ.get("JOBS_WORKERS", "4")),
+            ttl=float(os.environ.get("JOBS_TTL", "3600")),
+            max_pending=int(os.environ.get("JOBS_MAX_PENDING", "1000")),
+            store=SqliteJobStore(db_path) if db_path else None,
+            crawler_factory=crawler_factory,
+            stale_timeout=float(os.environ.get("JOBS_STALE_TIMEOUT", "3600"))
+        )
+
+    def submit(self, url: str, no_cache: bool = False, crawl: bool = False) -> Job:
+        """
+        Ставит задачу анализа сайта в очередь
+
+        Args:
+            url (str): URL сайта
+            no_cache (bool): Не брать ответ LLM из кэша
+            crawl (bool): Обойти весь сайт, ход обхода доступен в поле progress задачи
+
+        Returns:
+            Job: Поставленная задача
+
+        Raises:
+            JobQueueFullError: Если очередь переполнена или останавливается
+        """
+        if self._closing:
+            self.stats["rejected"] += 1
+            raise JobQueueFullError("Очередь задач останавливается")
+        self._start()
+        if self._queue.qsize() >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise JobQueueFullError(f"Очередь задач переполнена, максимум: {self.max_pending}")
+
+        job = Job(url, no_cache, crawl)
+        self._jobs[job.id] = job
+        self._save(job)
+        self._queue.put_nowait(job)
+        self.stats["submitted"] += 1
+        logger.info(f"Задача {job.id} поставлена в очередь: {url}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Возвращает задачу по идентификатору
+
+        Args:
+            job_id (str): Идентификатор задачи
+
+        Returns:
+            Optional[Job]: Задача или None, если она не найдена или устарела
+        """
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    async def watch(self, job_id: str, heartbeat: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Отдает описание задачи сразу и после каждого изменения, пока она не завершится.
+        Задачи других процессов опрашиваются в хранилище
+
+        Args:
+            job_id (str): Идентификатор задачи
+            heartbeat (float): Через сколько секунд без изменений отдавать None
+
+        Yields:
+            Optional[Dict[str, Any]]: Описание задачи или None, если изменений не было
+        """
+        job = self.get(job_id)
+        while job is not None:
+            yield job.to_dict()
+            if job.finished:
+                break
+            updated_at, waited = job.updated_at, 0.0
+            while job is not None and job.updated_at == updated_at:
+                if job_id in self._jobs:
+                    if not await job.wait_changed(heartbeat):
+                        yield None
+                    continue
+                await asyncio.sleep(self.poll_interval)
+                job = self.get(job_id)
+                waited += self.poll_interval
+                if waited >= heartbeat:
+                    waited = 0.0
+                    yield None
+
+    def _start(self):
+        """Запускает обработчики и очистку в текущем event loop при первой задаче"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        # Обработчики не наследуют контекст запроса, в котором были запущены
+        self._tasks = [
+            asyncio.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._cleanup(), context=contextvars.Context()))
+
+    def _save(self, job: Job):
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось сохранить задачу {job.id}: {str(e)}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            # Анализ выполняется в контексте запроса, поставившего задачу
+            task = asyncio.create_task(self._run(job), context=job.context)
+            self._running.add(task)
+            try:
+                await task
+            finally:
+                self._running.discard(task)
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        # Из контекста запроса нужны только метки метрик: трасса профилирования запроса
+        # уже завершена и сохранена, задача не должна дописывать в нее спаны
+        current_trace.set(None)
+        job.set_status(Job.RUNNING)
+        self._save(job)
+        try:
+            if job.crawl:
+                result = await self.crawler_factory().acrawl(
+                    job.url, no_cache=job.no_cache, priority=PRIORITY_BATCH, progress=self._progress_saver(job)
+                )
+            else:
+                analyzer = self.analyzer_factory()
+                result = await analyzer.aanalyze_site(job.url, no_cache=job.no_cache, priority=PRIORITY_BATCH)
+            job.set_status(Job.DONE, result=result)
+            self.stats["done"] += 1
+        except asyncio.CancelledError:
+            # Остановка сервера не дождалась задачи: в хранилище она не должна остаться running
+            logger.warning(f"Задача {job.id} прервана при остановке сервера")
+            job.set_status(Job.FAILED, error="Выполнение прервано при остановке сервера")
+            self.stats["failed"] += 1
+            self._save(job)
+            raise
+        except Exception as e:
+            logger.error(f"Задача {job.id} завершилась ошибкой: {str(e)}")
+            job.set_status(Job.FAILED, error=str(e))
+            self.stats["failed"] += 1
+        self._save(job)
+
+    def _progress_saver(self, job: Job) -> Callable[[Dict[str, Any]], None]:
+        """
+        Возвращает обработчик хода выполнения задачи: в памяти ход обновляется сразу,
+        в хранилище - не чаще poll_interval (последнее состояние сохраняется с результатом)
+        """
+        saved_at = 0.0
+
+        def save(progress: Dict[str, Any]):
+            nonlocal saved_at
+            job.set_progress(progress)
+            if job.updated_at - saved_at >= self.poll_interval:
+                saved_at = job.updated_at
+                self._save(job)
+
+        return save
+
+    async def _cleanup(self):
+        while True:
+            await asyncio.sleep(min(self.ttl / 2, 60.0))
+            self.expire()
+
+    def expire(self) -> int:
+        """
+        Удаляет завершенные задачи старше ttl
+
+        Returns:
+            int: Количество удаленных задач, с хранилищем - во всех процессах
+        """
+        deadline = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.updated_at < deadline]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.stats["expired"] += len(expired)
+        if self.store is not None:
+            try:
+                # Удаляет и задачи других процессов, в том числе уже остановленных
+                return self.store.expire(deadline, time.time() - self.stale_timeout)
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось удалить устаревшие задачи: {str(e)}")
+        return len(expired)
+
+    async def aclose(self, drain_timeout: float = 0.0):
+        """
+        Останавливает очередь: новые задачи не принимаются, выполняемые получают до
+        drain_timeout секунд на завершение. Задачи, не начатые к остановке, помечаются failed
+
+        Args:
+            drain_timeout (float): Сколько секунд ждать выполняемые задачи
+        """
+        self._closing = True
+        if self._queue is not None:
+            # Свободные обработчики не должны брать новые задачи во время ожидания
+            while not self._queue.empty():
+                job = self._queue.get_nowait()
+                self._queue.task_done()
+                job.set_status(Job.FAILED, error="Сервер остановлен до начала выполнения задачи")
+                self._save(job)
+                self.stats["failed"] += 1
+        if self._running and drain_timeout > 0:
+            logger.info(f"Ожидание завершения {len(self._running)} задач, не более {drain_timeout} с")
+            await asyncio.wait(list(self._running), timeout=drain_timeout)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            self.store.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Возвращает счетчики задач и текущее количество задач по состояниям
+
+        Returns:
+            Dict[str, int]: Счетчики задач
+        """
+        stats = dict(self.stats)
+        stats["pending"] = self._queue.qsize() if self._queue is not None else 0
+        stats["running"] = sum(1 for job in self._jobs.values() if job.status == Job.RUNNING)
+        stats["stored"] = len(self._jobs)
+        return stats
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Возвращает очередь задач процесса, обработчики используют общий анализатор сайтов
+
+    Returns:
+        JobQueue: Очередь задач
+    """
+    global _job_queue
+
+    if _job_queue is None:
+        # Контейнер сам закрывает очередь, поэтому импортируется здесь
+        from app.services.container import get_services
+        _job_queue = JobQueue.from_env(lambda: get_services().site_analyzer, lambda: get_services().site_crawler)
+    return _job_queue
+
+
+async def aclose_job_queue(drain_timeout: float = 0.0):
+    """
+    Останавливает обработчики очереди задач, если она создавалась
+
+    Args:
+        drain_timeout (float): Сколько секунд ждать выполняемые задачи
+    """
+    global _job_queue
+
+    if _job_queue is not None:
+        await _job_queue.aclose(drain_timeout)
+        _job_queue = None
+
+
+def _job_stats() -> List[str]:
+    """
+    Счетчики и текущее количество задач фоновой очереди
+    """
+    if _job_queue is None:
+        return []
+    stats = _job_queue.get_stats()
+    lines = stats_lines(
+        "jobs_events_total", "Поставленные, выполненные, устаревшие и отклоненные задачи", "counter", "queue",
+        {"analyze": {k: stats[k] for k in ("submitted", "done", "failed", "expired", "rejected")}}
+    )
+    lines += stats_lines(
+        "jobs_current", "Задачи в очереди, в работе и хранящиеся", "gauge", "queue",
+        {"analyze": {k: stats[k] for k in ("pending", "running", "stored")}}, key_label="state"
+    )
+    return lines
+
+
+register_collector(_job_stats)
@@ -0,0 +1,106 @@
+"""
+Инкрементальный разбор JSON ответа LLM: элементы массива отдаются по мере генерации
+"""
+
+import json
+from typing import Any, List
+
+
+class JsonArrayStream:
+    """
+    Находит в потоке фрагментов JSON массив по ключу (например, "questions")
+    и возвращает его элементы, как только каждый из них полностью получен.
+    Текст вокруг JSON (пояснения, markdown-блок) не мешает разбору
+    """
+
+    def __init__(self, key: str):
+        """
+        Args:
+            key (str): Ключ массива в JSON объекте
+        """
+        self._key = json.dumps(key)
+        self._text = ""
+        self._pos = 0
+        # Стадии: поиск ключа, поиск начала массива, элементы массива, массив закончился
+        self._stage = "key"
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item_start = 0
+
+    @property
+    def done(self) -> bool:
+        """Массив полностью получен"""
+        return self._stage == "done"
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Добавляет фрагмент ответа
+
+        Args:
+            chunk (str): Очередной фрагмент текста
+
+        Returns:
+            List[Any]: Элементы массива, завершенные в этом фрагменте
+        """
+        self._text += chunk
+        items = []
+
+        if self._stage == "key":
+            index = self._text.find(self._key, self._pos)
+            if index < 0:
+                # Ключ может быть разрезан между фрагментами
+                self._pos = max(0, len(self._text) - len(self._key))
+                return items
+            self._pos = index + len(self._key)
+            self._stage = "array"
+
+        if self._stage == "array":
+            while self._pos < len(self._text) and self._text[self._pos] in " \t\r\n:":
+                self._pos += 1
+            if self._pos >= len(self._text):
+                return items
+            if self._text[self._pos] != "[":
+                # После ключа не массив - ищем следующее вхождение ключа
+                self._stage = "key"
+                return items + self.feed("")
+            self._pos += 1
+            self._item_start = self._pos
+            self._stage = "items"
+
+        if self._stage == "items":
+            items.extend(self._scan_items())
+        return items
+
+    def _scan_items(self) -> List[Any]:
+        items = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}" and self._depth > 0:
+                self._depth -= 1
+            elif char in ",]" and self._depth == 0:
+                item = text[self._item_start:i].strip()
+                if item:
+                    try:
+                        items.append(json.loads(item))
+                    except json.JSONDecodeError:
+                        pass
+                self._item_start = i + 1
+                if char == "]":
+                    self._stage = "done"
+                    self._pos = i + 1
+                    return items
+        self._pos = len(text)
+        return items
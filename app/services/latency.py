@@ -0,0 +1,102 @@
+"""
+Сбор статистики задержек по скользящему окну измерений
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+class LatencyStats:
+    """
+    Хранит последние измерения задержки и считает по ним перцентили
+    """
+
+    def __init__(self, window: int = 1000):
+        """
+        Инициализация статистики
+
+        Args:
+            window (int): Количество последних измерений, по которым считаются перцентили
+        """
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        """
+        Добавляет измерение
+
+        Args:
+            seconds (float): Задержка в секундах
+        """
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Возвращает перцентиль по окну измерений
+
+        Args:
+            q (float): Перцентиль от 0 до 100
+
+        Returns:
+            Optional[float]: Значение перцентиля или None, если измерений нет
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """
+        Возвращает сводку: количество, среднее, p50, p95 и p99
+
+        Returns:
+            Dict[str, Optional[float]]: Сводка в секундах
+        """
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+# Именованные статистики, общие для всего процесса
+_registry: Dict[str, LatencyStats] = {}
+_registry_lock = threading.Lock()
+
+
+def get_latency_stats(name: str) -> LatencyStats:
+    """
+    Возвращает (и при необходимости создает) статистику задержек по имени
+
+    Args:
+        name (str): Имя метрики
+
+    Returns:
+        LatencyStats: Статистика задержек
+    """
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = LatencyStats()
+        return _registry[name]
+
+
+def all_latency_stats() -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    Возвращает сводки всех зарегистрированных статистик
+
+    Returns:
+        Dict[str, Dict[str, Optional[float]]]: Сводки по именам
+    """
+    with _registry_lock:
+        names = list(_registry)
+    return {name: _registry[name].summary() for name in names}
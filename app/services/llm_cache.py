@@ -0,0 +1,314 @@
+"""
+Кэш ответов LLM с адресацией по содержимому запроса
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, max_tokens: int, system_prompt: str, user_prompt: str) -> str:
+    """
+    Строит ключ кэша как хэш параметров запроса
+
+    Args:
+        model (str): Модель LLM
+        max_tokens (int): Максимальное количество токенов
+        system_prompt (str): Системный промпт
+        user_prompt (str): Пользовательский промпт
+
+    Returns:
+        str: SHA-256 хэш запроса
+    """
+    payload = json.dumps([model, max_tokens, system_prompt, user_prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Раз в сколько записей на диск удаляются устаревшие строки и лишние сверх max_disk_rows
+DISK_PRUNE_INTERVAL = 256
+
+
+class LLMResponseCache:
+    """
+    Двухуровневый кэш ответов LLM: LRU в памяти с TTL и ограничением по байтам
+    и необязательный уровень на диске (sqlite), переживающий перезапуск
+    """
+
+    def __init__(self, ttl: float = 3600, max_bytes: int = 32 * 1024 * 1024, db_path: Optional[str] = None,
+                 max_disk_rows: int = 100000):
+        """
+        Инициализация кэша
+
+        Args:
+            ttl (float): Время жизни записи в секундах
+            max_bytes (int): Максимальный размер кэша в памяти в байтах
+            db_path (Optional[str]): Путь к файлу sqlite для дискового уровня
+            max_disk_rows (int): Максимум записей на диске (0 - без ограничения), лишние
+                удаляются, начиная с ближайших к устареванию
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.db_path = db_path
+        self.max_disk_rows = max_disk_rows
+        self._disk_writes = 0
+
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "disk_expired": 0,
+            "disk_evictions": 0,
+        }
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, expires_at REAL, value TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_expires_at ON llm_cache (expires_at)")
+            self._db.commit()
+            # Устаревшие записи прошлых запусков
+            self._disk_prune()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Возвращает значение из кэша или None
+
+        Args:
+            key (str): Ключ кэша
+
+        Returns:
+            Optional[Any]: Закэшированный ответ
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+
+        value = self._disk_get(key)
+        if value is None:
+            self._count("misses")
+        return value
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """
+        Асинхронная версия get: обращение к диску выполняется в пуле потоков
+
+        Args:
+            key (str): Ключ кэша
+
+        Returns:
+            Optional[Any]: Закэшированный ответ
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+
+        if self._db is not None:
+            value = await asyncio.to_thread(self._disk_get, key)
+        if value is None:
+            self._count("misses")
+        return value
+
+    def set(self, key: str, value: Any):
+        """
+        Сохраняет значение в кэш
+
+        Args:
+            key (str): Ключ кэша
+            value (Any): JSON-сериализуемый ответ
+        """
+        serialized = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+        self._memory_set(key, value, len(serialized.encode("utf-8")), expires_at)
+        self._disk_set(key, serialized, expires_at)
+
+    async def aset(self, key: str, value: Any):
+        """
+        Асинхронная версия set: запись на диск выполняется в пуле потоков
+
+        Args:
+            key (str): Ключ кэша
+            value (Any): JSON-сериализуемый ответ
+        """
+        serialized = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+        self._memory_set(key, value, len(serialized.encode("utf-8")), expires_at)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, serialized, expires_at)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает счетчики попаданий и промахов
+
+        Returns:
+            Dict[str, Any]: Статистика кэша
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        return stats
+
+    def clear(self):
+        """
+        Очищает оба уровня кэша
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, size, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return value
+
+    def _memory_set(self, key: str, value: Any, size: int, expires_at: float):
+        # Слишком большие записи не вытесняют весь кэш
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats["evictions"] += 1
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        if self._db is None:
+            return None
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT expires_at, value FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+        if row[0] < time.time():
+            try:
+                with self._lock:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ? AND expires_at < ?", (key, time.time()))
+                    self._db.commit()
+                    self.stats["disk_expired"] += 1
+            except sqlite3.Error as e:
+                logger.warning(f"Не удалось удалить устаревший ответ LLM из дискового кэша: {str(e)}")
+            return None
+
+        value = json.loads(row[1])
+        self._memory_set(key, value, len(row[1].encode("utf-8")), row[0])
+        self._count("disk_hits")
+        return value
+
+    def _disk_set(self, key: str, serialized: str, expires_at: float):
+        if self._db is None:
+            return
+
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                    (key, expires_at, serialized)
+                )
+                self._db.commit()
+                self._disk_writes += 1
+                prune = self._disk_writes % DISK_PRUNE_INTERVAL == 0
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось записать ответ LLM в дисковый кэш: {str(e)}")
+            return
+        if prune:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        """
+        Удаляет с диска устаревшие записи и самые старые записи сверх max_disk_rows
+        """
+        try:
+            with self._lock:
+                expired = self._db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),)).rowcount
+                evicted = 0
+                if self.max_disk_rows > 0:
+                    excess = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] - self.max_disk_rows
+                    if excess > 0:
+                        evicted = self._db.execute(
+                            "DELETE FROM llm_cache WHERE key IN "
+                            "(SELECT key FROM llm_cache ORDER BY expires_at LIMIT ?)", (excess,)
+                        ).rowcount
+                self._db.commit()
+                self.stats["disk_expired"] += max(expired, 0)
+                self.stats["disk_evictions"] += max(evicted, 0)
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось очистить дисковый кэш ответов LLM: {str(e)}")
+
+
+# Общий кэш для всех экземпляров LLMClient
+_shared_llm_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """
+    Возвращает общий кэш ответов LLM или None, если кэш отключен.
+    Параметры берутся из переменных окружения:
+    LLM_CACHE_ENABLED, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES, LLM_CACHE_DB_PATH и LLM_CACHE_MAX_DISK_ROWS
+
+    Returns:
+        Optional[LLMResponseCache]: Общий кэш
+    """
+    global _shared_llm_cache
+
+    if _shared_llm_cache is None:
+        load_dotenv()
+
+        if os.environ.get("LLM_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+
+        _shared_llm_cache = LLMResponseCache(
+            ttl=float(os.environ.get("LLM_CACHE_TTL", "3600")),
+            max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            db_path=os.environ.get("LLM_CACHE_DB_PATH") or None,
+            max_disk_rows=int(os.environ.get("LLM_CACHE_MAX_DISK_ROWS", "100000"))
+        )
+
+    return _shared_llm_cache
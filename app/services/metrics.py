@@ -0,0 +1,376 @@
+"""
+Метрики в текстовом формате Prometheus: счетчики, гистограммы и метка эндпоинта запроса
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.services.llm_cache import get_llm_cache
+from app.services.page_cache import get_page_cache
+from app.services.rate_limiter import get_llm_scheduler
+from app.services.resilience import get_call_policy
+from app.services.singleflight import all_singleflight_stats
+
+# ASGI scope текущего HTTP запроса: из него вычисляется метка endpoint для метрик сервисов
+current_request_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "current_request_scope", default=None
+)
+
+# Трасса профилируемого HTTP запроса (см. profiling): None, если запрос не профилируется.
+# Histogram.time записывает в нее измеренные стадии как спаны
+current_trace: contextvars.ContextVar[Optional[object]] = contextvars.ContextVar("current_trace", default=None)
+
+# Границы корзин по умолчанию: от 5 мс до 60 с
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Границы корзин для размеров (байты, символы)
+SIZE_BUCKETS = (1_000, 5_000, 20_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    """
+    Базовый класс метрики с набором меток
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[Tuple[str, Sequence[Tuple[str, str]], float]]:
+        pass
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Монотонно растущий счетчик
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        """
+        Увеличивает счетчик
+
+        Args:
+            amount (float): Приращение
+            **labels: Значения меток
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма с фиксированными границами корзин
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счетчики корзин (последняя - +Inf), сумма
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        """
+        Добавляет измерение
+
+        Args:
+            value (float): Значение
+            **labels: Значения меток
+        """
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            state[0][index] += 1
+            state[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Измеряет время выполнения блока в секундах. Если запрос профилируется,
+        блок записывается в его трассу спаном с именем стадии (метка stage или имя метрики)
+
+        Args:
+            **labels: Значения меток
+        """
+        trace = current_trace.get()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(elapsed, **labels)
+            if trace is not None:
+                trace.add_span(labels.get("stage") or self.name, started, elapsed)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", labels + [("le", _format_value(float(bound)))], cumulative
+            yield f"{self.name}_count", labels, cumulative
+            yield f"{self.name}_sum", labels, total
+
+
+# Метрики HTTP запросов
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP запросы по эндпоинтам и кодам ответа", ("endpoint", "method", "status")
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP запроса до полного ответа", ("endpoint", "method")
+)
+
+# Метрики конвейера анализа сайта
+ANALYZE_STAGE_SECONDS = Histogram(
+    "analyze_stage_duration_seconds",
+    "Время стадий анализа сайта: download, extract, prompt, chat_json и total",
+    ("stage", "endpoint", "model")
+)
+ANALYZE_ERRORS = Counter("analyze_errors_total", "Неудачные анализы сайтов", ("endpoint", "model"))
+DOWNLOADED_BYTES = Counter("download_bytes_total", "Прочитано байт тела страниц", ("endpoint", "model"))
+PAGE_BYTES = Histogram("download_page_bytes", "Размер прочитанного тела страницы", ("endpoint", "model"), SIZE_BUCKETS)
+TEXT_CHARS = Histogram("extract_text_chars", "Длина извлеченного текста страницы", ("endpoint", "model"), SIZE_BUCKETS)
+QUESTIONS = Counter(
+    "analyze_questions_total", "Ответы с вопросами по источнику: llm, fallback или near_duplicate (вопросы похожей страницы)", ("source", "endpoint", "model")
+)
+
+# Метрики вызовов LLM
+LLM_REQUESTS = Counter(
+    "llm_requests_total", "Вызовы LLM по методам и результату", ("method", "outcome", "endpoint", "model")
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Токены из поля usage ответов LLM: prompt, completion или cached (часть prompt из кэша префикса провайдера)",
+    ("type", "endpoint", "model")
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "llm_queue_wait_seconds",
+    "Ожидание разрешения на запрос к LLM в очереди лимитов RPM/TPM по приоритету: interactive или batch",
+    ("priority", "endpoint"), DEFAULT_BUCKETS + (120.0,)
+)
+LLM_STREAM_SECONDS = Histogram(
+    "llm_stream_duration_seconds",
+    "Потоковые ответы LLM: время до первого фрагмента (ttft) и до конца ответа (total)",
+    ("method", "phase", "endpoint", "model")
+)
+
+_METRICS: List[_Metric] = [
+    HTTP_REQUESTS, HTTP_REQUEST_SECONDS, ANALYZE_STAGE_SECONDS, ANALYZE_ERRORS, DOWNLOADED_BYTES,
+    PAGE_BYTES, TEXT_CHARS, QUESTIONS, LLM_REQUESTS, LLM_TOKENS, LLM_QUEUE_WAIT_SECONDS, LLM_STREAM_SECONDS,
+]
+
+# Функции, возвращающие строки метрик, значения которых хранятся в самих сервисах
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register_collector(collector: Callable[[], List[str]]):
+    """
+    Регистрирует функцию, добавляющую строки метрик при каждой выгрузке
+
+    Args:
+        collector (Callable[[], List[str]]): Функция, возвращающая строки в формате Prometheus
+    """
+    _collectors.append(collector)
+
+
+def stats_lines(name: str, documentation: str, kind: str, label: str,
+                values: Dict[str, Dict[str, object]], key_label: str = "event") -> List[str]:
+    """
+    Преобразует словари счетчиков сервисов (get_stats) в строки метрики
+
+    Args:
+        name (str): Имя метрики
+        documentation (str): Описание метрики
+        kind (str): Тип метрики: counter или gauge
+        label (str): Имя метки для ключей внешнего словаря
+        values (Dict[str, Dict[str, object]]): Счетчики по значениям метки и именам событий
+        key_label (str): Имя метки для ключей внутренних словарей
+
+    Returns:
+        List[str]: Строки в формате Prometheus
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for label_value, stats in sorted(values.items()):
+        for event, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            labels = [(label, label_value), (key_label, event)]
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return lines
+
+
+# Значения get_stats кэшей, которые являются текущими размерами, а не счетчиками событий
+_SIZE_STATS = frozenset({"bytes", "entries"})
+
+
+def _service_stats() -> List[str]:
+    """
+    Счетчики кэшей, объединения запросов, политики вызовов и очереди запросов к LLM
+    """
+    caches = {}
+    for name, cache in (("llm", get_llm_cache()), ("pages", get_page_cache())):
+        if cache is not None:
+            caches[name] = cache.get_stats()
+    events = {name: {k: v for k, v in stats.items() if k not in _SIZE_STATS} for name, stats in caches.items()}
+    sizes = {name: {k: v for k, v in stats.items() if k in _SIZE_STATS} for name, stats in caches.items()}
+    lines = stats_lines("cache_events_total", "События кэшей ответов LLM и страниц", "counter", "cache", events)
+    lines += stats_lines("cache_size", "Размер кэшей: байты и записи", "gauge", "cache", sizes, key_label="kind")
+
+    coalescing = {name: {k: v for k, v in stats.items() if k != "inflight"}
+                  for name, stats in all_singleflight_stats().items()}
+    lines += stats_lines(
+        "coalescing_events_total", "Вызовы и объединенные одинаковые запросы", "counter", "group", coalescing
+    )
+
+    policy = get_call_policy().get_stats()
+    lines += stats_lines(
+        "llm_policy_events_total", "Повторы, дублирования, сбои и отказы выключателя LLM", "counter", "policy",
+        {"llm": policy}
+    )
+    lines += [
+        "# HELP llm_circuit_open Выключатель вызовов LLM разомкнут (1) или нет (0)",
+        "# TYPE llm_circuit_open gauge",
+        f"llm_circuit_open {1 if policy['breaker'] == 'open' else 0}",
+    ]
+
+    scheduler = get_llm_scheduler().get_stats()
+    lines += stats_lines(
+        "llm_scheduler_events_total", "Разрешенные, поставленные в очередь и отклоненные запросы к LLM", "counter",
+        "scheduler", {"llm": {k: scheduler[k] for k in ("granted", "queued", "shed")}}
+    )
+    lines += ["# HELP llm_queue_depth Запросы к LLM в очереди по приоритету", "# TYPE llm_queue_depth gauge"]
+    for priority, depth in sorted(scheduler["queue_depth_by_priority"].items()):
+        lines.append(f"llm_queue_depth{_format_labels([('priority', priority)])} {depth}")
+    return lines
+
+
+register_collector(_service_stats)
+
+
+def render_metrics() -> str:
+    """
+    Выгружает все метрики в текстовом формате Prometheus
+
+    Returns:
+        str: Текст для эндпоинта /metrics
+    """
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+def route_template(scope: dict) -> str:
+    """
+    Возвращает шаблон пути маршрута запроса: значения параметров пути заменяются их именами,
+    чтобы число значений метки не росло вместе с числом идентификаторов
+
+    Args:
+        scope (dict): ASGI scope запроса (после выбора маршрута)
+
+    Returns:
+        str: Шаблон пути или other, если маршрут не найден
+    """
+    if "endpoint" not in scope:
+        return "other"
+    path = scope.get("path", "")
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
+
+
+def endpoint_label() -> str:
+    """Метка endpoint текущего запроса (none вне HTTP запроса)"""
+    scope = current_request_scope.get()
+    return route_template(scope) if scope is not None else "none"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: запоминает запрос для метки endpoint в метриках сервисов
+    и считает HTTP запросы и время их обработки до конца ответа, включая потоковые
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_request_scope.set(scope)
+        status = "500"
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = route_template(scope)
+            HTTP_REQUESTS.inc(endpoint=endpoint, method=scope["method"], status=status)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=scope["method"])
+            current_request_scope.reset(token)
@@ -0,0 +1,174 @@
+"""
+Микропакеты: одновременные однотипные запросы собираются за короткое окно и выполняются одним вызовом
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.services.metrics import register_collector, stats_lines
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Собирает элементы, поступившие в течение window секунд, в пакет не больше max_items
+    элементов и max_cost суммарной стоимости (например, токенов) и передает пакет в handler.
+    Пакет отправляется, когда истекло окно или набран лимит. Элементы с разными ключами
+    (например, разные параметры запроса) в один пакет не попадают
+    """
+
+    def __init__(self, handler: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+                 window: float = 0.05, max_items: int = 8, max_cost: int = 0):
+        """
+        Инициализация сборщика
+
+        Args:
+            handler (Callable[[Hashable, List[Any]], Awaitable[List[Any]]]): Обрабатывает ключ и элементы
+                пакета и возвращает результаты в том же порядке. Исключение получают все элементы пакета
+            window (float): Сколько секунд ждать остальные элементы после первого
+            max_items (int): Максимум элементов в пакете
+            max_cost (int): Максимальная суммарная стоимость элементов пакета (0 - без ограничения)
+        """
+        self.handler = handler
+        self.window = window
+        self.max_items = max(1, max_items)
+        self.max_cost = max_cost
+        self._pending: Dict[Hashable, Tuple[List[Tuple[Any, asyncio.Future]], List[int]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._running: set = set()
+        self.stats = {
+            "items": 0,
+            "batches": 0,
+            "full": 0,
+            "window": 0,
+        }
+
+    async def submit(self, key: Hashable, item: Any, cost: int = 0) -> Any:
+        """
+        Добавляет элемент в пакет и ждет его результат
+
+        Args:
+            key (Hashable): Ключ пакета
+            item (Any): Элемент
+            cost (int): Стоимость элемента для лимита max_cost
+
+        Returns:
+            Any: Результат обработки элемента
+        """
+        loop = asyncio.get_running_loop()
+        self.stats["items"] += 1
+
+        pending = self._pending.get(key)
+        if pending is not None and self.max_cost and sum(pending[1]) + cost > self.max_cost:
+            # Элемент не помещается: текущий пакет уходит, не дожидаясь окна
+            self._flush(key, "full")
+            pending = None
+        if pending is None:
+            pending = self._pending[key] = ([], [])
+            self._timers[key] = loop.call_later(self.window, self._flush, key, "window")
+
+        future = loop.create_future()
+        pending[0].append((item, future))
+        pending[1].append(cost)
+        if len(pending[0]) >= self.max_items or (self.max_cost and sum(pending[1]) >= self.max_cost):
+            self._flush(key, "full")
+
+        # Отмена ожидающего не отменяет пакет для остальных элементов
+        return await asyncio.shield(future)
+
+    def _flush(self, key: Hashable, reason: str):
+        pending = self._pending.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if pending is None:
+            return
+        self.stats["batches"] += 1
+        self.stats[reason] += 1
+        task = asyncio.ensure_future(self._run(key, pending[0]))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self.handler(key, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise Exception(f"Обработчик пакета вернул {len(results)} результатов вместо {len(batch)}")
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        except BaseException as e:
+            # Отмена или остановка: ожидающие элементы получают ошибку, а не ждут вечно
+            self._fail(batch, Exception(f"Обработка пакета прервана: {type(e).__name__}"))
+            raise
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Any, asyncio.Future]], error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает счетчики элементов и пакетов
+
+        Returns:
+            Dict[str, Any]: Элементы, пакеты (отправленные по лимиту и по окну), средний размер пакета
+        """
+        stats = dict(self.stats)
+        stats["avg_batch_size"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["pending"] = sum(len(items) for items, _ in self._pending.values())
+        return stats
+
+
+# Именованные сборщики для статистики и /metrics
+_batchers: Dict[str, MicroBatcher] = {}
+
+
+def register_micro_batcher(name: str, batcher: MicroBatcher) -> MicroBatcher:
+    """
+    Регистрирует сборщик под именем для статистики (заменяет прежний с тем же именем)
+
+    Args:
+        name (str): Имя сборщика
+        batcher (MicroBatcher): Сборщик
+
+    Returns:
+        MicroBatcher: Тот же сборщик
+    """
+    _batchers[name] = batcher
+    return batcher
+
+
+def all_micro_batch_stats(name: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Возвращает счетчики зарегистрированных сборщиков
+
+    Args:
+        name (Optional[str]): Имя сборщика (по умолчанию все)
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Счетчики по именам сборщиков
+    """
+    return {key: batcher.get_stats() for key, batcher in _batchers.items() if name in (None, key)}
+
+
+def _micro_batch_stats() -> List[str]:
+    """
+    Элементы и пакеты сборщиков микропакетов
+    """
+    if not _batchers:
+        return []
+    stats = all_micro_batch_stats()
+    return stats_lines(
+        "micro_batch_events_total", "Элементы и пакеты сборщиков (full - по лимиту, window - по окну)",
+        "counter", "batcher", {name: {k: s[k] for k in ("items", "batches", "full", "window")} for name, s in stats.items()}
+    )
+
+
+register_collector(_micro_batch_stats)
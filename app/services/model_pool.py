@@ -0,0 +1,414 @@
+"""
+Пул моделей LLM: маршрутизация запросов по типу задачи, веса, переключение
+на следующую модель при сбоях и нарушении SLO по задержке
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+from app.services.latency import LatencyStats
+from app.services.metrics import register_collector, stats_lines
+from app.services.resilience import CircuitBreaker, CircuitOpenError, is_retryable
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Типы задач, по которым маршрутизируются запросы
+TASK_CHAT = "chat"
+TASK_JSON = "json"
+TASK_QUESTIONS = "questions"
+
+
+class ModelEndpoint:
+    """
+    Запись пула: модель, адрес API и живая статистика задержек и сбоев
+    """
+
+    def __init__(self, name: str, model: str, base_url: str, api_key: str, weight: float = 1.0,
+                 tasks: Optional[List[str]] = None, slo: Optional[float] = None, timeout: Optional[float] = None,
+                 window: int = 100, min_samples: int = 10, recovery: float = 60.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Инициализация записи
+
+        Args:
+            name (str): Имя записи для статистики
+            model (str): Модель
+            base_url (str): Адрес OpenAI-совместимого API
+            api_key (str): Ключ API
+            weight (float): Доля запросов среди здоровых записей задачи
+            tasks (Optional[List[str]]): Типы задач записи ("*" - любые)
+            slo (Optional[float]): Целевой p95 задержки в секундах; при превышении запись уходит в резерв
+            timeout (Optional[float]): Максимальное время попытки, после которого запрос уходит следующей записи
+            window (int): Сколько последних задержек учитывается в p95
+            min_samples (int): Сколько измерений нужно, чтобы судить о нарушении SLO
+            recovery (float): Через сколько секунд запись в резерве снова получает запросы
+            breaker (Optional[CircuitBreaker]): Выключатель записи
+        """
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.weight = weight
+        self.tasks = set(tasks or ["*"])
+        self.slo = slo
+        self.timeout = timeout
+        self.window = window
+        self.min_samples = min_samples
+        self.recovery = recovery
+        self.breaker = breaker or CircuitBreaker()
+        # Типы response_format, которые модель записи отклонила: запросы к ней идут в более простом режиме
+        self.unsupported_formats: set = set()
+        self.latency = LatencyStats(window=window)
+        self._degraded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "failures": 0,
+            "failovers": 0,
+            "slo_breaches": 0,
+        }
+
+    def serves(self, task: str) -> bool:
+        return "*" in self.tasks or task in self.tasks
+
+    def healthy(self) -> bool:
+        """
+        Проверяет, что выключатель записи замкнут и p95 задержки укладывается в SLO.
+        Запись с нарушенным SLO через recovery секунд получает новую выборку задержек
+
+        Returns:
+            bool: True, если запись может быть основной для запроса
+        """
+        if self.breaker.is_open():
+            return False
+        if self.slo is None or self.latency.count < self.min_samples:
+            return True
+
+        with self._lock:
+            p95 = self.latency.percentile(95)
+            if p95 is None or p95 <= self.slo:
+                self._degraded_at = None
+                return True
+            now = time.monotonic()
+            if self._degraded_at is None:
+                self._degraded_at = now
+                self.stats["slo_breaches"] += 1
+                logger.warning(f"Модель {self.name}: p95 {p95:.2f} с превышает SLO {self.slo} с, запись в резерве")
+                return False
+            if now - self._degraded_at < self.recovery:
+                return False
+            # Старые задержки больше не показательны - оцениваем запись заново
+            self.latency = LatencyStats(window=self.window)
+            self._degraded_at = None
+            return True
+
+    def record_success(self, elapsed: float):
+        self.latency.observe(elapsed)
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self.breaker.record_failure()
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Возвращает счетчики записи, перцентили задержки и состояние
+
+        Returns:
+            Dict[str, object]: Статистика записи
+        """
+        stats: Dict[str, object] = dict(self.stats)
+        stats.update({
+            "model": self.model,
+            "weight": self.weight,
+            "tasks": sorted(self.tasks),
+            "slo": self.slo,
+            "p50": self.latency.percentile(50),
+            "p95": self.latency.percentile(95),
+            "healthy": self.healthy(),
+            "breaker": self.breaker.state,
+            "unsupported_formats": sorted(self.unsupported_formats),
+        })
+        return stats
+
+
+class ModelPool:
+    """
+    Выбирает запись пула для запроса: среди здоровых записей задачи - случайно с учетом весов
+    (записи, явно указавшие задачу, важнее записей "*"), остальные записи задачи образуют
+    порядок переключения при сбое
+    """
+
+    def __init__(self, entries: List[ModelEndpoint]):
+        """
+        Args:
+            entries (List[ModelEndpoint]): Записи пула; первая используется по умолчанию
+        """
+        if not entries:
+            raise ValueError("Пул моделей пуст")
+        self.entries = entries
+        self.stats = {"requests": 0, "failovers": 0, "exhausted": 0}
+
+    @classmethod
+    def from_env(cls) -> "ModelPool":
+        """
+        Создает пул из LLM_MODEL_POOL - JSON списка записей вида
+        {"name": "mini", "model": "gpt-4o-mini", "weight": 3, "tasks": ["questions", "json"],
+        "slo": 3, "timeout": 10, "base_url": "...", "api_key_env": "OPENAI_API_KEY"}.
+        Без LLM_MODEL_POOL пул состоит из одной записи OPENAI_MODEL / OPENAI_BASE_URL.
+        Общие параметры: LLM_POOL_MIN_SAMPLES, LLM_POOL_RECOVERY, LLM_BREAKER_FAILURES,
+        LLM_BREAKER_RESET_TIMEOUT
+
+        Returns:
+            ModelPool: Пул моделей
+        """
+        load_dotenv()
+        api_key = os.environ.get("OPENAI_API_KEY", "")
+        base_url = os.environ.get("OPENAI_BASE_URL", "https://openai.api.proxyapi.ru/v1")
+        model = os.environ.get("OPENAI_MODEL", "gpt-4o")
+        min_samples = int(os.environ.get("LLM_POOL_MIN_SAMPLES", "10"))
+        recovery = float(os.environ.get("LLM_POOL_RECOVERY", "60"))
+        breaker_failures = max(1, int(os.environ.get("LLM_BREAKER_FAILURES", "5")))
+        breaker_reset = float(os.environ.get("LLM_BREAKER_RESET_TIMEOUT", "30"))
+
+        config = os.environ.get("LLM_MODEL_POOL", "").strip()
+        try:
+            items = json.loads(config) if config else [{"model": model}]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"LLM_MODEL_POOL не является корректным JSON: {str(e)}")
+
+        entries = []
+        for item in items:
+            entries.append(ModelEndpoint(
+                name=item.get("name", item["model"]),
+                model=item["model"],
+                base_url=item.get("base_url", base_url),
+                api_key=os.environ.get(item["api_key_env"], "") if "api_key_env" in item else api_key,
+                weight=float(item.get("weight", 1.0)),
+                tasks=item.get("tasks"),
+                slo=item.get("slo"),
+                timeout=item.get("timeout"),
+                min_samples=min_samples,
+                recovery=recovery,
+                breaker=CircuitBreaker(breaker_failures, breaker_reset)
+            ))
+        return cls(entries)
+
+    @property
+    def default(self) -> ModelEndpoint:
+        return self.entries[0]
+
+    def route_key(self, task: str) -> str:
+        """
+        Возвращает ключ маршрута задачи для кэша ответов: он не зависит от того,
+        какая запись пула ответила на конкретный запрос
+
+        Args:
+            task (str): Тип задачи
+
+        Returns:
+            str: Модели задачи через "|"
+        """
+        return "|".join(sorted({entry.model for entry in self._entries_for(task)}))
+
+    def _entries_for(self, task: str) -> List[ModelEndpoint]:
+        return [entry for entry in self.entries if entry.serves(task)] or self.entries
+
+    def route(self, task: str) -> List[ModelEndpoint]:
+        """
+        Порядок записей для запроса. Записи, явно обслуживающие задачу, идут раньше записей "*":
+        в каждой группе основная выбирается среди здоровых с учетом весов, затем остальные
+        здоровые по убыванию веса. Записи в резерве идут последними по возрастанию p95
+
+        Args:
+            task (str): Тип задачи
+
+        Returns:
+            List[ModelEndpoint]: Записи в порядке попыток
+        """
+        entries = self._entries_for(task)
+        specific = [entry for entry in entries if task in entry.tasks]
+        groups = [specific, [entry for entry in entries if entry not in specific]]
+
+        ordered, degraded = [], []
+        for group in groups:
+            healthy = [entry for entry in group if entry.healthy()]
+            degraded += [entry for entry in group if entry not in healthy]
+            if healthy:
+                primary = random.choices(healthy, weights=[entry.weight for entry in healthy])[0]
+                ordered.append(primary)
+                ordered += sorted((e for e in healthy if e is not primary), key=lambda e: -e.weight)
+        ordered += sorted(degraded, key=lambda e: e.latency.percentile(95) or float("inf"))
+        return ordered
+
+    def call(self, task: str, fn: Callable[[ModelEndpoint, Optional[float]], T], timeout: Optional[float]) -> T:
+        """
+        Выполняет блокирующий запрос к записям пула по очереди до первого успеха
+
+        Args:
+            task (str): Тип задачи
+            fn (Callable[[ModelEndpoint, Optional[float]], T]): Запрос к записи с таймаутом попытки
+            timeout (Optional[float]): Общее время на все записи в секундах
+
+        Returns:
+            T: Результат первого успешного запроса
+
+        Raises:
+            CircuitOpenError: Если выключатели всех записей разомкнуты
+        """
+        expires = time.monotonic() + timeout if timeout is not None else None
+        error: Optional[Exception] = None
+        for index, endpoint in enumerate(self._candidates(task)):
+            attempt_timeout = self._attempt_timeout(endpoint, expires)
+            if attempt_timeout is not None and attempt_timeout <= 0:
+                # allow() мог занять пробный вызов полуоткрытого выключателя - освобождаем его
+                endpoint.breaker.release()
+                break
+            self._count(endpoint, index)
+            started = time.perf_counter()
+            try:
+                result = fn(endpoint, attempt_timeout)
+            except Exception as e:
+                error = self._on_error(endpoint, e)
+                continue
+            except BaseException:
+                endpoint.breaker.release()
+                raise
+            endpoint.record_success(time.perf_counter() - started)
+            return result
+        raise self._exhausted(error)
+
+    async def acall(self, task: str, fn: Callable[[ModelEndpoint, Optional[float]], Awaitable[T]],
+                    timeout: Optional[float]) -> T:
+        """
+        Выполняет асинхронный запрос к записям пула по очереди до первого успеха (см. call)
+
+        Args:
+            task (str): Тип задачи
+            fn (Callable[[ModelEndpoint, Optional[float]], Awaitable[T]]): Фабрика корутины запроса к записи
+            timeout (Optional[float]): Общее время на все записи в секундах
+
+        Returns:
+            T: Результат первого успешного запроса
+
+        Raises:
+            CircuitOpenError: Если выключатели всех записей разомкнуты
+        """
+        expires = time.monotonic() + timeout if timeout is not None else None
+        error: Optional[Exception] = None
+        for index, endpoint in enumerate(self._candidates(task)):
+            attempt_timeout = self._attempt_timeout(endpoint, expires)
+            if attempt_timeout is not None and attempt_timeout <= 0:
+                # allow() мог занять пробный вызов полуоткрытого выключателя - освобождаем его
+                endpoint.breaker.release()
+                break
+            self._count(endpoint, index)
+            started = time.perf_counter()
+            try:
+                result = await fn(endpoint, attempt_timeout)
+            except asyncio.CancelledError:
+                endpoint.breaker.release()
+                raise
+            except Exception as e:
+                error = self._on_error(endpoint, e)
+                continue
+            endpoint.record_success(time.perf_counter() - started)
+            return result
+        raise self._exhausted(error)
+
+    def _candidates(self, task: str):
+        self.stats["requests"] += 1
+        for endpoint in self.route(task):
+            if endpoint.breaker.allow():
+                yield endpoint
+
+    def _count(self, endpoint: ModelEndpoint, index: int):
+        endpoint.stats["requests"] += 1
+        if index > 0:
+            endpoint.stats["failovers"] += 1
+            self.stats["failovers"] += 1
+
+    @staticmethod
+    def _attempt_timeout(endpoint: ModelEndpoint, expires: Optional[float]) -> Optional[float]:
+        remaining = expires - time.monotonic() if expires is not None else None
+        if endpoint.timeout is None:
+            return remaining
+        return min(remaining, endpoint.timeout) if remaining is not None else endpoint.timeout
+
+    @staticmethod
+    def _on_error(endpoint: ModelEndpoint, error: Exception) -> Exception:
+        """
+        Учитывает сбой записи. Временная ошибка или таймаут - повод переключиться на следующую запись,
+        ошибка запроса (например, 400) возвращается вызывающему коду сразу
+        """
+        if not is_retryable(error):
+            endpoint.breaker.release()
+            raise error
+        endpoint.record_failure()
+        logger.warning(f"Модель {endpoint.name} не ответила, переключение на следующую: {str(error)}")
+        return error
+
+    def _exhausted(self, error: Optional[Exception]) -> Exception:
+        self.stats["exhausted"] += 1
+        if error is not None:
+            return error
+        return CircuitOpenError("Все модели пула временно недоступны (выключатели разомкнуты)")
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Возвращает счетчики пула и статистику каждой записи
+
+        Returns:
+            Dict[str, object]: Счетчики пула и записи по именам
+        """
+        return {**self.stats, "entries": {entry.name: entry.get_stats() for entry in self.entries}}
+
+
+_pool: Optional[ModelPool] = None
+
+
+def get_model_pool() -> ModelPool:
+    """
+    Возвращает общий для процесса пул моделей
+
+    Returns:
+        ModelPool: Пул моделей
+    """
+    global _pool
+
+    if _pool is None:
+        _pool = ModelPool.from_env()
+    return _pool
+
+
+def _pool_stats() -> List[str]:
+    """
+    Запросы, сбои и переключения записей пула, их p95 и состояние
+    """
+    if _pool is None:
+        return []
+    entries = {entry.name: entry for entry in _pool.entries}
+    lines = stats_lines(
+        "llm_pool_events_total", "Запросы, сбои, переключения и нарушения SLO записей пула моделей", "counter",
+        "entry", {name: entry.stats for name, entry in entries.items()}
+    )
+    lines += stats_lines(
+        "llm_pool_entry", "Состояние записей пула: здорова (1/0) и p95 задержки в секундах", "gauge", "entry",
+        {name: {"healthy": int(entry.healthy()), "p95_seconds": entry.latency.percentile(95) or 0.0}
+         for name, entry in entries.items()},
+        key_label="kind"
+    )
+    return lines
+
+
+register_collector(_pool_stats)
@@ -0,0 +1,362 @@
+"""
+Канонизация URL и индекс почти одинаковых страниц (SimHash) для повторного использования анализов
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, quote, urldefrag, urlencode, urlsplit, urlunsplit
+
+from dotenv import load_dotenv
+
+from app.services.metrics import register_collector, stats_lines
+
+logger = logging.getLogger(__name__)
+
+
+# Параметры запроса, которые не влияют на содержимое страницы (метки рекламы и аналитики).
+# Общие имена вроде ref сюда не входят: на многих сайтах это настоящий параметр (ветка, артикул)
+TRACKING_PARAMS = frozenset({
+    "_openstat", "_ga", "_gl", "dclid", "fbclid", "gclid", "gclsrc", "igshid", "mc_cid", "mc_eid",
+    "msclkid", "ref_src", "roistat", "utm", "wbraid", "gbraid", "yclid", "ysclid",
+})
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Разрядность отпечатка SimHash
+FINGERPRINT_BITS = 64
+
+# Сколько слов в шингле (перекрывающейся последовательности слов)
+SHINGLE_WORDS = 3
+
+# Страницы короче этого числа шинглов не индексируются: отпечаток короткого текста неустойчив
+MIN_SHINGLES = 20
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Приводит URL к каноническому виду: схема и хост в нижнем регистре, без порта по умолчанию
+    и фрагмента, без меток рекламы и аналитики (utm_*, gclid, yclid...), параметры отсортированы.
+    Варианты одной страницы с разными метками получают один и тот же URL
+
+    Args:
+        url (str): URL страницы
+
+    Returns:
+        str: Канонический URL (исходный, если его не удалось разобрать)
+    """
+    try:
+        parts = urlsplit(urldefrag(url.strip())[0])
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+    netloc = host if port is None or port == _DEFAULT_PORTS[scheme] else f"{host}:{port}"
+    if parts.username or parts.password:
+        netloc = f"{parts.netloc.rsplit('@', 1)[0]}@{netloc}"
+
+    params = [
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if name.lower() not in TRACKING_PARAMS and not name.lower().startswith(TRACKING_PREFIXES)
+    ]
+    query = urlencode(sorted(params), quote_via=quote)
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def simhash(text: str) -> Optional[int]:
+    """
+    Вычисляет 64-битный отпечаток SimHash текста по шинглам из SHINGLE_WORDS слов.
+    У почти одинаковых текстов отпечатки отличаются в небольшом числе бит
+
+    Args:
+        text (str): Текст страницы
+
+    Returns:
+        Optional[int]: Отпечаток или None, если текст слишком короткий
+    """
+    words = _WORD_RE.findall(text.lower())
+    shingles = Counter(map(" ".join, zip(*(words[i:] for i in range(SHINGLE_WORDS)))))
+    total = sum(shingles.values())
+    if total < MIN_SHINGLES:
+        return None
+
+    # Хэши всех шинглов (с повторами по весу) склеиваются в одну строку байт: срез [i::8] дает
+    # i-й байт каждого хэша, и частоты его значений считаются на C, а не по 64 битам в Python
+    digests = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=FINGERPRINT_BITS // 8).digest() * weight
+        for shingle, weight in shingles.items()
+    )
+    fingerprint = 0
+    for position in range(FINGERPRINT_BITS // 8):
+        values = Counter(digests[position::FINGERPRINT_BITS // 8])
+        for bit in range(8):
+            ones = sum(count for value, count in values.items() if value >> bit & 1)
+            if ones * 2 > total:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+
+class NearDuplicateEntry:
+    """
+    Проанализированная страница в индексе: канонический URL, отпечаток и вопросы
+    """
+
+    __slots__ = ("url", "fingerprint", "questions", "created_at")
+
+    def __init__(self, url: str, fingerprint: int, questions: List[str], created_at: float):
+        self.url = url
+        self.fingerprint = fingerprint
+        self.questions = questions
+        self.created_at = created_at
+
+
+class NearDuplicateIndex:
+    """
+    Индекс отпечатков SimHash проанализированных страниц с поиском по расстоянию Хэмминга.
+    Отпечаток делится на max_distance + 1 полос: у отпечатков на расстоянии не больше
+    max_distance хотя бы одна полоса совпадает, поэтому кандидаты ищутся по словарям полос,
+    а не перебором. LRU в памяти с TTL и необязательное хранение в sqlite
+    """
+
+    def __init__(self, max_distance: int = 3, max_entries: int = 10000, ttl: float = 86400,
+                 db_path: Optional[str] = None):
+        """
+        Инициализация индекса
+
+        Args:
+            max_distance (int): Максимальное число различающихся бит отпечатков почти одинаковых страниц
+            max_entries (int): Максимальное количество страниц в индексе
+            ttl (float): Сколько секунд вопросы страницы можно использовать повторно
+            db_path (Optional[str]): Путь к файлу sqlite, чтобы индекс переживал перезапуск
+        """
+        self.max_distance = max(0, min(max_distance, FINGERPRINT_BITS // 2))
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+
+        bands = self.max_distance + 1
+        width = FINGERPRINT_BITS // bands
+        # Сдвиг и маска каждой полосы, последняя забирает оставшиеся биты
+        self._bands = [
+            (i * width, (1 << (width if i < bands - 1 else FINGERPRINT_BITS - i * width)) - 1) for i in range(bands)
+        ]
+        self._entries: "OrderedDict[str, NearDuplicateEntry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, int], Set[str]] = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "added": 0,
+            "evictions": 0,
+            "expired": 0,
+            "avoided_llm_calls": 0,
+        }
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicates "
+                "(url TEXT PRIMARY KEY, fingerprint TEXT, questions TEXT, created_at REAL)"
+            )
+            self._db.commit()
+            self._load()
+
+    def lookup(self, fingerprint: int) -> Optional[Tuple[NearDuplicateEntry, int]]:
+        """
+        Ищет ближайшую проанализированную страницу в пределах max_distance
+
+        Args:
+            fingerprint (int): Отпечаток SimHash страницы
+
+        Returns:
+            Optional[Tuple[NearDuplicateEntry, int]]: Страница и расстояние в битах или None
+        """
+        deadline = time.time() - self.ttl
+        with self._lock:
+            self.stats["lookups"] += 1
+            candidates = set()
+            for band, key in enumerate(self._band_keys(fingerprint)):
+                candidates |= self._buckets.get((band, key), set())
+
+            best, best_distance = None, self.max_distance + 1
+            for url in candidates:
+                entry = self._entries[url]
+                if entry.created_at < deadline:
+                    self._remove(url)
+                    self.stats["expired"] += 1
+                    continue
+                distance = bin(entry.fingerprint ^ fingerprint).count("1")
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best.url)
+            self.stats["hits"] += 1
+            return best, best_distance
+
+    def add(self, url: str, fingerprint: int, questions: List[str]):
+        """
+        Добавляет проанализированную страницу (заменяет запись с тем же URL)
+
+        Args:
+            url (str): Канонический URL страницы
+            fingerprint (int): Отпечаток SimHash
+            questions (List[str]): Вопросы, сгенерированные LLM
+        """
+        entry = NearDuplicateEntry(url, fingerprint, list(questions), time.time())
+        with self._lock:
+            self._put(entry)
+            self.stats["added"] += 1
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(next(iter(self._entries)))
+                self._remove(evicted[-1])
+                self.stats["evictions"] += 1
+        self._disk_save(entry, evicted)
+
+    def count_avoided(self):
+        """
+        Учитывает запрос к LLM, который не понадобился благодаря найденной странице
+        """
+        with self._lock:
+            self.stats["avoided_llm_calls"] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Возвращает счетчики поиска и размер индекса
+
+        Returns:
+            Dict[str, int]: Статистика индекса
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        return [fingerprint >> shift & mask for shift, mask in self._bands]
+
+    def _put(self, entry: NearDuplicateEntry):
+        # Вызывается под блокировкой
+        if entry.url in self._entries:
+            self._remove(entry.url)
+        self._entries[entry.url] = entry
+        for band, key in enumerate(self._band_keys(entry.fingerprint)):
+            self._buckets.setdefault((band, key), set()).add(entry.url)
+
+    def _remove(self, url: str):
+        # Вызывается под блокировкой
+        entry = self._entries.pop(url)
+        for band, key in enumerate(self._band_keys(entry.fingerprint)):
+            bucket = self._buckets[(band, key)]
+            bucket.discard(url)
+            if not bucket:
+                del self._buckets[(band, key)]
+
+    def _load(self):
+        """
+        Загружает из sqlite последние max_entries неустаревших страниц
+        """
+        try:
+            rows = self._db.execute(
+                "SELECT url, fingerprint, questions, created_at FROM near_duplicates "
+                "WHERE created_at >= ? ORDER BY created_at DESC LIMIT ?",
+                (time.time() - self.ttl, self.max_entries)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось загрузить индекс похожих страниц: {str(e)}")
+            return
+        with self._lock:
+            for url, fingerprint, questions, created_at in reversed(rows):
+                self._put(NearDuplicateEntry(url, int(fingerprint, 16), json.loads(questions), created_at))
+        logger.info(f"Индекс похожих страниц загружен: {len(rows)} страниц")
+
+    def _disk_save(self, entry: NearDuplicateEntry, evicted: List[str]):
+        if self._db is None:
+            return
+
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO near_duplicates (url, fingerprint, questions, created_at) VALUES (?, ?, ?, ?)",
+                    (entry.url, f"{entry.fingerprint:016x}", json.dumps(entry.questions, ensure_ascii=False),
+                     entry.created_at)
+                )
+                self._db.executemany("DELETE FROM near_duplicates WHERE url = ?", [(url,) for url in evicted])
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось записать страницу в индекс похожих страниц: {str(e)}")
+
+
+# Общий индекс для всех экземпляров SiteAnalyzer
+_shared_index: Optional[NearDuplicateIndex] = None
+
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """
+    Возвращает общий индекс похожих страниц или None, если он отключен.
+    Параметры берутся из переменных окружения: NEAR_DUP_ENABLED, NEAR_DUP_MAX_DISTANCE,
+    NEAR_DUP_MAX_ENTRIES, NEAR_DUP_TTL и NEAR_DUP_DB_PATH
+
+    Returns:
+        Optional[NearDuplicateIndex]: Общий индекс
+    """
+    global _shared_index
+
+    if _shared_index is None:
+        load_dotenv()
+
+        if os.environ.get("NEAR_DUP_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+
+        _shared_index = NearDuplicateIndex(
+            max_distance=int(os.environ.get("NEAR_DUP_MAX_DISTANCE", "3")),
+            max_entries=int(os.environ.get("NEAR_DUP_MAX_ENTRIES", "10000")),
+            ttl=float(os.environ.get("NEAR_DUP_TTL", "86400")),
+            db_path=os.environ.get("NEAR_DUP_DB_PATH") or None
+        )
+
+    return _shared_index
+
+
+def _near_duplicate_stats() -> List[str]:
+    """
+    Поиск похожих страниц и сэкономленные запросы к LLM
+    """
+    if _shared_index is None:
+        return []
+    stats = _shared_index.get_stats()
+    lines = stats_lines(
+        "near_duplicate_events_total", "Поиск похожих страниц: попадания, промахи, добавленные, "
+        "вытесненные и устаревшие записи и сэкономленные запросы к LLM", "counter", "index",
+        {"pages": {k: v for k, v in stats.items() if k != "entries"}}
+    )
+    lines += stats_lines(
+        "near_duplicate_entries", "Страниц в индексе похожих страниц", "gauge", "index",
+        {"pages": {"entries": stats["entries"]}}, key_label="state"
+    )
+    return lines
+
+
+register_collector(_near_duplicate_stats)
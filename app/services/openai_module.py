@@ -1,8 +1,115 @@
 import os
 import json
-from openai import OpenAI
+import time
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Tuple, Type
+from openai import OpenAI, AsyncOpenAI, BadRequestError, DefaultAsyncHttpxClient, DEFAULT_CONNECTION_LIMITS, Timeout
+from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
 
+from app.services.llm_cache import get_llm_cache, make_cache_key
+from app.services.latency import get_latency_stats
+from app.services.singleflight import get_singleflight
+from app.services.resilience import CircuitOpenError, get_call_policy
+from app.services.rate_limiter import OverloadedError, PRIORITY_BATCH, PRIORITY_INTERACTIVE, PRIORITY_NAMES, get_llm_scheduler
+from app.services.content_selector import ContentSelector
+from app.services.metrics import LLM_QUEUE_WAIT_SECONDS, LLM_REQUESTS, LLM_STREAM_SECONDS, LLM_TOKENS, endpoint_label
+from app.services.profiling import span
+from app.services.json_stream import JsonArrayStream
+from app.services.model_pool import ModelEndpoint, TASK_CHAT, TASK_JSON, get_model_pool
+
+logger = logging.getLogger(__name__)
+
+
+# Признаки ошибки 400 о неподдерживаемом параметре (в отличие, например, от ошибки в самой схеме)
+UNSUPPORTED_PARAMETER_CODES = ("unsupported_parameter", "unsupported_value")
+UNSUPPORTED_MARKERS = ("not supported", "unsupported", "не поддерживается")
+
+
+def rejects_response_format(error: BadRequestError) -> bool:
+    """
+    Проверяет, что модель или прокси отклонили сам режим response_format
+    
+    Args:
+        error (BadRequestError): Ошибка 400 от API
+        
+    Returns:
+        bool: True, если запрос стоит повторить в более простом режиме
+    """
+    message = str(error).lower()
+    if getattr(error, "param", None) != "response_format" and "response_format" not in message:
+        return False
+    return getattr(error, "code", None) in UNSUPPORTED_PARAMETER_CODES or any(
+        marker in message for marker in UNSUPPORTED_MARKERS
+    )
+
+
+# Общий асинхронный HTTP клиент для всех экземпляров LLMClient
+_shared_async_http_client: Optional[DefaultAsyncHttpxClient] = None
+
+# Токены из поля usage всех ответов процесса; cached - часть prompt из кэша префикса провайдера
+_usage_stats = {
+    "responses": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+    "completion_tokens": 0,
+}
+
+
+def get_usage_stats() -> dict:
+    """
+    Возвращает расход токенов процесса и долю токенов промпта, взятых из кэша префикса провайдера
+    
+    Returns:
+        dict: Счетчики токенов и cached_ratio
+    """
+    prompt_tokens = _usage_stats["prompt_tokens"]
+    return {
+        **_usage_stats,
+        "cached_ratio": _usage_stats["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+    }
+
+
+def get_shared_async_http_client() -> DefaultAsyncHttpxClient:
+    """
+    Возвращает общий асинхронный HTTP клиент с пулом соединений к Proxy API.
+    Параметры пула берутся из переменных окружения:
+    OPENAI_POOL_MAX_CONNECTIONS, OPENAI_POOL_MAX_KEEPALIVE, OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_TIMEOUT и OPENAI_CONNECT_TIMEOUT
+    
+    Returns:
+        DefaultAsyncHttpxClient: Общий HTTP клиент
+    """
+    global _shared_async_http_client
+    
+    if _shared_async_http_client is None or _shared_async_http_client.is_closed:
+        load_dotenv()
+        
+        # Класс лимитов берем у SDK, чтобы он совпадал с его HTTP транспортом
+        limits = type(DEFAULT_CONNECTION_LIMITS)(
+            max_connections=int(os.environ.get("OPENAI_POOL_MAX_CONNECTIONS", "200")),
+            max_keepalive_connections=int(os.environ.get("OPENAI_POOL_MAX_KEEPALIVE", "50")),
+            keepalive_expiry=float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", "30"))
+        )
+        timeout = Timeout(
+            float(os.environ.get("OPENAI_TIMEOUT", "60")),
+            connect=float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+        )
+        _shared_async_http_client = DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+    
+    return _shared_async_http_client
+
+
+async def aclose_shared_async_http_client():
+    """
+    Закрывает общий асинхронный HTTP клиент и его пул соединений
+    """
+    global _shared_async_http_client
+    
+    if _shared_async_http_client is not None:
+        await _shared_async_http_client.aclose()
+        _shared_async_http_client = None
+
 
 class LLMClient:
     """
@@ -25,15 +132,103 @@ class LLMClient:
         self.system_prompt = os.environ.get("OPENAI_SYSTEM_PROMPT", "")
         self.max_tokens = int(os.environ.get("OPENAI_MAX_TOKENS", "1000"))
         
+        # Режим структурированного ответа JSON запросов: json_schema, json_object или none
+        # (только инструкция в промпте). Если модель записи пула не поддерживает режим, запросы к ней идут в следующем
+        self.response_format = os.environ.get("OPENAI_RESPONSE_FORMAT", "json_schema")
+        
+        # Сколько раз просить модель исправить невалидный JSON, прежде чем вернуть ошибку
+        self.json_repair_attempts = int(os.environ.get("OPENAI_JSON_REPAIR_ATTEMPTS", "1"))
+        
         # Проверяем наличие обязательных параметров
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY не найден в переменных окружения")
         
-        # Создаем клиент OpenAI
-        self.client = OpenAI(
+        # Синхронный клиент OpenAI создается при первом обращении (см. свойство client)
+        self._client: Optional[OpenAI] = None
+        
+        # Асинхронный клиент для вызовов из обработчиков FastAPI,
+        # работает поверх общего пула соединений.
+        # Повторы выполняет политика вызовов, поэтому встроенные повторы SDK отключены
+        self.async_client = AsyncOpenAI(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            http_client=get_shared_async_http_client(),
+            max_retries=0
         )
+        
+        # Пул моделей: выбор модели по типу задачи и переключение при сбоях (общий для процесса).
+        # Клиенты записей пула с другим адресом или ключом создаются при первом обращении
+        self.pool = get_model_pool()
+        self._endpoint_clients: dict = {}
+        self._endpoint_async_clients: dict = {}
+        
+        # Дедлайны, повторы, дублирование запросов и выключатель (общие для процесса)
+        self.policy = get_call_policy()
+        
+        # Бюджеты RPM/TPM и очередь запросов с приоритетами (общие для процесса)
+        self.scheduler = get_llm_scheduler()
+        self.token_counter = ContentSelector(self.model)
+        
+        # Общий кэш ответов chat_json (None, если отключен)
+        self.cache = get_llm_cache()
+        
+        # Объединение одновременных одинаковых JSON запросов
+        self.singleflight = get_singleflight("chat_json")
+    
+    @property
+    def client(self) -> OpenAI:
+        """
+        Синхронный клиент OpenAI. Нужен только блокирующим методам,
+        поэтому его пул соединений не создается при старте сервера
+        """
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0
+            )
+        return self._client
+    
+    def _client_for(self, endpoint: ModelEndpoint) -> OpenAI:
+        """
+        Синхронный клиент для записи пула моделей
+        
+        Args:
+            endpoint (ModelEndpoint): Запись пула
+            
+        Returns:
+            OpenAI: Клиент с адресом и ключом записи
+        """
+        if (endpoint.base_url, endpoint.api_key) == (self.base_url, self.api_key):
+            return self.client
+        if endpoint.name not in self._endpoint_clients:
+            self._endpoint_clients[endpoint.name] = OpenAI(
+                api_key=endpoint.api_key,
+                base_url=endpoint.base_url,
+                max_retries=0
+            )
+        return self._endpoint_clients[endpoint.name]
+    
+    def _async_client_for(self, endpoint: ModelEndpoint) -> AsyncOpenAI:
+        """
+        Асинхронный клиент для записи пула моделей поверх общего пула соединений
+        
+        Args:
+            endpoint (ModelEndpoint): Запись пула
+            
+        Returns:
+            AsyncOpenAI: Клиент с адресом и ключом записи
+        """
+        if (endpoint.base_url, endpoint.api_key) == (self.base_url, self.api_key):
+            return self.async_client
+        if endpoint.name not in self._endpoint_async_clients:
+            self._endpoint_async_clients[endpoint.name] = AsyncOpenAI(
+                api_key=endpoint.api_key,
+                base_url=endpoint.base_url,
+                http_client=get_shared_async_http_client(),
+                max_retries=0
+            )
+        return self._endpoint_async_clients[endpoint.name]
     
     def set_system_prompt(self, system_prompt: str):
         """
@@ -64,19 +259,31 @@ class LLMClient:
             str: Ответ от LLM
         """
         try:
-            chat_completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=self.max_tokens
-            )
+            return self._complete(self._build_chat_messages(prompt), "chat")
             
-            return chat_completion.choices[0].message.content
+        except (CircuitOpenError, OverloadedError):
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при выполнении запроса: {str(e)}")
+    
+    async def achat(self, prompt: str, timeout: Optional[float] = None,
+                    priority: int = PRIORITY_INTERACTIVE) -> str:
+        """
+        Асинхронный простой запрос к LLM
+        
+        Args:
+            prompt (str): Пользовательский промпт
+            timeout (Optional[float]): Дедлайн вызова с учетом повторов в секундах (по умолчанию LLM_DEADLINE)
+            priority (int): Приоритет в очереди запросов к LLM
             
+        Returns:
+            str: Ответ от LLM
+        """
+        try:
+            return await self._acomplete(self._build_chat_messages(prompt), "chat", timeout, priority)
+            
+        except (CircuitOpenError, OverloadedError):
+            raise
         except Exception as e:
             raise Exception(f"Ошибка при выполнении запроса: {str(e)}")
     
@@ -92,77 +299,821 @@ class LLMClient:
             str: Ответ от LLM
         """
         try:
-            chat_completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt
-                    }
-                ],
-                max_tokens=self.max_tokens
-            )
+            return self._complete(self._build_system_messages(system_prompt, user_prompt), "chat_with_system")
             
-            return chat_completion.choices[0].message.content
+        except (CircuitOpenError, OverloadedError):
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при выполнении запроса с системным промптом: {str(e)}")
+    
+    async def achat_with_system(self, system_prompt: str, user_prompt: str, timeout: Optional[float] = None,
+                                priority: int = PRIORITY_INTERACTIVE) -> str:
+        """
+        Асинхронный запрос к LLM с системным промптом
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            timeout (Optional[float]): Дедлайн вызова с учетом повторов в секундах (по умолчанию LLM_DEADLINE)
+            priority (int): Приоритет в очереди запросов к LLM
             
+        Returns:
+            str: Ответ от LLM
+        """
+        try:
+            messages = self._build_system_messages(system_prompt, user_prompt)
+            return await self._acomplete(messages, "chat_with_system", timeout, priority)
+            
+        except (CircuitOpenError, OverloadedError):
+            raise
         except Exception as e:
             raise Exception(f"Ошибка при выполнении запроса с системным промптом: {str(e)}")
     
-    def chat_json(self, system_prompt: str, user_prompt: str, json_standard: str = "json") -> dict:
+    async def astream_chat(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Простой запрос к LLM с потоковой выдачей ответа
+        
+        Args:
+            prompt (str): Пользовательский промпт
+            timeout (Optional[float]): Таймаут запроса в секундах (по умолчанию OPENAI_TIMEOUT)
+            
+        Yields:
+            str: Очередной фрагмент ответа LLM
+        """
+        async for delta in self._astream(self._build_chat_messages(prompt), timeout, "chat"):
+            yield delta
+    
+    async def astream_chat_with_system(self, system_prompt: str, user_prompt: str,
+                                       timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Запрос к LLM с системным промптом и потоковой выдачей ответа
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            timeout (Optional[float]): Таймаут запроса в секундах (по умолчанию OPENAI_TIMEOUT)
+            
+        Yields:
+            str: Очередной фрагмент ответа LLM
+        """
+        messages = self._build_system_messages(system_prompt, user_prompt)
+        async for delta in self._astream(messages, timeout, "chat_with_system"):
+            yield delta
+    
+    async def _astream(self, messages: list, timeout: Optional[float], name: str,
+                       response_format: Optional[dict] = None, task: str = TASK_CHAT) -> AsyncIterator[str]:
+        """
+        Выполняет потоковый запрос и учитывает время до первого токена (TTFT)
+        и полное время ответа в статистике stream.<name>.ttft / stream.<name>.total.
+        Расход токенов приходит в последнем фрагменте (stream_options.include_usage):
+        по нему уточняется бюджет TPM и считаются llm_tokens_total, как для обычных запросов
+        
+        Args:
+            messages (list): Сообщения для chat.completions
+            timeout (Optional[float]): Таймаут запроса в секундах
+            name (str): Имя метода для статистики
+            response_format (Optional[dict]): Режим структурированного ответа
+            task (str): Тип задачи для выбора модели из пула
+            
+        Yields:
+            str: Очередной фрагмент ответа LLM
+        """
+        started = time.perf_counter()
+        first_token = True
+        estimate = self._estimate_tokens(messages)
+        
+        deadline = timeout if timeout is not None else self.policy.deadline
+        
+        try:
+            # Если ожидание в очереди не уложится в дедлайн, запрос сразу отклоняется (OverloadedError)
+            with span("llm_queue"):
+                waited = await self.scheduler.acquire(estimate, PRIORITY_INTERACTIVE, max_wait=deadline)
+            self._observe_queue_wait(waited, PRIORITY_INTERACTIVE)
+            
+            # Переключение на другую модель возможно, пока не получен ни один фрагмент ответа
+            async def open_stream(endpoint: ModelEndpoint, attempt_timeout: Optional[float]):
+                stream = await self._acreate_with_format(
+                    endpoint, response_format,
+                    lambda endpoint_format: self._async_client_for(endpoint).chat.completions.create(
+                        model=endpoint.model,
+                        messages=messages,
+                        max_tokens=self.max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **self._request_options(attempt_timeout, endpoint_format)
+                    )
+                )
+                return endpoint, stream
+            
+            endpoint, stream = await self.pool.acall(task, open_stream, max(deadline - waited, 0.001))
+            
+            usage_chunk = None
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage_chunk = chunk
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                
+                if first_token:
+                    ttft = time.perf_counter() - started
+                    get_latency_stats(f"stream.{name}.ttft").observe(ttft)
+                    LLM_STREAM_SECONDS.observe(ttft, method=name, phase="ttft", endpoint=endpoint_label(),
+                                               model=endpoint.model)
+                    first_token = False
+                yield delta
+            
+            total = time.perf_counter() - started
+            get_latency_stats(f"stream.{name}.total").observe(total)
+            LLM_STREAM_SECONDS.observe(total, method=name, phase="total", endpoint=endpoint_label(),
+                                       model=endpoint.model)
+            # Без фрагмента usage (прокси не поддерживает include_usage) бюджет остается по оценке
+            self._record_usage(estimate, usage_chunk, endpoint.model)
+            self._count_request(name, model=endpoint.model)
+            
+        except (BadRequestError, CircuitOpenError, OverloadedError) as e:
+            # Роутер отвечает на них 400 или 503 с Retry-After
+            self._count_request(name, e)
+            raise
+        except Exception as e:
+            self._count_request(name, e)
+            raise Exception(f"Ошибка при выполнении потокового запроса: {str(e)}")
+    
+    def chat_json(self, system_prompt: str, user_prompt: str, json_standard: str = "json",
+                  no_cache: bool = False, schema: Optional[Type[BaseModel]] = None,
+                  task: str = TASK_JSON) -> dict:
+        """
+        Запрос к LLM с системным промптом и парсингом ответа в JSON.
+        Использует response_format (json_schema при указанной схеме, иначе json_object),
+        если модель его поддерживает. Невалидный ответ один раз отправляется модели на исправление
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            json_standard (str): Стандарт JSON (по умолчанию "json")
+            no_cache (bool): Не брать ответ из кэша (свежий ответ все равно сохраняется)
+            schema (Optional[Type[BaseModel]]): Pydantic модель, которой должен соответствовать ответ
+            task (str): Тип задачи для выбора модели из пула
+            
+        Returns:
+            dict: Ответ от LLM в виде Python словаря
+        """
+        try:
+            cache_key = self._cache_key(system_prompt, user_prompt, task)
+            if self.cache is not None and not no_cache:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    result, error = self._validate_json(cached, schema)
+                    if error is None:
+                        return result
+            
+            messages = self._build_json_messages(system_prompt, user_prompt)
+            content, response_format = self._complete_structured(messages, "chat_json", schema, task)
+            result, error = self._parse_json_result(content, schema)
+            
+            for _ in range(self.json_repair_attempts):
+                if error is None:
+                    break
+                repair_messages = self._build_repair_messages(messages, content, error)
+                content = self._complete(repair_messages, "chat_json_repair", response_format, task)
+                result, error = self._parse_json_result(content, schema)
+            
+            if error is not None:
+                return {"response": content, "error": error}
+            if self.cache is not None:
+                self.cache.set(cache_key, result)
+            
+            return result
+            
+        except (CircuitOpenError, OverloadedError):
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при выполнении JSON запроса: {str(e)}")
+    
+    async def achat_json(self, system_prompt: str, user_prompt: str, json_standard: str = "json",
+                         timeout: Optional[float] = None, no_cache: bool = False,
+                         priority: int = PRIORITY_INTERACTIVE, schema: Optional[Type[BaseModel]] = None,
+                         task: str = TASK_JSON) -> dict:
         """
-        Запрос к LLM с системным промптом и парсингом ответа в JSON
+        Асинхронный запрос к LLM с системным промптом и парсингом ответа в JSON (см. chat_json)
         
         Args:
             system_prompt (str): Системный промпт
             user_prompt (str): Пользовательский промпт
             json_standard (str): Стандарт JSON (по умолчанию "json")
+            timeout (Optional[float]): Дедлайн вызова с учетом повторов в секундах (по умолчанию LLM_DEADLINE)
+            no_cache (bool): Не брать ответ из кэша (свежий ответ все равно сохраняется)
+            priority (int): Приоритет в очереди запросов к LLM
+            schema (Optional[Type[BaseModel]]): Pydantic модель, которой должен соответствовать ответ
+            task (str): Тип задачи для выбора модели из пула
             
         Returns:
             dict: Ответ от LLM в виде Python словаря
         """
         try:
-            # Добавляем инструкцию для JSON ответа к системному промпту
-            json_system_prompt = f"{system_prompt}\n\nОтветь строго в формате JSON."
-            
-            chat_completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": json_system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt
-                    }
-                ],
-                max_tokens=self.max_tokens
+            cache_key = self._cache_key(system_prompt, user_prompt, task)
+            if self.cache is not None and not no_cache:
+                cached = await self.cache.aget(cache_key)
+                if cached is not None:
+                    result, error = self._validate_json(cached, schema)
+                    if error is None:
+                        return result
+            
+            # Одинаковые запросы, пришедшие одновременно, выполняются одним вызовом LLM
+            return await self.singleflight.do(
+                (cache_key, schema),
+                lambda: self._acomplete_json(system_prompt, user_prompt, cache_key, timeout, priority, schema, task)
+            )
+            
+        except (CircuitOpenError, OverloadedError):
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка при выполнении JSON запроса: {str(e)}")
+    
+    async def _acomplete_json(self, system_prompt: str, user_prompt: str, cache_key: str,
+                              timeout: Optional[float], priority: int,
+                              schema: Optional[Type[BaseModel]] = None, task: str = TASK_JSON) -> dict:
+        """
+        Выполняет JSON запрос к LLM, при невалидном ответе просит модель его исправить,
+        и сохраняет ответ в кэш
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            cache_key (str): Ключ кэша запроса
+            timeout (Optional[float]): Дедлайн вызова в секундах
+            priority (int): Приоритет в очереди запросов к LLM
+            schema (Optional[Type[BaseModel]]): Pydantic модель, которой должен соответствовать ответ
+            task (str): Тип задачи для выбора модели из пула
+            
+        Returns:
+            dict: Ответ от LLM в виде Python словаря
+        """
+        messages = self._build_json_messages(system_prompt, user_prompt)
+        content, response_format = await self._acomplete_structured(
+            messages, "chat_json", timeout, priority, schema, task
+        )
+        result, error = self._parse_json_result(content, schema)
+        
+        for _ in range(self.json_repair_attempts):
+            if error is None:
+                break
+            repair_messages = self._build_repair_messages(messages, content, error)
+            content = await self._acomplete(
+                repair_messages, "chat_json_repair", timeout, priority, response_format, task
+            )
+            result, error = self._parse_json_result(content, schema)
+        
+        if error is not None:
+            return {"response": content, "error": error}
+        if self.cache is not None:
+            await self.cache.aset(cache_key, result)
+        
+        return result
+    
+    async def astream_json_items(self, system_prompt: str, user_prompt: str, key: str,
+                                 schema: Optional[Type[BaseModel]] = None, no_cache: bool = False,
+                                 timeout: Optional[float] = None, task: str = TASK_JSON) -> AsyncIterator[Any]:
+        """
+        Потоковый JSON запрос: элементы массива key отдаются по мере генерации ответа,
+        не дожидаясь его конца. Полный ответ проверяется схемой и сохраняется в кэш
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            key (str): Ключ массива в ответе (например, "questions")
+            schema (Optional[Type[BaseModel]]): Pydantic модель полного ответа
+            no_cache (bool): Не брать ответ из кэша
+            timeout (Optional[float]): Таймаут запроса в секундах (по умолчанию OPENAI_TIMEOUT)
+            task (str): Тип задачи для выбора модели из пула
+            
+        Yields:
+            Any: Очередной элемент массива
+        """
+        cache_key = self._cache_key(system_prompt, user_prompt, task)
+        if self.cache is not None and not no_cache:
+            cached = await self.cache.aget(cache_key)
+            if cached is not None:
+                result, error = self._validate_json(cached, schema)
+                if error is None and isinstance(result, dict) and isinstance(result.get(key), list):
+                    for item in result[key]:
+                        yield item
+                    return
+        
+        messages = self._build_json_messages(system_prompt, user_prompt)
+        parser = JsonArrayStream(key)
+        parts = []
+        try:
+            async for delta in self._astream(messages, timeout, "chat_json", self._response_format(schema), task):
+                parts.append(delta)
+                for item in parser.feed(delta):
+                    yield item
+        except BadRequestError as e:
+            raise Exception(f"Ошибка при выполнении потокового запроса: {str(e)}")
+        
+        result, error = self._parse_json_result("".join(parts), schema)
+        if error is not None:
+            logger.warning(f"Потоковый JSON ответ не прошел проверку: {error}")
+        elif self.cache is not None:
+            await self.cache.aset(cache_key, result)
+    
+    def _complete_structured(self, messages: list, name: str, schema: Optional[Type[BaseModel]],
+                             task: str = TASK_JSON) -> Tuple[str, Optional[dict]]:
+        """
+        Выполняет блокирующий запрос с response_format текущего режима. Запись пула,
+        модель которой отклоняет режим, получает более простой (см. _create_with_format)
+        
+        Args:
+            messages (list): Сообщения для chat.completions
+            name (str): Имя метода для статистики
+            schema (Optional[Type[BaseModel]]): Pydantic модель ответа
+            task (str): Тип задачи для выбора модели из пула
+            
+        Returns:
+            Tuple[str, Optional[dict]]: Текст ответа и запрошенный response_format
+        """
+        response_format = self._response_format(schema)
+        return self._complete(messages, name, response_format, task), response_format
+    
+    async def _acomplete_structured(self, messages: list, name: str, timeout: Optional[float], priority: int,
+                                    schema: Optional[Type[BaseModel]],
+                                    task: str = TASK_JSON) -> Tuple[str, Optional[dict]]:
+        """
+        Асинхронный вариант _complete_structured
+        
+        Args:
+            messages (list): Сообщения для chat.completions
+            name (str): Имя метода для статистики
+            timeout (Optional[float]): Дедлайн вызова в секундах
+            priority (int): Приоритет в очереди запросов к LLM
+            schema (Optional[Type[BaseModel]]): Pydantic модель ответа
+            task (str): Тип задачи для выбора модели из пула
+            
+        Returns:
+            Tuple[str, Optional[dict]]: Текст ответа и запрошенный response_format
+        """
+        response_format = self._response_format(schema)
+        content = await self._acomplete(messages, name, timeout, priority, response_format, task)
+        return content, response_format
+    
+    def _complete(self, messages: list, name: str, response_format: Optional[dict] = None,
+                  task: str = TASK_CHAT) -> str:
+        """
+        Выполняет блокирующий запрос chat.completions через политику вызовов.
+        Внутри каждой попытки политики запрос при сбое сразу переходит к следующей модели пула
+        
+        Args:
+            messages (list): Сообщения для chat.completions
+            name (str): Имя метода для статистики
+            response_format (Optional[dict]): Режим структурированного ответа
+            task (str): Тип задачи для выбора модели из пула
+            
+        Returns:
+            str: Текст ответа LLM
+        """
+        estimate = self._estimate_tokens(messages)
+        
+        def request(endpoint: ModelEndpoint, attempt_timeout: Optional[float]):
+            return endpoint, self._create_with_format(
+                endpoint, response_format,
+                lambda endpoint_format: self._client_for(endpoint).chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    **self._request_options(attempt_timeout, endpoint_format)
+                )
+            )
+        
+        def create(timeout: float) -> Tuple[str, str]:
+            with span("llm_queue"):
+                waited = self.scheduler.acquire_blocking(estimate, max_wait=timeout)
+            self._observe_queue_wait(waited, PRIORITY_BATCH)
+            with span("llm_request"):
+                endpoint, chat_completion = self.pool.call(task, request, max(timeout - waited, 0.001))
+            self._record_usage(estimate, chat_completion, endpoint.model)
+            return endpoint.model, chat_completion.choices[0].message.content
+        
+        try:
+            model, content = self.policy.call(create, name)
+        except Exception as e:
+            self._count_request(name, e)
+            raise
+        self._count_request(name, model=model)
+        return content
+    
+    async def _acomplete(self, messages: list, name: str, timeout: Optional[float] = None,
+                         priority: int = PRIORITY_INTERACTIVE, response_format: Optional[dict] = None,
+                         task: str = TASK_CHAT) -> str:
+        """
+        Выполняет асинхронный запрос chat.completions через очередь запросов и политику вызовов.
+        Внутри каждой попытки политики запрос при сбое сразу переходит к следующей модели пула
+        
+        Args:
+            messages (list): Сообщения для chat.completions
+            name (str): Имя метода для статистики
+            timeout (Optional[float]): Дедлайн вызова в секундах
+            priority (int): Приоритет в очереди запросов к LLM
+            response_format (Optional[dict]): Режим структурированного ответа
+            task (str): Тип задачи для выбора модели из пула
+            
+        Returns:
+            str: Текст ответа LLM
+        """
+        estimate = self._estimate_tokens(messages)
+        
+        async def request(endpoint: ModelEndpoint, attempt_timeout: Optional[float]):
+            chat_completion = await self._acreate_with_format(
+                endpoint, response_format,
+                lambda endpoint_format: self._async_client_for(endpoint).chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    max_tokens=self.max_tokens,
+                    **self._request_options(attempt_timeout, endpoint_format)
+                )
             )
+            return endpoint, chat_completion
+        
+        async def create(attempt_timeout: float) -> Tuple[str, str]:
+            with span("llm_queue"):
+                waited = await self.scheduler.acquire(estimate, priority, max_wait=attempt_timeout)
+            self._observe_queue_wait(waited, priority)
+            with span("llm_request"):
+                endpoint, chat_completion = await self.pool.acall(
+                    task, request, max(attempt_timeout - waited, 0.001)
+                )
+            self._record_usage(estimate, chat_completion, endpoint.model)
+            return endpoint.model, chat_completion.choices[0].message.content
+        
+        try:
+            model, content = await self.policy.acall(create, name, timeout)
+        except Exception as e:
+            self._count_request(name, e)
+            raise
+        self._count_request(name, model=model)
+        return content
+    
+    def _observe_queue_wait(self, waited: float, priority: int):
+        """
+        Учитывает ожидание в очереди лимитов в гистограмме llm_queue_wait_seconds
+        
+        Args:
+            waited (float): Время ожидания в секундах
+            priority (int): Приоритет запроса
+        """
+        if self.scheduler.enabled:
+            LLM_QUEUE_WAIT_SECONDS.observe(waited, priority=PRIORITY_NAMES.get(priority, str(priority)),
+                                           endpoint=endpoint_label())
+    
+    def _estimate_tokens(self, messages: list) -> int:
+        """
+        Оценивает расход токенов запроса: промпт и максимальная длина ответа
+        
+        Args:
+            messages (list): Сообщения для chat.completions
             
-            response_content = chat_completion.choices[0].message.content
+        Returns:
+            int: Оценка количества токенов
+        """
+        if not self.scheduler.enabled:
+            return 0
+        prompt_tokens = sum(self.token_counter.count_tokens(message["content"]) for message in messages)
+        return prompt_tokens + self.max_tokens
+    
+    def _record_usage(self, estimate: int, chat_completion, model: Optional[str] = None):
+        """
+        Учитывает фактический расход токенов из ответа: уточняет бюджет TPM
+        и увеличивает счетчики токенов промпта, ответа и промпта из кэша провайдера
+        
+        Args:
+            estimate (int): Оценка токенов, с которой запрос был допущен
+            chat_completion: Ответ chat.completions
+            model (Optional[str]): Модель, которая ответила (по умолчанию OPENAI_MODEL)
+        """
+        usage = getattr(chat_completion, "usage", None)
+        self.scheduler.settle(estimate, usage.total_tokens if usage is not None else None)
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None) or 0
+            labels = {"endpoint": endpoint_label(), "model": model or self.model}
+            LLM_TOKENS.inc(usage.prompt_tokens or 0, type="prompt", **labels)
+            LLM_TOKENS.inc(usage.completion_tokens or 0, type="completion", **labels)
+            LLM_TOKENS.inc(cached_tokens, type="cached", **labels)
+            
+            _usage_stats["responses"] += 1
+            _usage_stats["prompt_tokens"] += usage.prompt_tokens or 0
+            _usage_stats["cached_tokens"] += cached_tokens
+            _usage_stats["completion_tokens"] += usage.completion_tokens or 0
+    
+    def _count_request(self, name: str, error: Optional[Exception] = None, model: Optional[str] = None):
+        """
+        Учитывает вызов LLM в счетчике llm_requests_total
+        
+        Args:
+            name (str): Имя метода
+            error (Optional[Exception]): Ошибка вызова (None - успешный вызов)
+            model (Optional[str]): Модель, которая ответила (по умолчанию OPENAI_MODEL)
+        """
+        if error is None:
+            outcome = "ok"
+        elif isinstance(error, CircuitOpenError):
+            outcome = "circuit_open"
+        elif isinstance(error, OverloadedError):
+            outcome = "overloaded"
+        else:
+            outcome = "error"
+        LLM_REQUESTS.inc(method=name, outcome=outcome, endpoint=endpoint_label(), model=model or self.model)
+    
+    def _cache_key(self, system_prompt: str, user_prompt: str, task: str = TASK_JSON) -> str:
+        """
+        Строит ключ кэша для JSON запроса с текущими параметрами клиента.
+        Вместо модели в ключ входят все модели пула, обслуживающие задачу
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            task (str): Тип задачи
             
-            # Пытаемся распарсить JSON
+        Returns:
+            str: Ключ кэша
+        """
+        return make_cache_key(self.pool.route_key(task), self.max_tokens, system_prompt, user_prompt)
+    
+    def _response_format(self, schema: Optional[Type[BaseModel]]) -> Optional[dict]:
+        """
+        Формирует response_format для текущего режима структурированного ответа
+        
+        Args:
+            schema (Optional[Type[BaseModel]]): Pydantic модель ответа
+            
+        Returns:
+            Optional[dict]: response_format или None, если режим не поддерживается
+        """
+        if self.response_format == "json_schema" and schema is not None:
+            return {
+                "type": "json_schema",
+                "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()}
+            }
+        if self.response_format in ("json_schema", "json_object"):
+            return {"type": "json_object"}
+        return None
+    
+    @staticmethod
+    def _endpoint_response_format(endpoint: ModelEndpoint, response_format: Optional[dict]) -> Optional[dict]:
+        """
+        Понижает response_format до режима, который поддерживает модель записи пула
+        
+        Args:
+            endpoint (ModelEndpoint): Запись пула
+            response_format (Optional[dict]): Запрошенный режим
+            
+        Returns:
+            Optional[dict]: json_schema, json_object или None (только инструкция в промпте)
+        """
+        if response_format is not None and response_format["type"] == "json_schema" \
+                and "json_schema" in endpoint.unsupported_formats:
+            response_format = {"type": "json_object"}
+        if response_format is not None and response_format["type"] in endpoint.unsupported_formats:
+            response_format = None
+        return response_format
+    
+    @staticmethod
+    def _downgrade_response_format(endpoint: ModelEndpoint, error: BadRequestError,
+                                   response_format: Optional[dict]) -> bool:
+        """
+        Запоминает, что модель записи пула отклонила режим response_format.
+        Другие записи пула продолжают получать запрошенный режим
+        
+        Args:
+            endpoint (ModelEndpoint): Запись пула, ответившая ошибкой
+            error (BadRequestError): Ошибка 400 от API
+            response_format (Optional[dict]): Отклоненный response_format
+            
+        Returns:
+            bool: True, если режим понижен и запрос стоит повторить
+        """
+        if response_format is None or not rejects_response_format(error):
+            return False
+        
+        endpoint.unsupported_formats.add(response_format["type"])
+        logger.warning(f"Модель {endpoint.model} не поддерживает response_format {response_format['type']}, "
+                       f"запросы к ней идут в более простом режиме")
+        return True
+    
+    def _create_with_format(self, endpoint: ModelEndpoint, response_format: Optional[dict],
+                            create: Callable[[Optional[dict]], Any]) -> Any:
+        """
+        Выполняет запрос к записи пула в режиме response_format, который она поддерживает.
+        Если модель отклоняет режим, он понижается для этой записи и запрос сразу повторяется
+        
+        Args:
+            endpoint (ModelEndpoint): Запись пула
+            response_format (Optional[dict]): Запрошенный режим
+            create (Callable[[Optional[dict]], Any]): Запрос с заданным response_format
+            
+        Returns:
+            Any: Ответ API
+        """
+        while True:
+            endpoint_format = self._endpoint_response_format(endpoint, response_format)
             try:
-                # Убираем markdown блоки если есть
-                json_content = response_content.strip()
-                if json_content.startswith("```json"):
-                    json_content = json_content[7:]  # Убираем ```json
-                if json_content.endswith("```"):
-                    json_content = json_content[:-3]  # Убираем ```
-                json_content = json_content.strip()
-                
-                return json.loads(json_content)
+                return create(endpoint_format)
+            except BadRequestError as e:
+                if not self._downgrade_response_format(endpoint, e, endpoint_format):
+                    raise
+    
+    async def _acreate_with_format(self, endpoint: ModelEndpoint, response_format: Optional[dict],
+                                   create: Callable[[Optional[dict]], Awaitable[Any]]) -> Any:
+        """
+        Асинхронный вариант _create_with_format
+        
+        Args:
+            endpoint (ModelEndpoint): Запись пула
+            response_format (Optional[dict]): Запрошенный режим
+            create (Callable[[Optional[dict]], Awaitable[Any]]): Фабрика корутины запроса
+            
+        Returns:
+            Any: Ответ API
+        """
+        while True:
+            endpoint_format = self._endpoint_response_format(endpoint, response_format)
+            try:
+                return await create(endpoint_format)
+            except BadRequestError as e:
+                if not self._downgrade_response_format(endpoint, e, endpoint_format):
+                    raise
+    
+    @staticmethod
+    def _request_options(timeout: Optional[float], response_format: Optional[dict] = None) -> dict:
+        """
+        Формирует дополнительные параметры отдельного запроса
+        
+        Args:
+            timeout (Optional[float]): Таймаут запроса в секундах
+            response_format (Optional[dict]): Режим структурированного ответа
+            
+        Returns:
+            dict: Параметры для chat.completions.create
+        """
+        options = {}
+        if timeout is not None:
+            options["timeout"] = timeout
+        if response_format is not None:
+            options["response_format"] = response_format
+        return options
+    
+    @staticmethod
+    def _build_chat_messages(prompt: str) -> list:
+        """
+        Формирует сообщения для простого запроса
+        
+        Args:
+            prompt (str): Пользовательский промпт
+            
+        Returns:
+            list: Список сообщений для chat.completions
+        """
+        return [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+    
+    @staticmethod
+    def _build_system_messages(system_prompt: str, user_prompt: str) -> list:
+        """
+        Формирует сообщения для запроса с системным промптом
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            
+        Returns:
+            list: Список сообщений для chat.completions
+        """
+        return [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ]
+    
+    @staticmethod
+    def _build_json_messages(system_prompt: str, user_prompt: str) -> list:
+        """
+        Формирует сообщения для JSON запроса
+        
+        Args:
+            system_prompt (str): Системный промпт
+            user_prompt (str): Пользовательский промпт
+            
+        Returns:
+            list: Список сообщений для chat.completions
+        """
+        # Добавляем инструкцию для JSON ответа к системному промпту
+        json_system_prompt = f"{system_prompt}\n\nОтветь строго в формате JSON."
+        
+        return LLMClient._build_system_messages(json_system_prompt, user_prompt)
+    
+    @staticmethod
+    def _build_repair_messages(messages: list, content: str, error: str) -> list:
+        """
+        Формирует запрос на исправление невалидного JSON ответа
+        
+        Args:
+            messages (list): Исходные сообщения запроса
+            content (str): Невалидный ответ модели
+            error (str): Описание ошибки разбора или проверки схемы
+            
+        Returns:
+            list: Список сообщений для chat.completions
+        """
+        return messages + [
+            {
+                "role": "assistant",
+                "content": content
+            },
+            {
+                "role": "user",
+                "content": f"Ответ не прошел проверку: {error}\nВерни исправленный ответ строго в формате JSON без пояснений."
+            }
+        ]
+    
+    @staticmethod
+    def _load_json(response_content: str) -> Tuple[Any, Optional[str]]:
+        """
+        Извлекает JSON из ответа LLM: убирает markdown блок, а если вокруг JSON
+        есть пояснения, берет текст от первой открывающей до последней закрывающей скобки
+        
+        Args:
+            response_content (str): Текст ответа LLM
+            
+        Returns:
+            Tuple[Any, Optional[str]]: Распарсенный ответ и None или None и описание ошибки
+        """
+        json_content = (response_content or "").strip()
+        if json_content.startswith("```json"):
+            json_content = json_content[7:]  # Убираем ```json
+        if json_content.endswith("```"):
+            json_content = json_content[:-3]  # Убираем ```
+        json_content = json_content.strip()
+        
+        try:
+            return json.loads(json_content), None
+        except json.JSONDecodeError as e:
+            error = f"Не удалось распарсить JSON: {str(e)}"
+        
+        start, end = json_content.find("{"), json_content.rfind("}")
+        if 0 <= start < end:
+            try:
+                return json.loads(json_content[start:end + 1]), None
             except json.JSONDecodeError:
-                # Если не удалось распарсить JSON, возвращаем как строку
-                return {"response": response_content, "error": "Не удалось распарсить JSON"}
+                pass
+        return None, error
+    
+    @staticmethod
+    def _validate_json(result: Any, schema: Optional[Type[BaseModel]]) -> Tuple[Any, Optional[str]]:
+        """
+        Проверяет ответ Pydantic моделью
+        
+        Args:
+            result (Any): Распарсенный ответ
+            schema (Optional[Type[BaseModel]]): Pydantic модель (None - без проверки)
             
-        except Exception as e:
-            raise Exception(f"Ошибка при выполнении JSON запроса: {str(e)}")
-
+        Returns:
+            Tuple[Any, Optional[str]]: Ответ, приведенный к схеме, и описание ошибки или None
+        """
+        if schema is None:
+            return result, None
+        try:
+            return schema.model_validate(result).model_dump(), None
+        except ValidationError as e:
+            return result, f"Ответ не соответствует схеме {schema.__name__}: {str(e)}"
+    
+    @classmethod
+    def _parse_json_result(cls, response_content: str,
+                           schema: Optional[Type[BaseModel]] = None) -> Tuple[Any, Optional[str]]:
+        """
+        Парсит ответ LLM в JSON и проверяет его схемой
+        
+        Args:
+            response_content (str): Текст ответа LLM
+            schema (Optional[Type[BaseModel]]): Pydantic модель ответа
+            
+        Returns:
+            Tuple[Any, Optional[str]]: Ответ и описание ошибки или None
+        """
+        with span("json_parse"):
+            result, error = cls._load_json(response_content)
+            if error is not None:
+                return None, error
+            return cls._validate_json(result, schema)
 
 if __name__ == "__main__":
     """
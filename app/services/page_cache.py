@@ -0,0 +1,219 @@
+"""
+Кэш скачанных страниц для условных GET запросов (ETag / Last-Modified)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+
+class CachedPage:
+    """
+    Закэшированная страница: тело, валидаторы и извлеченный текст.
+    При потоковом извлечении текста тело не хранится (body is None)
+    """
+
+    __slots__ = ("body", "etag", "last_modified", "content_length", "text")
+
+    def __init__(self, body: Optional[str], etag: Optional[str], last_modified: Optional[str], content_length: int):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_length = content_length
+        self.text: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        """Примерный объем памяти, занимаемый записью, в байтах"""
+        return (len(self.body) if self.body else 0) + (len(self.text) if self.text else 0)
+
+
+class PageCache:
+    """
+    LRU кэш страниц с ограничением по объему памяти.
+    Хранит только страницы, которые сервер разрешает перепроверять через ETag или Last-Modified
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        """
+        Инициализация кэша
+
+        Args:
+            max_bytes (int): Максимальный объем кэша в байтах
+        """
+        self.max_bytes = max_bytes
+
+        self._pages: "OrderedDict[str, CachedPage]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "not_modified": 0,
+            "downloads": 0,
+            "bytes_saved": 0,
+            "evictions": 0,
+        }
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Возвращает закэшированную страницу или None
+
+        Args:
+            url (str): URL страницы
+
+        Returns:
+            Optional[CachedPage]: Закэшированная страница
+        """
+        with self._lock:
+            page = self._pages.get(url)
+            if page is not None:
+                self._pages.move_to_end(url)
+            return page
+
+    @staticmethod
+    def conditional_headers(page: Optional[CachedPage]) -> Dict[str, str]:
+        """
+        Формирует заголовки условного запроса для закэшированной страницы
+
+        Args:
+            page (Optional[CachedPage]): Закэшированная страница
+
+        Returns:
+            Dict[str, str]: Заголовки If-None-Match / If-Modified-Since
+        """
+        if page is None:
+            return {}
+
+        headers = {}
+        if page.etag:
+            headers["If-None-Match"] = page.etag
+        if page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+        return headers
+
+    def store(self, url: str, body: Optional[str], headers: Any, content_length: int) -> CachedPage:
+        """
+        Сохраняет ответ 200, если у него есть валидаторы
+
+        Args:
+            url (str): URL страницы
+            body (Optional[str]): HTML-код страницы (None, если хранится только текст)
+            headers (Any): Заголовки ответа
+            content_length (int): Размер тела ответа в байтах
+
+        Returns:
+            CachedPage: Запись о странице (даже если она не попала в кэш)
+        """
+        page = CachedPage(body, headers.get("ETag"), headers.get("Last-Modified"), content_length)
+        self._count("downloads")
+
+        if page.etag or page.last_modified:
+            self._put(url, page)
+        else:
+            self.discard(url)
+        return page
+
+    def not_modified(self, page: CachedPage):
+        """
+        Учитывает ответ 304 для закэшированной страницы
+
+        Args:
+            page (CachedPage): Закэшированная страница
+        """
+        with self._lock:
+            self.stats["not_modified"] += 1
+            self.stats["bytes_saved"] += page.content_length
+
+    def set_text(self, url: str, page: CachedPage, text: str):
+        """
+        Сохраняет извлеченный текст страницы, чтобы при 304 не разбирать HTML повторно
+
+        Args:
+            url (str): URL страницы
+            page (CachedPage): Запись о странице
+            text (str): Извлеченный текст
+        """
+        page.text = text
+        with self._lock:
+            if self._pages.get(url) is page:
+                self._resize(url, page)
+
+    def discard(self, url: str):
+        """
+        Удаляет страницу из кэша
+
+        Args:
+            url (str): URL страницы
+        """
+        with self._lock:
+            if self._pages.pop(url, None) is not None:
+                self._bytes -= self._sizes.pop(url)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает метрики кэша
+
+        Returns:
+            Dict[str, Any]: Статистика кэша
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._pages)
+            stats["bytes"] = self._bytes
+        return stats
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _put(self, url: str, page: CachedPage):
+        # Страницы больше всего кэша не сохраняем
+        if page.size > self.max_bytes:
+            self.discard(url)
+            return
+
+        with self._lock:
+            self._pages[url] = page
+            self._pages.move_to_end(url)
+            self._resize(url, page)
+
+    def _resize(self, url: str, page: CachedPage):
+        # Вызывается под блокировкой
+        self._bytes += page.size - self._sizes.get(url, 0)
+        self._sizes[url] = page.size
+
+        while self._bytes > self.max_bytes and self._pages:
+            evicted_url, _ = self._pages.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted_url)
+            self.stats["evictions"] += 1
+
+
+# Общий кэш страниц для всех экземпляров SiteAnalyzer
+_shared_page_cache: Optional[PageCache] = None
+
+
+def get_page_cache() -> Optional[PageCache]:
+    """
+    Возвращает общий кэш страниц или None, если кэш отключен.
+    Параметры берутся из переменных окружения: PAGE_CACHE_ENABLED и PAGE_CACHE_MAX_BYTES
+
+    Returns:
+        Optional[PageCache]: Общий кэш страниц
+    """
+    global _shared_page_cache
+
+    if _shared_page_cache is None:
+        load_dotenv()
+
+        if os.environ.get("PAGE_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+
+        _shared_page_cache = PageCache(
+            max_bytes=int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+        )
+
+    return _shared_page_cache
@@ -0,0 +1,457 @@
+"""
+Профилирование HTTP запросов по требованию: трасса стадий запроса, выборочный
+профилировщик стеков и кольцевой буфер медленных запросов
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.services.metrics import current_trace, register_collector, route_template, stats_lines
+
+logger = logging.getLogger(__name__)
+
+# Заголовок запроса со значением PROFILE_ADMIN_TOKEN: профилировать запрос
+PROFILE_HEADER = "x-profile"
+
+# Заголовок запроса со значением PROFILE_ADMIN_TOKEN для доступа к эндпоинтам профилей
+ADMIN_HEADER = "x-admin-token"
+
+# Заголовок ответа с идентификатором профиля запроса
+PROFILE_ID_HEADER = "x-profile-id"
+
+# Ограничения одной трассы: спаны и разные стеки (остальные стеки считаются в [other])
+MAX_SPANS = 1000
+MAX_STACKS = 2000
+MAX_STACK_DEPTH = 64
+
+
+class RequestTrace:
+    """
+    Трасса HTTP запроса: спаны стадий с началом от старта запроса и, если запрос
+    профилируется, свернутые стеки потоков, снятые профилировщиком во время запроса
+    """
+
+    __slots__ = ("id", "method", "path", "endpoint", "status", "reason", "started_at", "started",
+                 "duration", "spans", "samples", "sample_count")
+
+    def __init__(self, method: str, path: str, reason: Optional[str] = None):
+        """
+        Инициализация трассы
+
+        Args:
+            method (str): HTTP метод
+            path (str): Путь запроса (без строки запроса)
+            reason (Optional[str]): Почему запрос профилируется: header или sample (None - только трасса)
+        """
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.endpoint = "other"
+        self.status = "500"
+        self.reason = reason
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[tuple] = []
+        self.samples: Dict[str, int] = {}
+        self.sample_count = 0
+
+    @property
+    def profiled(self) -> bool:
+        """Снимаются ли стеки для запроса"""
+        return self.reason is not None
+
+    def add_span(self, name: str, started: float, elapsed: float):
+        """
+        Добавляет спан стадии
+
+        Args:
+            name (str): Имя стадии
+            started (float): Начало по time.perf_counter()
+            elapsed (float): Длительность в секундах
+        """
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append((name, started - self.started, elapsed))
+
+    def add_sample(self, stack: str):
+        """
+        Учитывает снятый стек
+
+        Args:
+            stack (str): Свернутый стек: поток и функции от корня через точку с запятой
+        """
+        if stack not in self.samples and len(self.samples) >= MAX_STACKS:
+            stack = "[other]"
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+        self.sample_count += 1
+
+    def to_dict(self, details: bool = True, top_stacks: int = 50) -> Dict[str, Any]:
+        """
+        Возвращает трассу для ответа API
+
+        Args:
+            details (bool): Включать спаны и стеки (False - только сводка для списков)
+            top_stacks (int): Сколько самых частых стеков включать
+
+        Returns:
+            Dict[str, Any]: Трасса; время в секундах
+        """
+        result = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "profiled": self.reason,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+        }
+        stages: Dict[str, float] = {}
+        for name, _, elapsed in list(self.spans):
+            stages[name] = stages.get(name, 0.0) + elapsed
+        result["stages"] = {name: round(total, 6) for name, total in stages.items()}
+        if not details:
+            return result
+
+        result["spans"] = [
+            {"name": name, "start": round(start, 6), "duration": round(elapsed, 6)}
+            for name, start, elapsed in sorted(list(self.spans), key=lambda span: span[1])
+        ]
+        if self.profiled:
+            stacks = sorted(dict(self.samples).items(), key=lambda item: item[1], reverse=True)[:top_stacks]
+            result["samples"] = self.sample_count
+            result["stacks"] = [{"stack": stack, "count": count} for stack, count in stacks]
+        return result
+
+
+@contextmanager
+def span(name: str):
+    """
+    Записывает блок спаном в трассу текущего запроса. Вне профилируемого
+    запроса стоит одного чтения contextvar
+
+    Args:
+        name (str): Имя стадии
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, started, time.perf_counter() - started)
+
+
+def _fold_stack(thread_name: str, frame) -> str:
+    """
+    Сворачивает стек потока в строку формата flamegraph: поток и функции от корня через ;
+    """
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик: пока есть профилируемые запросы, фоновый поток каждые
+    interval секунд снимает стеки всех потоков процесса и добавляет их в трассы этих запросов.
+    Стеки общие для процесса: при одновременных запросах в профиль попадает и чужая работа,
+    поток event loop в select означает ожидание ввода-вывода
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Инициализация профилировщика
+
+        Args:
+            interval (float): Интервал снятия стеков в секундах
+        """
+        self.interval = interval
+        self._traces: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, trace: RequestTrace):
+        """
+        Начинает снимать стеки для трассы (запускает поток, если он не запущен)
+
+        Args:
+            trace (RequestTrace): Трасса профилируемого запроса
+        """
+        with self._lock:
+            self._traces.add(trace)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, trace: RequestTrace):
+        """
+        Прекращает снимать стеки для трассы
+
+        Args:
+            trace (RequestTrace): Трасса профилируемого запроса
+        """
+        with self._lock:
+            self._traces.discard(trace)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._traces:
+                    # Профилируемых запросов нет: поток завершается, следующий запрос запустит новый
+                    self._thread = None
+                    return
+                traces = list(self._traces)
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                _fold_stack(names.get(thread_id, str(thread_id)), frame)
+                for thread_id, frame in sys._current_frames().items() if thread_id != own_id
+            ]
+            for trace in traces:
+                for stack in stacks:
+                    trace.add_sample(stack)
+            time.sleep(self.interval)
+
+
+class RequestProfiler:
+    """
+    Профилирование HTTP запросов: запрос с заголовком x-profile, равным PROFILE_ADMIN_TOKEN,
+    или случайная доля PROFILE_SAMPLE_RATE запросов получает трассу стадий и профиль стеков.
+    При заданном PROFILE_SLOW_THRESHOLD трассу стадий (без стеков) получают все запросы,
+    и запросы дольше порога попадают в кольцевой буфер медленных запросов.
+    Когда все выключено, middleware только пропускает запросы дальше
+    """
+
+    def __init__(self, admin_token: str = "", sample_rate: float = 0.0, slow_threshold: float = 0.0,
+                 slow_buffer: int = 100, max_profiles: int = 50, sample_interval: float = 0.005):
+        """
+        Инициализация профилирования
+
+        Args:
+            admin_token (str): Значение заголовка x-profile для профилирования запроса
+                и x-admin-token для доступа к профилям ("" - x-profile не действует, эндпоинты закрыты)
+            sample_rate (float): Доля случайно профилируемых запросов от 0 до 1
+            slow_threshold (float): Порог медленного запроса в секундах (0 - не собирать)
+            slow_buffer (int): Сколько последних медленных запросов хранить
+            max_profiles (int): Сколько последних профилей хранить
+            sample_interval (float): Интервал снятия стеков в секундах
+        """
+        self.admin_token = admin_token
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.sampler = SamplingProfiler(sample_interval)
+        self._slow: deque = deque(maxlen=max(1, slow_buffer))
+        self._profiles: deque = deque(maxlen=max(1, max_profiles))
+        self.stats = {
+            "traced": 0,
+            "profiled_header": 0,
+            "profiled_sample": 0,
+            "slow": 0,
+            "samples": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        """Включен ли хотя бы один способ профилирования"""
+        return bool(self.admin_token) or self.sample_rate > 0 or self.slow_threshold > 0
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        """
+        Проверяет доступ к профилям
+
+        Args:
+            token (Optional[str]): Значение заголовка x-admin-token
+
+        Returns:
+            bool: True, если токен задан и совпадает. Без PROFILE_ADMIN_TOKEN доступа нет:
+                профили содержат пути файлов, стеки и адреса запросов
+        """
+        return bool(self.admin_token) and token == self.admin_token
+
+    def begin(self, scope: dict) -> Optional[RequestTrace]:
+        """
+        Решает, нужна ли трасса HTTP запросу, и начинает ее
+
+        Args:
+            scope (dict): ASGI scope запроса
+
+        Returns:
+            Optional[RequestTrace]: Трасса или None, если запрос не трассируется
+        """
+        reason = None
+        if self.admin_token:
+            for name, value in scope.get("headers", ()):
+                if name == PROFILE_HEADER.encode() and value.decode("latin-1") == self.admin_token:
+                    reason = "header"
+                    break
+        if reason is None and self.sample_rate > 0 and random.random() < self.sample_rate:
+            reason = "sample"
+        if reason is None and self.slow_threshold <= 0:
+            return None
+
+        trace = RequestTrace(scope.get("method", ""), scope.get("path", ""), reason)
+        self.stats["traced"] += 1
+        if reason is not None:
+            self.stats[f"profiled_{reason}"] += 1
+            self.sampler.start(trace)
+        return trace
+
+    def finish(self, trace: RequestTrace, status: str, endpoint: str):
+        """
+        Завершает трассу: сохраняет профиль и, если запрос медленный, кладет его в буфер
+
+        Args:
+            trace (RequestTrace): Трасса запроса
+            status (str): Код ответа
+            endpoint (str): Шаблон маршрута запроса
+        """
+        trace.duration = time.perf_counter() - trace.started
+        trace.status = status
+        trace.endpoint = endpoint
+        if trace.profiled:
+            self.sampler.stop(trace)
+            self.stats["samples"] += trace.sample_count
+            self._profiles.append(trace)
+        if self.slow_threshold > 0 and trace.duration >= self.slow_threshold:
+            self.stats["slow"] += 1
+            self._slow.append(trace)
+            logger.warning(f"Медленный запрос {trace.method} {trace.path}: {trace.duration:.2f} с, "
+                           f"трасса {trace.id}")
+
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        """
+        Возвращает сохраненную трассу по идентификатору
+
+        Args:
+            trace_id (str): Идентификатор трассы (заголовок x-profile-id ответа)
+
+        Returns:
+            Optional[RequestTrace]: Трасса или None, если она уже вытеснена
+        """
+        for trace in list(self._profiles) + list(self._slow):
+            if trace.id == trace_id:
+                return trace
+        return None
+
+    def list_slow(self) -> List[Dict[str, Any]]:
+        """Сводки медленных запросов, от новых к старым"""
+        return [trace.to_dict(details=False) for trace in reversed(list(self._slow))]
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Сводки профилированных запросов, от новых к старым"""
+        return [trace.to_dict(details=False) for trace in reversed(list(self._profiles))]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Возвращает счетчики профилирования
+
+        Returns:
+            Dict[str, Any]: Трассированные и профилированные запросы, медленные, снятые стеки и настройки
+        """
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_threshold": self.slow_threshold,
+            "slow_buffered": len(self._slow),
+            "profiles_buffered": len(self._profiles),
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: начинает трассу запроса, делает ее текущей для стадий анализа и вызовов LLM
+    и добавляет к ответу профилируемого запроса заголовок x-profile-id
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = get_profiler()
+        trace = profiler.begin(scope) if scope["type"] == "http" and profiler.enabled else None
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = current_trace.set(trace)
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if trace.profiled:
+                    headers = list(message.get("headers", []))
+                    headers.append((PROFILE_ID_HEADER.encode(), trace.id.encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            profiler.finish(trace, status, route_template(scope))
+
+
+# Общее профилирование процесса
+_profiler: Optional[RequestProfiler] = None
+
+
+def get_profiler() -> RequestProfiler:
+    """
+    Возвращает общее профилирование. Параметры берутся из переменных окружения:
+    PROFILE_ADMIN_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_SLOW_THRESHOLD, PROFILE_SLOW_BUFFER,
+    PROFILE_MAX_PROFILES и PROFILE_SAMPLE_INTERVAL
+
+    Returns:
+        RequestProfiler: Общее профилирование
+    """
+    global _profiler
+
+    if _profiler is None:
+        load_dotenv()
+
+        _profiler = RequestProfiler(
+            admin_token=os.environ.get("PROFILE_ADMIN_TOKEN", ""),
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+            slow_threshold=float(os.environ.get("PROFILE_SLOW_THRESHOLD", "0")),
+            slow_buffer=int(os.environ.get("PROFILE_SLOW_BUFFER", "100")),
+            max_profiles=int(os.environ.get("PROFILE_MAX_PROFILES", "50")),
+            sample_interval=float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+        )
+
+    return _profiler
+
+
+def _profiling_stats() -> List[str]:
+    """
+    Трассированные, профилированные и медленные запросы
+    """
+    if _profiler is None or not _profiler.enabled:
+        return []
+    stats = _profiler.get_stats()
+    return stats_lines(
+        "profiling_events_total", "Трассированные, профилированные (по заголовку и выборке) и медленные запросы",
+        "counter", "profiler", {"http": {k: stats[k] for k in _profiler.stats}}
+    )
+
+
+register_collector(_profiling_stats)
@@ -0,0 +1,58 @@
+"""
+Шаблоны промптов LLM с постоянным префиксом для кэширования промптов на стороне провайдера
+"""
+
+import hashlib
+from string import Formatter
+from typing import List, Optional, Tuple
+
+
+class PromptTemplate:
+    """
+    Шаблон запроса к LLM: неизменные инструкции в системном сообщении и переменная часть
+    в пользовательском. Провайдеры кэшируют совпадающее начало промптов, поэтому все общее
+    для запросов идет первым и совпадает побайтно, а данные запроса - в конце.
+    Шаблон пользовательского сообщения разбирается один раз при создании
+    """
+
+    def __init__(self, name: str, system: str, user: str):
+        """
+        Разбирает шаблон
+
+        Args:
+            name (str): Имя шаблона для логов и статистики
+            system (str): Системное сообщение, используется как есть (без подстановок)
+            user (str): Шаблон пользовательского сообщения с полями {имя}
+
+        Raises:
+            ValueError: Если в шаблоне пользовательского сообщения есть поля с форматом или позиционные поля
+        """
+        self.name = name
+        self.system = system
+        self._parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in Formatter().parse(user):
+            if field is not None and (not field.isidentifier() or spec or conversion):
+                raise ValueError(f"Шаблон {name}: поддерживаются только поля вида {{имя}}, а не {{{field}}}")
+            self._parts.append((literal, field))
+        self.fields = frozenset(field for _, field in self._parts if field is not None)
+        # Отпечаток префикса: по нему в логах видно, что префикс не менялся между версиями
+        self.prefix_hash = hashlib.sha256(system.encode("utf-8")).hexdigest()[:12]
+
+    def render(self, **values: object) -> Tuple[str, str]:
+        """
+        Подставляет значения в пользовательское сообщение
+
+        Args:
+            **values: Значения полей шаблона
+
+        Returns:
+            Tuple[str, str]: Системное и пользовательское сообщения
+
+        Raises:
+            ValueError: Если не переданы значения всех полей
+        """
+        missing = self.fields - values.keys()
+        if missing:
+            raise ValueError(f"Шаблон {self.name}: не заданы поля {', '.join(sorted(missing))}")
+        user = "".join(literal + (str(values[field]) if field is not None else "") for literal, field in self._parts)
+        return self.system, user
@@ -0,0 +1,440 @@
+"""
+Клиентское ограничение частоты запросов к Proxy API: бюджеты RPM и TPM (token bucket)
+и очередь с приоритетами, в которой интерактивные запросы обслуживаются раньше пакетных
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.services.latency import get_latency_stats
+
+logger = logging.getLogger(__name__)
+
+
+# Приоритеты запросов: меньше - важнее
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+
+class OverloadedError(Exception):
+    """
+    Запрос отклонен: ожидание в очереди превысило бы допустимое время
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Бюджет на минуту: пополняется равномерно, вмещает не больше одной минуты лимита
+    """
+
+    def __init__(self, per_minute: float):
+        """
+        Инициализация бюджета
+
+        Args:
+            per_minute (float): Лимит в минуту
+        """
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """
+        Возвращает, через сколько секунд в бюджете будет amount единиц
+
+        Args:
+            amount (float): Требуемое количество (больше емкости - ждем полный бюджет)
+
+        Returns:
+            float: Время ожидания в секундах
+        """
+        self._refill()
+        needed = min(amount, self.capacity) - self.tokens
+        return max(needed, 0.0) / self.rate
+
+    def consume(self, amount: float):
+        """
+        Списывает amount единиц (бюджет может уйти в минус на величину запроса больше емкости)
+
+        Args:
+            amount (float): Количество единиц
+        """
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        """
+        Возвращает (или, при отрицательном amount, дополнительно списывает) единицы бюджета
+
+        Args:
+            amount (float): Количество единиц
+        """
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def _set_granted(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "future", "event", "granted")
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: Optional[asyncio.Future] = None):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+        # Блокирующий вызов (без future) ждет разрешения в своем потоке
+        self.event = threading.Event() if future is None else None
+        self.granted = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def resolve(self):
+        """Сообщает ожидающему о выданном разрешении (из любого потока)"""
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.future.get_loop().call_soon_threadsafe(_set_granted, self.future)
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Выдает разрешения на запросы к LLM в пределах бюджетов RPM и TPM.
+    Запросы, которые не помещаются в бюджет, ждут в очереди по приоритету;
+    если расчетное ожидание превышает max_wait, запрос сразу отклоняется (OverloadedError)
+    """
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, max_wait: float = 10.0, batch_max_wait: float = 120.0):
+        """
+        Инициализация планировщика
+
+        Args:
+            rpm (int): Лимит запросов в минуту (0 - без ограничения)
+            tpm (int): Лимит токенов в минуту (0 - без ограничения)
+            max_wait (float): Максимальное ожидание интерактивного запроса в очереди в секундах
+            batch_max_wait (float): Максимальное ожидание пакетного запроса в очереди в секундах
+        """
+        self.rpm = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm) if tpm > 0 else None
+        self.max_waits = {PRIORITY_INTERACTIVE: max_wait, PRIORITY_BATCH: batch_max_wait}
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Future] = None
+        self.stats = {
+            "granted": 0,
+            "queued": 0,
+            "shed": 0,
+            "max_queue_depth": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        """
+        Создает планировщик из переменных окружения LLM_RPM, LLM_TPM,
+        LLM_QUEUE_MAX_WAIT и LLM_BATCH_QUEUE_MAX_WAIT
+
+        Returns:
+            LLMScheduler: Планировщик запросов
+        """
+        load_dotenv()
+        return cls(
+            rpm=int(os.environ.get("LLM_RPM", "0")),
+            tpm=int(os.environ.get("LLM_TPM", "0")),
+            max_wait=float(os.environ.get("LLM_QUEUE_MAX_WAIT", "10")),
+            batch_max_wait=float(os.environ.get("LLM_BATCH_QUEUE_MAX_WAIT", "120"))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm is not None or self.tpm is not None
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE,
+                      max_wait: Optional[float] = None) -> float:
+        """
+        Ждет разрешения на запрос
+
+        Args:
+            tokens (int): Оценка токенов запроса (промпт и ответ)
+            priority (int): Приоритет запроса (PRIORITY_INTERACTIVE или PRIORITY_BATCH)
+            max_wait (Optional[float]): Дополнительное ограничение ожидания в секундах
+                (например, оставшееся время до дедлайна вызова)
+
+        Returns:
+            float: Время ожидания в очереди в секундах
+
+        Raises:
+            OverloadedError: Если ожидание превысило бы max_wait
+        """
+        if not self.enabled:
+            return 0.0
+
+        max_wait = self._max_wait(priority, max_wait)
+        started = time.monotonic()
+        with self._lock:
+            if not self._queue and self._wait_time(tokens) == 0:
+                self._grant(tokens)
+                get_latency_stats(f"llm.queue_wait.{PRIORITY_NAMES.get(priority, priority)}").observe(0.0)
+                return 0.0
+
+            wait = self._estimate_wait(tokens, priority)
+            if wait > max_wait:
+                self.stats["shed"] += 1
+                raise OverloadedError(
+                    f"Превышен лимит запросов к LLM, ожидание в очереди около {wait:.1f} с",
+                    retry_after=wait
+                )
+
+            waiter = _Waiter(priority, next(self._seq), tokens, asyncio.get_running_loop().create_future())
+            self._enqueue(waiter)
+            self._wake()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        waited = time.monotonic() - started
+        get_latency_stats(f"llm.queue_wait.{PRIORITY_NAMES.get(priority, priority)}").observe(waited)
+        return waited
+
+    def acquire_blocking(self, tokens: int, max_wait: Optional[float] = None) -> float:
+        """
+        Ждет разрешения на блокирующий вызов в текущем потоке. Такие вызовы стоят в общей
+        очереди с пакетным приоритетом, поэтому интерактивные запросы обслуживаются раньше них
+
+        Args:
+            tokens (int): Оценка токенов запроса (промпт и ответ)
+            max_wait (Optional[float]): Дополнительное ограничение ожидания в секундах
+
+        Returns:
+            float: Время ожидания в секундах
+
+        Raises:
+            OverloadedError: Если ожидание превысило бы max_wait
+        """
+        if not self.enabled:
+            return 0.0
+
+        max_wait = self._max_wait(PRIORITY_BATCH, max_wait)
+        started = time.monotonic()
+        with self._lock:
+            if not self._queue and self._wait_time(tokens) == 0:
+                self._grant(tokens)
+                get_latency_stats(f"llm.queue_wait.{PRIORITY_NAMES[PRIORITY_BATCH]}").observe(0.0)
+                return 0.0
+
+            wait = self._estimate_wait(tokens, PRIORITY_BATCH)
+            if wait > max_wait:
+                self.stats["shed"] += 1
+                raise OverloadedError(
+                    f"Превышен лимит запросов к LLM, ожидание в очереди около {wait:.1f} с",
+                    retry_after=wait
+                )
+
+            waiter = _Waiter(PRIORITY_BATCH, next(self._seq), tokens)
+            self._enqueue(waiter)
+
+        try:
+            # Без event loop диспетчера очередь разбирает сам ожидающий поток
+            while not waiter.granted:
+                with self._lock:
+                    wait = self._grant_ready()
+                if waiter.event.wait(timeout=max(wait, 0.001)):
+                    break
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+        waited = time.monotonic() - started
+        get_latency_stats(f"llm.queue_wait.{PRIORITY_NAMES[PRIORITY_BATCH]}").observe(waited)
+        return waited
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """
+        Уточняет списанный бюджет TPM по фактическому расходу токенов из ответа
+
+        Args:
+            estimated (int): Оценка, с которой запрос был допущен
+            actual (Optional[int]): Фактическое количество токенов (usage.total_tokens)
+        """
+        if self.tpm is None or actual is None:
+            return
+        with self._lock:
+            self.tpm.refund(estimated - actual)
+
+    def _max_wait(self, priority: int, max_wait: Optional[float]) -> float:
+        limit = self.max_waits.get(priority, self.max_waits[PRIORITY_BATCH])
+        return limit if max_wait is None else min(max_wait, limit)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.rpm is not None:
+            wait = max(wait, self.rpm.time_until(1))
+        if self.tpm is not None:
+            wait = max(wait, self.tpm.time_until(tokens))
+        return wait
+
+    def _estimate_wait(self, tokens: int, priority: int) -> float:
+        """
+        Оценивает ожидание нового запроса: бюджет нужен ему и всем запросам с тем же
+        или более высоким приоритетом, уже стоящим в очереди. Как и в TokenBucket.time_until,
+        бюджет сначала пополняется, а запрос больше емкости ждет только полный бюджет
+        """
+        ahead = [w for w in self._queue if w.priority <= priority]
+        wait = 0.0
+        if self.rpm is not None:
+            self.rpm._refill()
+            wait = max(wait, (len(ahead) + 1 - self.rpm.tokens) / self.rpm.rate)
+        if self.tpm is not None:
+            self.tpm._refill()
+            capacity = self.tpm.capacity
+            needed = sum(min(w.tokens, capacity) for w in ahead) + min(tokens, capacity)
+            wait = max(wait, (needed - self.tpm.tokens) / self.tpm.rate)
+        return max(wait, 0.0)
+
+    def _grant(self, tokens: int):
+        if self.rpm is not None:
+            self.rpm.consume(1)
+        if self.tpm is not None:
+            self.tpm.consume(tokens)
+        self.stats["granted"] += 1
+
+    def _refund(self, tokens: int):
+        if self.rpm is not None:
+            self.rpm.refund(1)
+        if self.tpm is not None:
+            self.tpm.refund(tokens)
+
+    def _enqueue(self, waiter: _Waiter):
+        # Вызывается под блокировкой
+        heapq.heappush(self._queue, waiter)
+        self.stats["queued"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._queue))
+
+    def _abandon(self, waiter: _Waiter):
+        """Убирает прерванный запрос из очереди или возвращает уже выданный ему бюджет"""
+        with self._lock:
+            if waiter.granted:
+                self._refund(waiter.tokens)
+            elif waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+
+    def _grant_ready(self) -> float:
+        """
+        Выдает разрешения запросам из головы очереди, пока позволяет бюджет.
+        Вызывается под блокировкой
+
+        Returns:
+            float: Через сколько секунд бюджета хватит следующему запросу (0 - очередь пуста)
+        """
+        while self._queue:
+            head = self._queue[0]
+            if head.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            wait = self._wait_time(head.tokens)
+            if wait > 0:
+                return wait
+            heapq.heappop(self._queue)
+            self._grant(head.tokens)
+            head.resolve()
+        return 0.0
+
+    def _wake(self):
+        """Будит диспетчер очереди (и запускает его в текущем event loop при необходимости)"""
+        loop = asyncio.get_running_loop()
+        if self._wakeup is not None and not self._wakeup.done() and self._wakeup.get_loop() is loop:
+            self._wakeup.set_result(None)
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        """
+        Выдает разрешения запросам из очереди по приоритету, как только позволяет бюджет
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                wait = self._grant_ready()
+                if not self._queue:
+                    self._dispatcher = None
+                    return
+                self._wakeup = loop.create_future()
+                wakeup = self._wakeup
+
+            # Ждем пополнения бюджета или появления более важного запроса
+            try:
+                await asyncio.wait_for(wakeup, timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Возвращает счетчики планировщика, текущую глубину очереди и остаток бюджетов
+
+        Returns:
+            Dict[str, object]: Статистика планировщика
+        """
+        with self._lock:
+            depth: Dict[str, int] = {}
+            for waiter in self._queue:
+                name = PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))
+                depth[name] = depth.get(name, 0) + 1
+            return {
+                "enabled": self.enabled,
+                **self.stats,
+                "queue_depth": len(self._queue),
+                "queue_depth_by_priority": depth,
+                "rpm_available": round(self.rpm.tokens, 1) if self.rpm is not None else None,
+                "tpm_available": round(self.tpm.tokens, 1) if self.tpm is not None else None,
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """
+    Возвращает общий для процесса планировщик запросов к LLM
+
+    Returns:
+        LLMScheduler: Планировщик запросов
+    """
+    global _scheduler
+
+    if _scheduler is None:
+        _scheduler = LLMScheduler.from_env()
+    return _scheduler
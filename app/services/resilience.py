@@ -0,0 +1,403 @@
+"""
+Политика вызовов LLM: дедлайны, повторы с экспоненциальной задержкой,
+дублирующие (hedged) запросы и автоматический выключатель (circuit breaker)
+"""
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from dotenv import load_dotenv
+from openai import APIConnectionError, APIStatusError
+
+from app.services.latency import get_latency_stats
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """
+    Выключатель разомкнут: LLM недавно был недоступен, вызов не выполнялся
+    """
+
+
+class CircuitBreaker:
+    """
+    Размыкается после серии подряд идущих сбоев и не пропускает вызовы reset_timeout секунд.
+    Затем пропускает один пробный вызов: успех замыкает выключатель, сбой снова размыкает
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Инициализация выключателя
+
+        Args:
+            failure_threshold (int): Количество сбоев подряд, после которого выключатель размыкается
+            reset_timeout (float): Сколько секунд выключатель остается разомкнутым
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Проверяет, можно ли выполнить вызов
+
+        Returns:
+            bool: True, если вызов разрешен
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def is_open(self) -> bool:
+        """
+        Проверяет, что выключатель разомкнут и время ожидания не истекло, не занимая пробный вызов
+
+        Returns:
+            bool: True, если вызов сейчас будет отклонен
+        """
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("LLM снова доступен, выключатель замкнут")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"LLM недоступен ({self._failures} сбоев подряд), выключатель разомкнут")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """
+        Освобождает пробный вызов, завершившийся без сбоя LLM (например, ошибкой запроса)
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Возвращает задержку из заголовков Retry-After / Retry-After-Ms ответа с ошибкой
+
+    Args:
+        error (Exception): Ошибка SDK
+
+    Returns:
+        Optional[float]: Задержка в секундах или None
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        # Retry-After может содержать HTTP-дату
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Проверяет, что ошибка временная: сетевая ошибка, таймаут, 429 или 5xx
+
+    Args:
+        error (Exception): Ошибка вызова
+
+    Returns:
+        bool: True, если вызов имеет смысл повторить
+    """
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+class CallPolicy:
+    """
+    Выполняет вызов LLM с общим дедлайном, повторами временных ошибок и выключателем.
+    Асинхронные вызовы дополнительно могут дублироваться, если ответ задерживается дольше p95
+    """
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0,
+                 deadline: float = 60.0, hedge: bool = False, hedge_min_samples: int = 20,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Инициализация политики
+
+        Args:
+            max_retries (int): Количество повторов после первой попытки
+            base_delay (float): Базовая задержка перед повтором в секундах
+            max_delay (float): Максимальная задержка перед повтором в секундах
+            deadline (float): Дедлайн вызова по умолчанию (все попытки вместе) в секундах
+            hedge (bool): Дублировать асинхронные запросы, задержавшиеся дольше p95
+            hedge_min_samples (int): Сколько измерений нужно для оценки p95 перед дублированием
+            breaker (Optional[CircuitBreaker]): Выключатель (None - не использовать)
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "short_circuited": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "CallPolicy":
+        """
+        Создает политику из переменных окружения LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY,
+        LLM_RETRY_MAX_DELAY, LLM_DEADLINE, LLM_HEDGE_ENABLED, LLM_HEDGE_MIN_SAMPLES,
+        LLM_BREAKER_FAILURES и LLM_BREAKER_RESET_TIMEOUT
+
+        Returns:
+            CallPolicy: Политика вызовов
+        """
+        load_dotenv()
+        breaker_failures = int(os.environ.get("LLM_BREAKER_FAILURES", "5"))
+        breaker = CircuitBreaker(
+            breaker_failures,
+            float(os.environ.get("LLM_BREAKER_RESET_TIMEOUT", "30"))
+        ) if breaker_failures > 0 else None
+
+        return cls(
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", "2")),
+            base_delay=float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.environ.get("LLM_RETRY_MAX_DELAY", "8")),
+            deadline=float(os.environ.get("LLM_DEADLINE", os.environ.get("OPENAI_TIMEOUT", "60"))),
+            hedge=os.environ.get("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes"),
+            hedge_min_samples=int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20")),
+            breaker=breaker
+        )
+
+    def call(self, fn: Callable[[float], T], name: str, deadline: Optional[float] = None) -> T:
+        """
+        Выполняет блокирующий вызов
+
+        Args:
+            fn (Callable[[float], T]): Вызов, принимающий таймаут попытки в секундах
+            name (str): Имя вызова для статистики задержек llm.<name>
+            deadline (Optional[float]): Дедлайн вызова в секундах (по умолчанию из политики)
+
+        Returns:
+            T: Результат вызова
+
+        Raises:
+            CircuitOpenError: Если выключатель разомкнут
+        """
+        expires = self._start(deadline)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = fn(self._remaining(expires))
+            except Exception as e:
+                delay = self._on_error(e, attempt, expires)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._on_success(name, time.perf_counter() - started)
+            return result
+
+    async def acall(self, fn: Callable[[float], Awaitable[T]], name: str, deadline: Optional[float] = None) -> T:
+        """
+        Выполняет асинхронный вызов
+
+        Args:
+            fn (Callable[[float], Awaitable[T]]): Фабрика корутины, принимающая таймаут попытки в секундах
+            name (str): Имя вызова для статистики задержек llm.<name>
+            deadline (Optional[float]): Дедлайн вызова в секундах (по умолчанию из политики)
+
+        Returns:
+            T: Результат вызова
+
+        Raises:
+            CircuitOpenError: Если выключатель разомкнут
+        """
+        expires = self._start(deadline)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                result = await self._ahedged(fn, name, expires)
+            except asyncio.CancelledError:
+                if self.breaker is not None:
+                    self.breaker.release()
+                raise
+            except Exception as e:
+                delay = self._on_error(e, attempt, expires)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._on_success(name, time.perf_counter() - started)
+            return result
+
+    async def _ahedged(self, fn: Callable[[float], Awaitable[T]], name: str, expires: float) -> T:
+        """
+        Выполняет попытку; если ответа нет дольше p95, запускает дублирующий запрос
+        и возвращает первый успешный ответ
+        """
+        timeout = self._remaining(expires)
+        delay = self._hedge_delay(name)
+        if delay is None or delay >= timeout:
+            return await fn(timeout)
+
+        first = asyncio.ensure_future(fn(timeout))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.stats["hedges"] += 1
+        hedge = asyncio.ensure_future(fn(self._remaining(expires)))
+        pending = {first, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        stats = get_latency_stats(f"llm.{name}")
+        if stats.count < self.hedge_min_samples:
+            return None
+        return stats.percentile(95)
+
+    def _start(self, deadline: Optional[float]) -> float:
+        self.stats["calls"] += 1
+        if self.breaker is not None and not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            raise CircuitOpenError("LLM временно недоступен (выключатель разомкнут)")
+        return time.monotonic() + (deadline if deadline is not None else self.deadline)
+
+    @staticmethod
+    def _remaining(expires: float) -> float:
+        return max(expires - time.monotonic(), 0.001)
+
+    def _on_success(self, name: str, elapsed: float):
+        get_latency_stats(f"llm.{name}").observe(elapsed)
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _on_error(self, error: Exception, attempt: int, expires: float) -> float:
+        """
+        Решает, повторять ли вызов после ошибки
+
+        Returns:
+            float: Задержка перед повтором в секундах
+
+        Raises:
+            Exception: Исходная ошибка, если повтор невозможен
+        """
+        retryable = is_retryable(error)
+        if retryable and attempt < self.max_retries:
+            # Полный джиттер, но не раньше, чем просит сервер
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            delay = max(delay, _retry_after(error) or 0.0)
+            if time.monotonic() + delay < expires:
+                self.stats["retries"] += 1
+                logger.warning(f"Временная ошибка LLM, повтор через {delay:.2f} с: {str(error)}")
+                return delay
+
+        if self.breaker is not None:
+            if retryable:
+                self.breaker.record_failure()
+            else:
+                # Ошибка запроса (например, 400) не говорит о недоступности LLM
+                self.breaker.release()
+        if retryable:
+            self.stats["failures"] += 1
+        raise error
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Возвращает счетчики политики и состояние выключателя
+
+        Returns:
+            Dict[str, object]: Счетчики вызовов, повторов, дублирований и отказов
+        """
+        stats: Dict[str, object] = dict(self.stats)
+        stats["breaker"] = self.breaker.state if self.breaker is not None else "disabled"
+        return stats
+
+
+_policy: Optional[CallPolicy] = None
+
+
+def get_call_policy() -> CallPolicy:
+    """
+    Возвращает общую для процесса политику вызовов LLM
+
+    Returns:
+        CallPolicy: Политика вызовов
+    """
+    global _policy
+
+    if _policy is None:
+        _policy = CallPolicy.from_env()
+    return _policy
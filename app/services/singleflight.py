@@ -0,0 +1,91 @@
+"""
+Объединение одновременных одинаковых запросов (single-flight)
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Пока запрос с данным ключом выполняется, повторные вызовы с тем же ключом
+    не запускают работу заново, а ждут и получают тот же результат (или ту же ошибку)
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {
+            "calls": 0,
+            "executions": 0,
+            "coalesced": 0,
+        }
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет fn или присоединяется к уже выполняющемуся вызову с тем же ключом
+
+        Args:
+            key (Hashable): Ключ запроса
+            fn (Callable[[], Awaitable[Any]]): Фабрика корутины, выполняющей работу
+
+        Returns:
+            Any: Результат работы
+        """
+        self.stats["calls"] += 1
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+
+        # Отмена одного ожидающего (например, клиент отключился) не отменяет работу для остальных
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Возвращает счетчики вызовов
+
+        Returns:
+            Dict[str, int]: Всего вызовов, реальных выполнений и объединенных вызовов
+        """
+        stats = dict(self.stats)
+        stats["inflight"] = len(self._inflight)
+        return stats
+
+
+# Именованные группы, общие для всех экземпляров сервисов
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    """
+    Возвращает (и при необходимости создает) группу объединения запросов по имени
+
+    Args:
+        name (str): Имя группы
+
+    Returns:
+        SingleFlight: Группа объединения запросов
+    """
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight()
+        return _groups[name]
+
+
+def all_singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Возвращает счетчики всех групп
+
+    Returns:
+        Dict[str, Dict[str, int]]: Счетчики по именам групп
+    """
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: group.get_stats() for name, group in groups.items()}
@@ -0,0 +1,90 @@
+"""
+Бенчмарк пропускной способности /analyze-site при N одновременных медленных сайтах
+
+Сравнивает блокирующий конвейер (SiteAnalyzer.analyze_site в event loop)
+с асинхронным (SiteAnalyzer.aanalyze_site) и меряет задержку /health под нагрузкой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_async_analyze --concurrency 20 --site-latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.mock_servers import MockLLMServer, MockSiteServer
+
+
+async def _run(app, site_url: str, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def analyze(i: int):
+            # Разные URL, чтобы одинаковые запросы не объединялись в один
+            response = await client.post("/analyze-site", json={"url": f"{site_url}/?page={i}"})
+            response.raise_for_status()
+
+        async def health():
+            # Даем запросам анализа стартовать, затем меряем /health.
+            # Отсчет идет от момента, когда запрос должен был уйти
+            await asyncio.sleep(0.05)
+            await client.get("/health")
+            return time.perf_counter() - started - 0.05
+
+        started = time.perf_counter()
+        results = await asyncio.gather(health(), *(analyze(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed": elapsed,
+        "throughput": concurrency / elapsed,
+        "health_latency": results[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--site-latency", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with MockSiteServer(latency=args.site_latency) as site, MockLLMServer(latency=args.llm_latency) as llm:
+        os.environ["OPENAI_API_KEY"] = "bench"
+        os.environ["OPENAI_BASE_URL"] = f"{llm.url}/v1"
+        # Кэши сделали бы второй прогон нечестно быстрым
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+        os.environ["PAGE_CACHE_ENABLED"] = "false"
+
+        from app.main import app
+        from app.services.container import get_services
+
+        site_analyzer = get_services().site_analyzer
+
+        async_result = asyncio.run(_run(app, site.url, args.concurrency))
+
+        # Эмулируем прежнее поведение: синхронный конвейер прямо в обработчике
+        original = site_analyzer.aanalyze_site
+
+        async def blocking_analyze(url, no_cache=False, **kwargs):
+            return site_analyzer.analyze_site(url, no_cache=no_cache)
+
+        site_analyzer.aanalyze_site = blocking_analyze
+        try:
+            blocking_result = asyncio.run(_run(app, site.url, args.concurrency))
+        finally:
+            site_analyzer.aanalyze_site = original
+
+    print(f"Одновременных запросов: {args.concurrency}, задержка сайта: {args.site_latency}s, LLM: {args.llm_latency}s")
+    for name, result in (("blocking", blocking_result), ("async", async_result)):
+        print(
+            f"{name:>8}: {result['elapsed']:.2f}s, "
+            f"{result['throughput']:.1f} req/s, "
+            f"/health {result['health_latency'] * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Бенчмарк обхода сайта и инкрементального повторного обхода
+
+Обходит mock-сайт из --pages страниц с задержкой ответа --site-latency, затем меняет
+--changed страниц и обходит его повторно. Вариант с sitemap.xml (lastmod) пропускает
+неизменившиеся страницы без запросов, вариант без sitemap перепроверяет их условным GET.
+Выводит время обходов, число запросов к сайту и скачанных страниц и состояния страниц.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_crawl --pages 200 --changed 5 --site-latency 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.mock_servers import MockCrawlSiteServer, MockLLMServer
+
+
+async def _crawl(crawler, site: MockCrawlSiteServer) -> dict:
+    requests_before, pages_before = site.requests_count, site.pages_sent
+    started = time.perf_counter()
+    result = await crawler.acrawl(site.url)
+    return {
+        "elapsed": time.perf_counter() - started,
+        "requests": site.requests_count - requests_before,
+        "downloads": site.pages_sent - pages_before,
+        "crawl": result["crawl"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--changed", type=int, default=5, help="Сколько страниц меняется перед повторным обходом")
+    parser.add_argument("--fanout", type=int, default=5, help="Ссылок на дочерние страницы с каждой страницы")
+    parser.add_argument("--site-latency", type=float, default=0.02, help="Задержка ответа сайта, с")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with MockLLMServer() as llm:
+        os.environ.update(OPENAI_API_KEY="bench", OPENAI_BASE_URL=f"{llm.url}/v1")
+
+        from app.services.analyzer import SiteAnalyzer
+        from app.services.crawler import SiteCrawler
+
+        print(f"Страниц: {args.pages}, изменено перед повторным обходом: {args.changed}, "
+              f"задержка сайта: {args.site_latency * 1000:.0f} мс, параллелизм: {args.concurrency}")
+        for sitemap in (True, False):
+            with MockCrawlSiteServer(pages=args.pages, fanout=args.fanout, sitemap=sitemap,
+                                     latency=args.site_latency) as site:
+                crawler = SiteCrawler(SiteAnalyzer(), max_depth=args.pages, max_pages=args.pages,
+                                      concurrency=args.concurrency)
+
+                async def scenario():
+                    first = await _crawl(crawler, site)
+                    for index in range(1, args.changed + 1):
+                        site.change(index * (args.pages // (args.changed + 1)))
+                    second = await _crawl(crawler, site)
+                    await crawler.analyzer.aclose()
+                    return first, second
+
+                first, second = asyncio.run(scenario())
+                name = "sitemap с lastmod" if sitemap else "только ссылки"
+                for label, run in (("первый обход", first), ("повторный", second)):
+                    states = {k: v for k, v in run["crawl"].items() if k not in ("elapsed", "pages") and v}
+                    print(f"{name:>17}, {label:>12}: {run['elapsed']:.2f}s, запросов {run['requests']}, "
+                          f"скачано страниц {run['downloads']}, состояния {states}")
+
+
+if __name__ == "__main__":
+    main()
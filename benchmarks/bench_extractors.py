@@ -0,0 +1,74 @@
+"""
+Бенчмарк движков извлечения текста из HTML: время и пиковая память
+
+По умолчанию генерирует синтетический корпус страниц разных размеров со скриптами,
+стилями и svg. Можно передать каталог с сохраненными страницами (*.html).
+Пиковая память меряется через tracemalloc, поэтому выделения внутри libxml2 (lxml) не учитываются.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_extractors --corpus ./saved_pages --budget 8000
+"""
+
+import argparse
+import pathlib
+import time
+import tracemalloc
+
+from app.services.extractors import EXTRACTORS, etree, get_extractor
+from benchmarks.mock_servers import build_page
+
+
+def synthetic_corpus() -> list:
+    noise = (
+        "<script>" + "var data = {'k': [1, 2, 3]};" * 200 + "</script>"
+        "<style>" + ".cls { color: red; }" * 200 + "</style>"
+        "<svg><path d='" + "M0 0 L10 10 " * 200 + "'/></svg>"
+    )
+    pages = []
+    for size in (20_000, 200_000, 1_000_000, 3_000_000):
+        page = build_page(size)
+        pages.append(page.replace("<body>", "<body>" + noise * 3 + "<nav>Главная | Каталог | Контакты</nav>"))
+    return pages
+
+
+def load_corpus(path: str) -> list:
+    return [p.read_text(encoding="utf-8", errors="replace") for p in sorted(pathlib.Path(path).glob("*.html"))]
+
+
+def measure(extractor, pages: list, budget) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    for page in pages:
+        extractor.extract(page, budget)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Каталог с сохраненными страницами *.html")
+    parser.add_argument("--budget", type=int, default=8000, help="Бюджет символов для потоковых движков")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    total_mb = sum(len(p) for p in pages) / 1024 / 1024
+    print(f"Страниц: {len(pages)}, объем: {total_mb:.1f} MB, бюджет: {args.budget} символов, повторов: {args.repeats}")
+
+    for name in EXTRACTORS:
+        if name == "lxml" and etree is None:
+            print(f"{name:>10}: lxml не установлен")
+            continue
+        extractor = get_extractor(name)
+        # Исходный путь разбирает страницу целиком, бюджет ему не передаем
+        budget = None if name == "soup" else args.budget
+        runs = [measure(extractor, pages, budget) for _ in range(args.repeats)]
+        elapsed = min(r[0] for r in runs)
+        peak = max(r[1] for r in runs)
+        print(f"{name:>10}: {elapsed * 1000:8.1f} ms, пик памяти {peak / 1024 / 1024:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Бенчмарк клиентов скачивания: переиспользование соединений и кэш DNS
+
+Скачивает --requests страниц с mock-сайта по имени localhost (чтобы работал DNS)
+с конкурентностью --concurrency двумя способами: новое соединение и разрешение имени
+на каждый запрос (как при отдельном клиенте на запрос) и через Fetcher с пулом
+соединений и кэшем DNS. Каждое новое соединение mock-сайт задерживает на
+--connect-latency, моделируя рукопожатия TCP и TLS, которых на loopback нет.
+Выводит время, число соединений, принятых сервером, и статистику Fetcher.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_fetcher --requests 500 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.services.fetcher import DnsCache, Fetcher
+from benchmarks.mock_servers import MockSiteServer
+
+
+async def _fetch_all(fetcher: Fetcher, url: str, requests: int, concurrency: int) -> float:
+    issued = 0
+
+    async def user():
+        nonlocal issued
+        while issued < requests:
+            issued += 1
+            async with fetcher.astream("GET", f"{url}/?page={issued}") as response:
+                response.raise_for_status()
+                async for _ in response.aiter_bytes():
+                    pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await fetcher.aclose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=20000)
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="Задержка нового соединения, с")
+    parser.add_argument("--per-host", type=int, default=6, help="Максимум соединений с хостом")
+    args = parser.parse_args()
+
+    variants = {
+        "без переиспользования": Fetcher(max_per_host=args.per_host, keepalive_expiry=0, dns=DnsCache(ttl=0)),
+        "пул и кэш DNS": Fetcher(max_per_host=args.per_host),
+    }
+    with MockSiteServer(page_size=args.page_size, connect_latency=args.connect_latency) as site:
+        url = site.url.replace("127.0.0.1", "localhost")
+        print(f"Запросов: {args.requests}, конкурентность: {args.concurrency}, HTTP/2: "
+              f"{'да' if variants['пул и кэш DNS'].http2 else 'нет (mock-сайт и так HTTP/1.1)'}")
+        for name, fetcher in variants.items():
+            connections_before = site.connections_count
+            elapsed = asyncio.run(_fetch_all(fetcher, url, args.requests, args.concurrency))
+            stats = fetcher.get_stats()
+            print(
+                f"{name:>22}: {elapsed:.2f}s, {args.requests / elapsed:.0f} req/s, "
+                f"соединений на сервере {site.connections_count - connections_before}, "
+                f"переиспользование {stats['reuse_ratio']:.0%}, DNS {stats['dns']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Бенчмарк индекса почти одинаковых страниц
+
+Анализирует --urls адресов mock-сайта: --variants вариантов одной страницы (параметр variant
+меняет одну фразу текста) с разными метками utm_*. Сравнивает запуск без индекса и с индексом
+и выводит время, число запросов к mock-LLM и статистику индекса. Кэш ответов LLM выключен,
+чтобы экономия была видна только от индекса.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_near_duplicates --urls 100 --variants 10 --llm-latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.mock_servers import MockLLMServer, MockSiteServer
+
+
+async def _analyze(analyzer, urls) -> float:
+    started = time.perf_counter()
+    for url in urls:
+        await analyzer.aanalyze_site(url)
+    elapsed = time.perf_counter() - started
+    await analyzer.aclose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=100)
+    parser.add_argument("--variants", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--page-size", type=int, default=20000)
+    args = parser.parse_args()
+
+    with MockSiteServer(page_size=args.page_size) as site, MockLLMServer(latency=args.llm_latency) as llm:
+        os.environ.update(OPENAI_API_KEY="bench", OPENAI_BASE_URL=f"{llm.url}/v1", LLM_CACHE_ENABLED="false")
+
+        from app.services.analyzer import SiteAnalyzer
+        from app.services.near_duplicates import NearDuplicateIndex, canonicalize_url
+
+        urls = [f"{site.url}/item?variant={i % args.variants}&utm_source=ad{i}" for i in range(args.urls)]
+        print(f"URL: {args.urls}, разных канонических URL: {len({canonicalize_url(url) for url in urls})}, "
+              f"задержка LLM: {args.llm_latency * 1000:.0f} мс")
+        for name, index in (("без индекса", None), ("с индексом", NearDuplicateIndex())):
+            analyzer = SiteAnalyzer()
+            analyzer.near_duplicates = index
+            requests_before = llm.requests_count
+            elapsed = asyncio.run(_analyze(analyzer, urls))
+            stats = f", индекс {index.get_stats()}" if index is not None else ""
+            print(f"{name:>12}: {elapsed:.2f}s, запросов к LLM {llm.requests_count - requests_before}{stats}")
+
+
+if __name__ == "__main__":
+    main()
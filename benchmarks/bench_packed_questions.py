@@ -0,0 +1,65 @@
+"""
+Бенчмарк пакетной генерации вопросов
+
+Анализирует --urls разных страниц mock-сайта через analyze_batch при лимите LLM_RPM запросов
+в минуту и сравнивает запуск, где каждая страница - отдельный запрос к LLM, с запуском, где
+страницы упаковываются по несколько в один запрос. Выводит время, число запросов к mock-LLM
+и статистику пакетов. Кэш ответов LLM и индекс почти одинаковых страниц выключены.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_packed_questions --urls 30 --rpm 20 --llm-latency 0.3
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.mock_servers import MockLLMServer, MockSiteServer
+
+
+async def _analyze(analyzer, urls) -> tuple:
+    from app.services.batch import StageLimits, analyze_batch
+
+    started = time.perf_counter()
+    errors = 0
+    async for result in analyze_batch(analyzer, urls, concurrency=len(urls), limits=StageLimits.from_env()):
+        errors += "error" in result
+    elapsed = time.perf_counter() - started
+    await analyzer.aclose()
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--urls", type=int, default=30)
+    parser.add_argument("--rpm", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--page-size", type=int, default=4000)
+    args = parser.parse_args()
+
+    with MockSiteServer(page_size=args.page_size) as site, MockLLMServer(latency=args.llm_latency) as llm:
+        os.environ.update(OPENAI_API_KEY="bench", OPENAI_BASE_URL=f"{llm.url}/v1", LLM_CACHE_ENABLED="false",
+                          NEAR_DUP_ENABLED="false", LLM_RPM=str(args.rpm), BATCH_LLM_CONCURRENCY=str(args.urls),
+                          LLM_BATCH_QUEUE_MAX_WAIT="600")
+
+        from app.services import rate_limiter
+        from app.services.analyzer import SiteAnalyzer
+
+        # Разный текст страниц, чтобы одинаковые промпты не объединялись в один запрос
+        urls = [f"{site.url}/page{i}?variant={i}" for i in range(args.urls)]
+        print(f"URL: {args.urls}, LLM_RPM: {args.rpm}, задержка LLM: {args.llm_latency * 1000:.0f} мс")
+        for name, enabled in (("по одной", "false"), ("пакетами", "true")):
+            os.environ["QUESTIONS_BATCH_ENABLED"] = enabled
+            # Новый планировщик: лимит запросов в минуту отсчитывается заново
+            rate_limiter._scheduler = None
+            analyzer = SiteAnalyzer()
+            requests_before = llm.requests_count
+            elapsed, errors = asyncio.run(_analyze(analyzer, urls))
+            stats = f", пакеты {analyzer.question_batcher.get_stats()}" if analyzer.question_batcher else ""
+            print(f"{name:>9}: {elapsed:.2f}s, запросов к LLM {llm.requests_count - requests_before}, "
+                  f"ошибок {errors}{stats}")
+
+
+if __name__ == "__main__":
+    main()
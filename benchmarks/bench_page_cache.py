@@ -0,0 +1,55 @@
+"""
+Бенчмарк кэша страниц: повторные скачивания одной страницы с ETag
+
+Сравнивает время SiteAnalyzer.afetch_site_text без кэша и с кэшем условных GET
+и выводит метрики кэша (ответы 304, сэкономленные байты).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_page_cache --repeats 50 --page-size 500000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.mock_servers import MockSiteServer
+
+
+async def _fetch(analyzer, url: str, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        await analyzer.afetch_site_text(url)
+    elapsed = time.perf_counter() - started
+    await analyzer.aclose()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=500000)
+    args = parser.parse_args()
+
+    os.environ.pop("OPENAI_API_KEY", None)
+
+    from app.services import analyzer as analyzer_module
+    from app.services.page_cache import PageCache
+
+    with MockSiteServer(page_size=args.page_size, validators=True) as site:
+        uncached = analyzer_module.SiteAnalyzer()
+        uncached.page_cache = None
+        uncached_time = asyncio.run(_fetch(uncached, site.url, args.repeats))
+
+        cached = analyzer_module.SiteAnalyzer()
+        cached.page_cache = PageCache()
+        cached_time = asyncio.run(_fetch(cached, site.url, args.repeats))
+
+        print(f"Повторов: {args.repeats}, размер страницы: {args.page_size} символов")
+        print(f"без кэша: {uncached_time:.2f}s")
+        print(f" с кэшем: {cached_time:.2f}s, ответов 304 от сервера: {site.not_modified_count}")
+        print(f"метрики кэша: {cached.page_cache.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Бенчмарк раскладки промпта генерации вопросов для кэша префикса провайдера
+
+Отправляет в mock-LLM промпты для --requests разных сайтов в прежней раскладке
+(текст сайта внутри системного сообщения) и по шаблону QUESTIONS_PROMPT (постоянные
+инструкции, текст сайта в конце пользовательского сообщения) и выводит долю токенов
+промпта, которую mock вернул как cached_tokens, и время сборки промпта.
+OpenAI кэширует префиксы от 1024 токенов; --min-cached-tokens задает этот порог для mock.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_prompts --requests 50 --min-cached-tokens 0
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import timeit
+
+from benchmarks.mock_servers import MockLLMServer
+
+WORDS = "тариф доставка оплата гарантия возврат скидка магазин заказ курьер самовывоз".split()
+
+LEGACY_SYSTEM_PROMPT = """Ты пользователь сайта. Вот текст сайта: {site_text}
+
+В ответе в формате JSON выдай список из 5 вопросов, которые возникли после посещения сайта.
+
+Формат ответа:
+{{
+    "questions": [
+        "Вопрос 1",
+        "Вопрос 2",
+        "Вопрос 3",
+        "Вопрос 4",
+        "Вопрос 5"
+    ]
+}}"""
+
+LEGACY_USER_PROMPT = "Проанализируй текст сайта и сформулируй 5 вопросов, которые могут возникнуть у пользователя после его изучения."
+
+
+def _legacy_prompts(text: str):
+    return LEGACY_SYSTEM_PROMPT.format(site_text=text), LEGACY_USER_PROMPT
+
+
+async def _send(client, build, texts) -> dict:
+    from app.services.analyzer import QuestionsResponse
+    from app.services.openai_module import get_usage_stats
+
+    before = get_usage_stats()
+    for text in texts:
+        system_prompt, user_prompt = build(text)
+        await client.achat_json(system_prompt, user_prompt, no_cache=True, schema=QuestionsResponse)
+    after = get_usage_stats()
+    prompt_tokens = after["prompt_tokens"] - before["prompt_tokens"]
+    cached_tokens = after["cached_tokens"] - before["cached_tokens"]
+    return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens,
+            "cached_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--text-words", type=int, default=1500, help="Слов в тексте сайта")
+    parser.add_argument("--min-cached-tokens", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(1)
+    texts = [f"Сайт {i}. " + " ".join(random.choices(WORDS, k=args.text_words)) for i in range(args.requests)]
+
+    with MockLLMServer() as llm:
+        llm.prefix_cache_min_tokens = args.min_cached_tokens
+        os.environ.update(OPENAI_API_KEY="bench", OPENAI_BASE_URL=f"{llm.url}/v1", LLM_CACHE_ENABLED="false")
+
+        from app.services.analyzer import QUESTIONS_PROMPT
+        from app.services.openai_module import LLMClient
+
+        client = LLMClient()
+        variants = {"текст в системном": _legacy_prompts, "шаблон": lambda text: QUESTIONS_PROMPT.render(site_text=text)}
+        print(f"Запросов: {args.requests}, постоянный префикс шаблона: ~{len(QUESTIONS_PROMPT.system) // 4} токенов, "
+              f"порог кэша mock: {args.min_cached_tokens} токенов")
+        for name, build in variants.items():
+            result = asyncio.run(_send(client, build, texts))
+            render = min(timeit.repeat(lambda: build(texts[0]), number=1000, repeat=3)) / 1000
+            print(f"{name:>18}: токенов промпта {result['prompt_tokens']}, из кэша {result['cached_tokens']} "
+                  f"({result['cached_ratio']:.0%}), сборка промпта {render * 1e6:.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
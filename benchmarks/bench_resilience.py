@@ -0,0 +1,84 @@
+"""
+Бенчмарк политики вызовов LLM на нестабильном mock-прокси
+
+Mock отвечает 503 с вероятностью --failure-rate и добавляет задержку --slow-latency
+с вероятностью --slow-rate. Сравниваются одиночные вызовы (без повторов и дублирования)
+и политика с повторами и дублированием запросов после p95: доля успешных ответов и p50/p95/p99.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_resilience --requests 300 --failure-rate 0.1 --slow-rate 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from app.services.latency import LatencyStats
+from app.services.resilience import CallPolicy
+from benchmarks.mock_servers import MockLLMServer
+
+
+async def _run(client, policy: CallPolicy, requests: int, concurrency: int) -> dict:
+    latency = LatencyStats(window=requests)
+    ok = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal ok
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await client._acomplete(client._build_chat_messages("ping"), "bench")
+                ok += 1
+            except Exception:
+                pass
+            latency.observe(time.perf_counter() - started)
+
+    client.policy = policy
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return {"success": ok / requests, **latency.summary()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with MockLLMServer(latency=args.latency) as llm:
+        os.environ["OPENAI_API_KEY"] = "bench"
+        os.environ["OPENAI_BASE_URL"] = f"{llm.url}/v1"
+        from app.services.openai_module import LLMClient
+
+        client = LLMClient()
+        policies = {
+            "single": CallPolicy(max_retries=0),
+            "policy": CallPolicy(max_retries=2, base_delay=0.05, hedge=True),
+        }
+
+        # Набираем статистику задержек для оценки p95 без сбоев
+        asyncio.run(_run(client, policies["policy"], 50, args.concurrency))
+
+        llm.failure_rate = args.failure_rate
+        llm.slow_rate = args.slow_rate
+        llm.slow_latency = args.slow_latency
+        results = {name: asyncio.run(_run(client, policy, args.requests, args.concurrency))
+                   for name, policy in policies.items()}
+
+    print(f"Запросов: {args.requests}, сбоев: {args.failure_rate:.0%}, медленных: {args.slow_rate:.0%} "
+          f"(+{args.slow_latency}s)")
+    for name, result in results.items():
+        print(
+            f"{name:>8}: успешно {result['success']:.1%}, "
+            f"p50 {result['p50'] * 1000:.0f} ms, p95 {result['p95'] * 1000:.0f} ms, p99 {result['p99'] * 1000:.0f} ms"
+        )
+    print(f"  policy: {policies['policy'].get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
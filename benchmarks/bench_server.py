@@ -0,0 +1,98 @@
+"""
+Нагрузочный тест продакшен-сервера (python -m app.server) с разным числом процессов
+
+Для каждого значения --workers запускается отдельный сервер на mock-сайте и mock-LLM
+(они работают в отдельном процессе и не делят GIL с генератором нагрузки),
+затем --concurrency клиентов в течение --duration секунд отправляют /analyze-site
+с разными URL. Выводятся пропускная способность, p50/p95/p99 и ошибки. Разбор больших
+страниц нагружает CPU, поэтому пропускная способность растет с числом процессов до числа ядер.
+
+В конце проверяется плавная остановка: запросы, начатые до SIGTERM, должны завершиться успешно.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_server --workers 1,2,4 --concurrency 64 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from app.services.latency import LatencyStats
+from benchmarks.harness import MockBackends, ServerProcess
+
+
+async def _load(base_url: str, site_url: str, concurrency: int, duration: float) -> dict:
+    latency = LatencyStats(window=1_000_000)
+    ok = errors = 0
+    counter = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        stop_at = time.perf_counter() + duration
+
+        async def user():
+            nonlocal ok, errors, counter
+            while time.perf_counter() < stop_at:
+                counter += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/analyze-site", json={"url": f"{site_url}/?page={counter}"})
+                    response.raise_for_status()
+                    ok += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latency.observe(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {"throughput": ok / elapsed, "ok": ok, "errors": errors, **latency.summary()}
+
+
+async def _drain_check(server: ServerProcess, site_url: str, requests: int) -> int:
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=60.0) as client:
+        pending = [
+            asyncio.ensure_future(client.post("/analyze-site", json={"url": f"{site_url}/?drain={i}&delay=2"}))
+            for i in range(requests)
+        ]
+        # Запросы успевают дойти до сервера и ждут ответа сайта 2 с
+        await asyncio.sleep(0.5)
+        server.terminate()
+        results = await asyncio.gather(*pending, return_exceptions=True)
+    return sum(1 for r in results if isinstance(r, httpx.Response) and r.status_code == 200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="Числа процессов через запятую")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--site-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--page-size", type=int, default=200_000)
+    args = parser.parse_args()
+
+    mocks = MockBackends(site_latency=args.site_latency, page_size=args.page_size, llm_latency=args.llm_latency)
+    with mocks:
+        print(f"Ядер: {os.cpu_count()}, клиентов: {args.concurrency}, длительность: {args.duration} с, "
+              f"страница: {args.page_size} символов")
+        for workers in [int(w) for w in args.workers.split(",")]:
+            with ServerProcess(mocks.llm_url, workers=workers) as server:
+                result = asyncio.run(_load(server.base_url, mocks.site_url, args.concurrency, args.duration))
+            print(
+                f"процессов {workers:>2}: {result['throughput']:7.1f} req/s, "
+                f"p50 {result['p50'] * 1000:.0f} ms, p95 {result['p95'] * 1000:.0f} ms, "
+                f"p99 {result['p99'] * 1000:.0f} ms, ошибок {result['errors']}"
+            )
+
+        # Плавная остановка: SIGTERM приходит, пока запросы ждут медленный сайт
+        with ServerProcess(mocks.llm_url) as server:
+            completed = asyncio.run(_drain_check(server, mocks.site_url, 10))
+        print(f"плавная остановка: завершено {completed} из 10 запросов, начатых до SIGTERM")
+
+if __name__ == "__main__":
+    main()
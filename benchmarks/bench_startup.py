@@ -0,0 +1,106 @@
+"""
+Бенчмарк времени старта воркера: импорт приложения и холодный старт uvicorn
+
+Каждый замер выполняется в новом процессе интерпретатора:
+- import: время `import app.main` (без OPENAI_API_KEY импорт тоже должен проходить);
+- cold start: от запуска uvicorn до первого ответа /health;
+- first request: первый и второй запрос /analyze-site к мок-серверам
+  (первый включает ленивое создание клиентов).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --repeats 5
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.mock_servers import MockLLMServer, MockSiteServer
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_cold_start(env: dict, site_url: str) -> tuple:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            while True:
+                try:
+                    client.get("/health")
+                    break
+                except httpx.TransportError:
+                    if process.poll() is not None:
+                        raise RuntimeError("uvicorn завершился при старте")
+                    time.sleep(0.01)
+            ready = time.perf_counter() - started
+
+            timings = []
+            for i in range(2):
+                request_started = time.perf_counter()
+                client.post("/analyze-site", json={"url": f"{site_url}/?page={i}"}).raise_for_status()
+                timings.append(time.perf_counter() - request_started)
+    finally:
+        process.terminate()
+        process.wait()
+
+    return ready, timings[0], timings[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.pop("OPENAI_API_KEY", None)
+    env["PYTHONPATH"] = os.getcwd()
+    imports = [measure_import(env) for _ in range(args.repeats)]
+    print(f"import app.main без OPENAI_API_KEY: медиана {statistics.median(imports) * 1000:.0f} ms")
+
+    with MockSiteServer() as site, MockLLMServer() as llm:
+        env.update({
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": f"{llm.url}/v1",
+            "LLM_CACHE_ENABLED": "false",
+            "PAGE_CACHE_ENABLED": "false",
+        })
+        imports = [measure_import(env) for _ in range(args.repeats)]
+        runs = [measure_cold_start(env, site.url) for _ in range(args.repeats)]
+
+    print(f"import app.main: медиана {statistics.median(imports) * 1000:.0f} ms")
+    print(f"холодный старт до /health: медиана {statistics.median(r[0] for r in runs) * 1000:.0f} ms")
+    print(f"первый /analyze-site: медиана {statistics.median(r[1] for r in runs) * 1000:.0f} ms")
+    print(f"второй /analyze-site: медиана {statistics.median(r[2] for r in runs) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Набор нагрузочных бенчмарков API на mock-сайте и mock-LLM
+
+Запускает продакшен-сервер (python -m app.server) и для каждого сценария
+(/analyze-site, /api/v1/chat, /api/v1/chat-json) и каждого уровня конкурентности
+отправляет --requests запросов. Для каждого прогона считаются p50/p95/p99, пропускная
+способность, ошибки и пиковый RSS сервера. Результаты сохраняются в JSON вместе с
+коммитом и параметрами запуска, --baseline сравнивает их с сохраненным ранее файлом.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_suite --concurrency 1,8,32 --requests 200
+    python -m benchmarks.bench_suite --baseline benchmarks/results/<файл>.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from app.services.latency import LatencyStats
+from benchmarks.harness import MockBackends, ServerProcess
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _scenarios(site_url: str) -> Dict[str, tuple]:
+    """Путь и функция, строящая тело i-го запроса. Тела различаются, чтобы запросы не объединялись"""
+    return {
+        "analyze-site": ("/analyze-site", lambda i: {"url": f"{site_url}/?page={i}", "no_cache": True}),
+        "chat": ("/api/v1/chat", lambda i: {"prompt": f"Придумай вопрос о тарифах #{i}"}),
+        "chat-json": ("/api/v1/chat-json", lambda i: {
+            "system_prompt": "Ты генерируешь вопросы посетителей сайта. Отвечай в JSON.",
+            "user_prompt": f"Сайт #{i}: тарифы, доставка, оплата",
+            "no_cache": True,
+        }),
+    }
+
+
+async def _sample_rss(server: ServerProcess, peak: dict, interval: float = 0.2):
+    while True:
+        rss = await asyncio.to_thread(server.rss)
+        if rss is not None:
+            peak["rss"] = max(peak.get("rss", 0), rss)
+        await asyncio.sleep(interval)
+
+
+async def _run(server: ServerProcess, path: str, body: Callable[[int], dict], concurrency: int,
+               requests: int, offset: int) -> dict:
+    latency = LatencyStats(window=requests)
+    ok = errors = issued = 0
+    peak: dict = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=120.0, limits=limits) as client:
+        async def user():
+            nonlocal ok, errors, issued
+            while issued < requests:
+                issued += 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post(path, json=body(offset + issued))
+                    response.raise_for_status()
+                    ok += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latency.observe(time.perf_counter() - started)
+
+        sampler = asyncio.create_task(_sample_rss(server, peak))
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    return {
+        "requests": requests,
+        "ok": ok,
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput": ok / elapsed,
+        **latency.summary(),
+        "rss_peak_mb": peak["rss"] / 2 ** 20 if peak.get("rss") else None,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(results: List[dict], baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nСравнение с {baseline_path} (коммит {baseline['meta'].get('commit')}):")
+    for result in results:
+        before = previous.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        changes = []
+        for key in ("throughput", "p95", "p99"):
+            if before.get(key) and result.get(key) is not None:
+                changes.append(f"{key} {(result[key] / before[key] - 1) * 100:+.1f}%")
+        print(f"{result['scenario']:>13} x{result['concurrency']:<3} " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="analyze-site,chat,chat-json")
+    parser.add_argument("--concurrency", default="1,8,32", help="Уровни конкурентности через запятую")
+    parser.add_argument("--requests", type=int, default=200, help="Запросов на каждый уровень")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1, help="Процессов сервера")
+    parser.add_argument("--site-latency", type=float, default=0.05)
+    parser.add_argument("--page-size", type=int, default=50_000)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Задержка на 8 символов ответа LLM")
+    parser.add_argument("--output-tokens", type=int, default=200, help="Примерная длина ответа LLM в токенах")
+    parser.add_argument("--output", help="Файл результатов (по умолчанию benchmarks/results/<время>-<коммит>.json)")
+    parser.add_argument("--baseline", help="Файл результатов для сравнения")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    meta = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": vars(args),
+    }
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = []
+
+    mocks = MockBackends(
+        site_latency=args.site_latency, page_size=args.page_size, llm_latency=args.llm_latency,
+        token_latency=args.token_latency, output_tokens=args.output_tokens
+    )
+    with mocks, ServerProcess(mocks.llm_url, workers=args.workers) as server:
+        scenarios = _scenarios(mocks.site_url)
+        offset = 0
+        for name in args.scenarios.split(","):
+            path, body = scenarios[name]
+            asyncio.run(_run(server, path, body, 1, args.warmup, offset))
+            offset += args.warmup
+            for concurrency in levels:
+                result = asyncio.run(_run(server, path, body, concurrency, args.requests, offset))
+                offset += args.requests
+                results.append({"scenario": name, "concurrency": concurrency, **result})
+                rss = f"{result['rss_peak_mb']:.0f} MB" if result["rss_peak_mb"] else "n/a"
+                print(
+                    f"{name:>13} x{concurrency:<3} {result['throughput']:7.1f} req/s, "
+                    f"p50 {result['p50'] * 1000:.0f} ms, p95 {result['p95'] * 1000:.0f} ms, "
+                    f"p99 {result['p99'] * 1000:.0f} ms, ошибок {result['errors']}, RSS {rss}"
+                )
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены в {output}")
+
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Общие части нагрузочных бенчмарков: mock-серверы в отдельном процессе,
+запуск продакшен-сервера API и замер потребления памяти
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from benchmarks.mock_servers import MockLLMServer, MockSiteServer
+
+
+def _serve_mocks(urls, stop, site_options: dict, llm_options: dict):
+    with MockSiteServer(**site_options) as site, MockLLMServer(**llm_options) as llm:
+        urls.put((site.url, llm.url))
+        stop.wait()
+
+
+class MockBackends:
+    """
+    Mock-сайт и mock-LLM в отдельном процессе, чтобы они не делили GIL
+    с генератором нагрузки
+    """
+
+    def __init__(self, site_latency: float = 0.05, page_size: int = 20000, llm_latency: float = 0.2,
+                 token_latency: float = 0.0, output_tokens: int = 0):
+        self.site_options = {"latency": site_latency, "page_size": page_size}
+        self.llm_options = {"latency": llm_latency, "token_latency": token_latency, "output_tokens": output_tokens}
+        self.site_url = self.llm_url = None
+        self._stop = multiprocessing.Event()
+        self._process = None
+
+    def __enter__(self):
+        urls = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_serve_mocks, args=(urls, self._stop, self.site_options, self.llm_options), daemon=True
+        )
+        self._process.start()
+        self.site_url, self.llm_url = urls.get(timeout=10)
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._process.join(timeout=5)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """
+    Суммарный RSS процесса и его потомков (процессов uvicorn) в байтах по данным /proc
+
+    Args:
+        pid (int): Идентификатор корневого процесса
+
+    Returns:
+        Optional[int]: RSS в байтах или None, если /proc недоступен
+    """
+    if not os.path.isdir("/proc"):
+        return None
+
+    children: Dict[int, list] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Имя процесса в скобках может содержать пробелы
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class ServerProcess:
+    """
+    Продакшен-сервер API (python -m app.server), подключенный к mock-LLM.
+    Кэши выключены, чтобы повторные запросы не были нечестно быстрыми
+    """
+
+    def __init__(self, llm_url: str, workers: int = 1, **env: str):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.env = dict(
+            os.environ,
+            WEB_CONCURRENCY=str(workers),
+            SERVER_HOST="127.0.0.1",
+            SERVER_PORT=str(self.port),
+            SERVER_GRACEFUL_TIMEOUT="10",
+            LOG_LEVEL="warning",
+            OPENAI_API_KEY="bench",
+            OPENAI_BASE_URL=f"{llm_url}/v1",
+            LLM_CACHE_ENABLED="false",
+            PAGE_CACHE_ENABLED="false",
+            **env,
+        )
+        self.process: Optional[subprocess.Popen] = None
+        self._terminated = False
+
+    def __enter__(self):
+        self.process = subprocess.Popen([sys.executable, "-m", "app.server"], env=self.env)
+        asyncio.run(self.wait_ready())
+        return self
+
+    def __exit__(self, *exc):
+        self.terminate()
+        self.process.wait(timeout=30)
+
+    def terminate(self):
+        """Отправляет SIGTERM один раз: повторный сигнал uvicorn прерывает плавную остановку"""
+        if not self._terminated and self.process.poll() is None:
+            self.process.terminate()
+        self._terminated = True
+
+    async def wait_ready(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(base_url=self.base_url) as client:
+            while time.monotonic() < deadline:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise Exception(f"Сервер {self.base_url} не запустился за {timeout} с")
+
+    def rss(self) -> Optional[int]:
+        return process_tree_rss(self.process.pid)
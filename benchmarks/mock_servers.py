@@ -0,0 +1,457 @@
+"""
+Локальные mock-серверы для бенчмарков: медленный сайт и OpenAI-совместимый LLM
+"""
+
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def build_page(size: int) -> str:
+    """
+    Генерирует HTML-страницу примерно заданного размера
+
+    Args:
+        size (int): Желаемый размер страницы в символах
+
+    Returns:
+        str: HTML-код страницы
+    """
+    paragraph = "<p>Наш сервис помогает быстро подобрать тариф и оформить заказ онлайн.</p>\n"
+    body = paragraph * max(1, size // len(paragraph))
+    return (
+        "<html><head><title>Mock</title><style>p {color: red}</style>"
+        "<script>var x = 1;</script></head>"
+        f"<body><h1>Mock site</h1>{body}</body></html>"
+    )
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Большая очередь accept, чтобы сервер не был узким местом при высокой конкурентности
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл соединение (отмененный или дублирующий запрос) - это ожидаемо
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class _MockServer:
+    """
+    Базовый класс: запускает ThreadingHTTPServer в фоновом потоке
+    """
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests_count = 0
+        self._lock = threading.Lock()
+        handler = type("Handler", (self.handler_class,), {"server_state": self})
+        self.httpd = _HTTPServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests_count += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    # Keep-alive, как у настоящих сайтов: соединение переиспользуется между запросами
+    protocol_version = "HTTP/1.1"
+    # Заголовки пишутся отдельными send, без TCP_NODELAY keep-alive ответ ждет подтверждения
+    disable_nagle_algorithm = True
+    server_state = None
+
+    def setup(self):
+        super().setup()
+        state = self.server_state
+        state.count_connection()
+        # Задержка нового соединения моделирует сетевые рукопожатия TCP и TLS
+        if state.connect_latency:
+            time.sleep(state.connect_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        state = self.server_state
+        state.count_request()
+        # Параметр delay задает задержку конкретного запроса вместо общей
+        delay = parse_qs(urlparse(self.path).query).get("delay")
+        latency = float(delay[0]) if delay else state.latency
+        if latency:
+            time.sleep(latency)
+
+        if state.validators and self.headers.get("If-None-Match") == state.etag:
+            state.not_modified_count += 1
+            self.send_response(304)
+            self.send_header("ETag", state.etag)
+            self.end_headers()
+            return
+
+        body = state.page
+        # Параметр variant - вариант той же страницы (товар, регион) с небольшим отличием в тексте
+        variant = parse_qs(urlparse(self.path).query).get("variant")
+        if variant:
+            body = body.replace("</h1>", f"</h1><p>Вариант {variant[0]}: цвет и размер по выбору.</p>", 1)
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if state.validators:
+            self.send_header("ETag", state.etag)
+            self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockSiteServer(_MockServer):
+    """
+    Mock-сайт, отдающий HTML-страницу с заданной задержкой.
+    При validators=True отдает ETag/Last-Modified и отвечает 304 на If-None-Match
+    """
+
+    handler_class = _SiteHandler
+
+    def __init__(self, latency: float = 0.0, page_size: int = 20000, validators: bool = False,
+                 connect_latency: float = 0.0):
+        super().__init__(latency)
+        self.validators = validators
+        self.connect_latency = connect_latency
+        self.not_modified_count = 0
+        self.connections_count = 0
+        self.set_page(build_page(page_size))
+
+    def count_connection(self):
+        with self._lock:
+            self.connections_count += 1
+
+    def set_page(self, page: str):
+        self.page = page
+        self.etag = '"' + hashlib.sha1(page.encode("utf-8")).hexdigest() + '"'
+
+
+class _CrawlSiteHandler(_SiteHandler):
+    def do_GET(self):
+        state = self.server_state
+        state.count_request()
+        if state.latency:
+            time.sleep(state.latency)
+
+        path = urlparse(self.path).path
+        if path == "/sitemap.xml" and state.sitemap:
+            self._send(200, state.sitemap_xml().encode("utf-8"), "application/xml")
+            return
+        index = state.page_index(path)
+        if index is None:
+            self._send(404, b"not found", "text/plain")
+            return
+        etag = f'"{index}-{state.versions[index]}"'
+        if self.headers.get("If-None-Match") == etag:
+            state.not_modified_count += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        with state._lock:
+            state.pages_sent += 1
+        self._send(200, state.render(index).encode("utf-8"), "text/html; charset=utf-8", etag)
+
+    def _send(self, status: int, body: bytes, content_type: str, etag: str = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MockCrawlSiteServer(MockSiteServer):
+    """
+    Mock-сайт из pages страниц для обхода: страница i ссылается на страницы fanout * i + 1 ...
+    fanout * i + fanout и на главную, sitemap.xml (при sitemap=True) перечисляет все страницы
+    с lastmod. Каждая страница отдает ETag своей версии и отвечает 304 на If-None-Match.
+    change(i) меняет содержимое страницы и ее lastmod
+    """
+
+    handler_class = _CrawlSiteHandler
+
+    def __init__(self, pages: int = 50, fanout: int = 5, page_size: int = 5000, sitemap: bool = True,
+                 latency: float = 0.0):
+        super().__init__(latency, page_size, validators=True)
+        self.pages = pages
+        self.fanout = fanout
+        self.page_size = page_size
+        self.sitemap = sitemap
+        self.versions = [0] * pages
+        self.lastmod = [time.time() - 3600] * pages
+        self.pages_sent = 0
+
+    @staticmethod
+    def path(index: int) -> str:
+        return "/" if index == 0 else f"/p/{index}"
+
+    def page_index(self, path: str):
+        if path == "/":
+            return 0
+        if path.startswith("/p/") and path[3:].isdigit() and 0 < int(path[3:]) < self.pages:
+            return int(path[3:])
+        return None
+
+    def change(self, index: int):
+        with self._lock:
+            self.versions[index] += 1
+            self.lastmod[index] = time.time()
+
+    def render(self, index: int) -> str:
+        children = range(self.fanout * index + 1, min(self.fanout * index + self.fanout + 1, self.pages))
+        links = "".join(f'<li><a href="{self.path(child)}">Раздел {child}</a></li>' for child in children)
+        paragraph = f"<p>Страница {index}, версия {self.versions[index]}: условия доставки и оплаты заказа.</p>\n"
+        body = paragraph * max(1, self.page_size // len(paragraph))
+        return (
+            f"<html><head><title>Страница {index}</title></head><body>"
+            f'<nav><a href="/">Главная</a><ul>{links}</ul></nav><h1>Раздел {index}</h1>{body}</body></html>'
+        )
+
+    def sitemap_xml(self) -> str:
+        entries = "".join(
+            f"<url><loc>{self.url}{self.path(i)}</loc>"
+            f"<lastmod>{time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(self.lastmod[i]))}</lastmod></url>"
+            for i in range(self.pages)
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</urlset>'
+
+
+class _LLMHandler(BaseHTTPRequestHandler):
+    server_state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        state = self.server_state
+        state.count_request()
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        status, retry_after, extra_latency = state.take_fault()
+        message = f"mock error {status}"
+        response_format = (request.get("response_format") or {}).get("type")
+        supported = state.model_response_formats.get(request.get("model"), state.response_formats)
+        if status == 200 and response_format and response_format not in supported:
+            status = 400
+            message = f"Invalid parameter: 'response_format' of type '{response_format}' is not supported with this model."
+        if state.latency or extra_latency:
+            time.sleep(state.latency + extra_latency)
+        if status != 200:
+            body = json.dumps({"error": {"message": message, "type": "invalid_request_error"}}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if request.get("stream"):
+            self._stream(state, request)
+            return
+        completion = state.completion(request)
+        if state.token_latency:
+            # Генерация ответа занимает время пропорционально его длине
+            chunks = -(-len(completion["choices"][0]["message"]["content"]) // state.CHUNK_SIZE)
+            time.sleep(state.token_latency * chunks)
+        body = json.dumps(completion).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _stream(self, state, request: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        content = state.content(request)
+        for i in range(0, len(content), state.CHUNK_SIZE):
+            if state.token_latency:
+                time.sleep(state.token_latency)
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{
+                    "index": 0, "delta": {"content": content[i:i + state.CHUNK_SIZE]}, "finish_reason": None
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        if (request.get("stream_options") or {}).get("include_usage"):
+            # Как у OpenAI: последний фрагмент без choices с расходом токенов
+            usage = state.completion(request)["usage"]
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model", "mock"), "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class MockLLMServer(_MockServer):
+    """
+    Mock OpenAI-совместимого API: отвечает на /chat/completions списком вопросов.
+    token_latency - задержка на каждый фрагмент ответа из CHUNK_SIZE символов, в том числе
+    в потоковом режиме (stream=True). output_tokens задает примерную длину ответа в токенах
+    (0 - короткие вопросы). fail_next и slow_next имитируют сбои и медленные ответы прокси,
+    failure_rate и slow_rate - случайные сбои и медленный хвост задержек.
+    response_formats - поддерживаемые типы response_format (остальные получают 400),
+    model_response_formats - те же типы для отдельных моделей,
+    bad_json_next - следующие ответы будут невалидным JSON, drop_pages_next - следующий
+    пакетный ответ (блоки <page id="...">) пропустит первые страницы.
+    Кэш префикса промптов как у провайдера: общее начало с недавними промптами от
+    prefix_cache_min_tokens токенов возвращается в usage.prompt_tokens_details.cached_tokens
+    """
+
+    handler_class = _LLMHandler
+
+    # Размер фрагмента потокового ответа в символах
+    CHUNK_SIZE = 8
+
+    def __init__(self, latency: float = 0.0, token_latency: float = 0.0, output_tokens: int = 0):
+        super().__init__(latency)
+        self.token_latency = token_latency
+        self.output_tokens = output_tokens
+        self.response_formats = {"json_object", "json_schema"}
+        self.model_response_formats = {}
+        self.prefix_cache_min_tokens = 1024
+        self._prompts = collections.deque(maxlen=256)
+        self._bad_json = 0
+        self._drop_pages = 0
+        self._failures = 0
+        self._failure_status = 503
+        self._retry_after = None
+        self._slow = 0
+        self._slow_latency = 0.0
+        self.failure_rate = 0.0
+        self.slow_rate = 0.0
+        self.slow_latency = 0.0
+
+    def fail_next(self, count: int, status: int = 503, retry_after=None):
+        """Следующие count запросов завершатся ошибкой status (с заголовком Retry-After)"""
+        with self._lock:
+            self._failures = count
+            self._failure_status = status
+            self._retry_after = retry_after
+
+    def slow_next(self, count: int, latency: float):
+        """Следующие count запросов получат дополнительную задержку latency"""
+        with self._lock:
+            self._slow = count
+            self._slow_latency = latency
+
+    def bad_json_next(self, count: int):
+        """Следующие count ответов будут обрезанным JSON в markdown блоке"""
+        with self._lock:
+            self._bad_json = count
+
+    def drop_pages_next(self, count: int):
+        """Следующий пакетный ответ не будет содержать вопросов для первых count страниц"""
+        with self._lock:
+            self._drop_pages = count
+
+    def take_fault(self) -> tuple:
+        with self._lock:
+            extra_latency = 0.0
+            if self._slow:
+                self._slow -= 1
+                extra_latency = self._slow_latency
+            elif random.random() < self.slow_rate:
+                extra_latency = self.slow_latency
+            if self._failures:
+                self._failures -= 1
+                return self._failure_status, self._retry_after, extra_latency
+            if random.random() < self.failure_rate:
+                return 503, None, extra_latency
+            return 200, None, extra_latency
+
+    def content(self, request: dict) -> str:
+        # Около 4 символов на токен, ответ делится между пятью вопросами
+        filler = ("слово " * self.output_tokens)[:self.output_tokens * 4 // 5].strip()
+        questions = [f"Вопрос {i} {filler}".strip() + "?" for i in range(1, 6)]
+        # Пакетный запрос: вопросы для каждого блока <page id="...">
+        user = "".join(str(m.get("content")) for m in request.get("messages", []) if m.get("role") == "user")
+        page_ids = re.findall(r'<page id="([^"]+)">', user)
+        if page_ids:
+            with self._lock:
+                dropped = self._drop_pages
+                self._drop_pages = 0
+            pages = [{"id": page_id, "questions": questions} for page_id in page_ids[dropped:]]
+            content = json.dumps({"pages": pages}, ensure_ascii=False)
+        else:
+            content = json.dumps({"questions": questions}, ensure_ascii=False)
+        with self._lock:
+            if self._bad_json:
+                self._bad_json -= 1
+                return "```json\n" + content[:-10] + "\n```"
+        return content
+
+    def prompt_usage(self, request: dict) -> tuple:
+        """Токены промпта (около 4 символов на токен) и их часть, совпавшая с началом недавних промптов"""
+        prompt = "".join(f"{m.get('role')}\n{m.get('content')}\n" for m in request.get("messages", []))
+        with self._lock:
+            common = max((len(os.path.commonprefix([prompt, seen])) for seen in self._prompts), default=0)
+            self._prompts.append(prompt)
+        cached = common // 4 if common // 4 >= self.prefix_cache_min_tokens else 0
+        return max(len(prompt) // 4, 1), cached
+
+    def completion(self, request: dict) -> dict:
+        content = self.content(request)
+        prompt_tokens, cached_tokens = self.prompt_usage(request)
+        completion_tokens = self.output_tokens or 50
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
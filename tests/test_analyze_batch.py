@@ -0,0 +1,91 @@
+"""
+Тесты пакетного анализа /analyze-sites: ошибки отдельных URL и лимиты стадий конвейера
+"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import BATCH_MAX_URLS, app
+from app.services import batch, container, model_pool, near_duplicates, page_cache, rate_limiter
+from app.services.batch import StageLimits
+from app.services.rate_limiter import LLMScheduler
+from benchmarks.mock_servers import MockLLMServer, MockSiteServer
+
+UNREACHABLE_URL = "http://127.0.0.1:9/"
+
+
+class CountingSemaphore(asyncio.Semaphore):
+    """Семафор, запоминающий наибольшее число одновременных владельцев"""
+
+    def __init__(self, value: int):
+        super().__init__(value)
+        self.active = 0
+        self.peak = 0
+        self.entered = 0
+
+    async def __aenter__(self):
+        await self.acquire()
+        self.active += 1
+        self.entered += 1
+        self.peak = max(self.peak, self.active)
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self.release()
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    limits = StageLimits(fetch=2, parse=1, llm=1)
+    for stage in ("fetch", "parse", "llm"):
+        setattr(limits, stage, CountingSemaphore(getattr(limits, stage)._value))
+    monkeypatch.setattr(batch.StageLimits, "from_env", classmethod(lambda cls: limits))
+    return limits
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    with MockLLMServer(latency=0.05) as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{server.url}/v1")
+        for name in ("LLM_CACHE_ENABLED", "NEAR_DUP_ENABLED", "PAGE_CACHE_ENABLED", "QUESTIONS_BATCH_ENABLED"):
+            monkeypatch.setenv(name, "false")
+        monkeypatch.setattr(container, "_services", None)
+        monkeypatch.setattr(model_pool, "_pool", None)
+        monkeypatch.setattr(near_duplicates, "_shared_index", None)
+        monkeypatch.setattr(page_cache, "_shared_page_cache", None)
+        monkeypatch.setattr(rate_limiter, "_scheduler", LLMScheduler())
+        yield server
+
+
+def test_batch_reports_failed_urls_and_respects_stage_limits(llm, limits):
+    with MockSiteServer(page_size=5000) as first, MockSiteServer(page_size=5000) as second, \
+            MockSiteServer(page_size=5000) as third:
+        urls = [first.url, UNREACHABLE_URL, second.url, third.url]
+        with TestClient(app) as client:
+            response = client.post("/analyze-sites", json={"urls": urls, "concurrency": 4})
+
+    assert response.status_code == 200
+    results = {item["index"]: item for item in map(json.loads, response.text.splitlines())}
+    assert sorted(results) == [0, 1, 2, 3]
+
+    assert results[1]["url"] == UNREACHABLE_URL
+    assert "error" in results[1]
+    for index in (0, 2, 3):
+        assert "error" not in results[index]
+        assert results[index]["url"] == urls[index]
+        assert results[index]["questions"]
+
+    assert limits.llm.entered >= 3 and limits.llm.peak == 1
+    assert limits.parse.entered >= 3 and limits.parse.peak == 1
+    assert limits.fetch.entered == 4 and limits.fetch.peak <= 2
+
+
+def test_batch_rejects_too_many_urls():
+    urls = ["https://example.com/"] * (BATCH_MAX_URLS + 1)
+    response = TestClient(app).post("/analyze-sites", json={"urls": urls})
+
+    assert response.status_code == 400
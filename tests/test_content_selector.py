@@ -0,0 +1,82 @@
+"""
+Тесты отбора содержимого для промпта: служебные строки, повторы и бюджет токенов
+"""
+
+from app.services.content_selector import ContentSelector
+
+
+def clean(text: str) -> list:
+    return ContentSelector._clean_blocks(text)
+
+
+def test_topic_lines_mentioning_legal_words_are_kept():
+    text = ("Chocolate chip cookie recipe\nMix butter and sugar.\n"
+            "Privacy policy changes in 2024 and what they mean for you\n"
+            "Copyright (c) law basics: fair use explained\nSection (c): exceptions\n"
+            "Политика конфиденциальности: что должен указать интернет-магазин")
+
+    assert clean(text) == text.split("\n")
+
+
+def test_boilerplate_lines_are_dropped():
+    text = "\n".join([
+        "Тарифы и подключение",
+        "© 2024 ООО «Ромашка»",
+        "(c) 2023 Example Inc.",
+        "Copyright © Example Inc.",
+        "Example Inc. All rights reserved.",
+        "2024 Все права защищены",
+        "We use cookies to improve your experience. Accept",
+        "Продолжая пользоваться сайтом, вы соглашаетесь на использование cookie-файлов",
+        "Privacy policy | Terms of use",
+        "Политика конфиденциальности",
+    ])
+
+    assert clean(text) == ["Тарифы и подключение"]
+
+
+def test_repeated_blocks_are_kept_once():
+    assert clean("Каталог\n  Главная  \nКаталог\nглавная\n\nДоставка") == ["Каталог", "Главная", "Доставка"]
+
+
+def test_long_lines_are_never_boilerplate():
+    line = "© 2024 " + "подробное описание условий договора " * 10
+
+    assert clean(line) == [line.strip()]
+
+
+def test_text_within_budget_is_returned_whole():
+    selector = ContentSelector("gpt-4o", token_budget=1000)
+    text = "Заголовок страницы\nПервый абзац текста\nВторой абзац текста"
+
+    assert selector.select(text) == text
+
+
+def test_selection_respects_budget_and_order():
+    selector = ContentSelector("gpt-4o", token_budget=60)
+    blocks = [f"Раздел {i}: " + " ".join(f"слово{i}x{j}" for j in range(12)) for i in range(20)]
+
+    selected = selector.select("\n".join(blocks)).split("\n")
+
+    assert 0 < len(selected) < len(blocks)
+    assert selector.count_tokens("\n".join(selected)) <= 60 + len(selected)
+    positions = [blocks.index(block) for block in selected if block in blocks]
+    assert positions == sorted(positions)
+
+
+def test_similar_blocks_do_not_crowd_out_distinct_content():
+    selector = ContentSelector("gpt-4o", token_budget=80)
+    similar = [f"Купить телефон недорого модель {i} цена скидка доставка" for i in range(30)]
+    distinct = "Гарантийное обслуживание выполняется сервисным центром производителя бесплатно"
+
+    selected = selector.select("\n".join(similar + [distinct]))
+
+    assert distinct in selected
+
+
+def test_truncate_limits_tokens():
+    selector = ContentSelector("gpt-4o")
+    text = "слово " * 500
+
+    assert selector.truncate("коротко", 100) == "коротко"
+    assert selector.count_tokens(selector.truncate(text, 50)) <= 52
@@ -0,0 +1,75 @@
+"""
+Тесты обхода сайта: вложенные sitemap других хостов не запрашиваются,
+хранилище состояний ограничено по объему
+"""
+
+import asyncio
+
+from app.services.crawler import CrawledPage, CrawlState, CrawlStateStore, SiteCrawler, _Crawl
+
+INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://www.example.com/sitemap-pages.xml</loc></sitemap>
+  <sitemap><loc>http://169.254.169.254/latest/meta-data/</loc></sitemap>
+  <sitemap><loc>http://internal.local/sitemap.xml</loc></sitemap>
+  <sitemap><loc>file:///etc/passwd</loc></sitemap>
+</sitemapindex>"""
+
+PAGES = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://example.com/about</loc></url>
+</urlset>"""
+
+
+def test_nested_sitemaps_of_other_hosts_are_not_fetched():
+    crawl = _Crawl(SiteCrawler(analyzer=None), "https://example.com/", max_depth=2, max_pages=10, progress=None)
+    fetched = []
+
+    async def fetch_raw(url, headers):
+        fetched.append(url)
+        return (INDEX if url.endswith("/sitemap.xml") else PAGES), {}
+
+    crawl._fetch_raw = fetch_raw
+
+    async def run():
+        crawl.queue = asyncio.Queue()
+        await crawl._read_sitemap()
+
+    asyncio.run(run())
+
+    assert fetched == ["https://example.com/sitemap.xml", "https://www.example.com/sitemap-pages.xml"]
+    assert "https://example.com/about" in crawl.depths
+
+
+def _state(text_chars):
+    state = CrawlState()
+    state.pages["https://example.com/"] = CrawledPage("https://example.com/", None, None, "hash", "x" * text_chars, [])
+    state.depths["https://example.com/"] = 0
+    return state
+
+
+def test_state_store_evicts_least_recently_used_sites_by_bytes():
+    store = CrawlStateStore(max_sites=100, max_bytes=25_000)
+    store.put("a", _state(10_000))
+    store.put("b", _state(10_000))
+    assert store.get("a") is not None
+
+    store.put("c", _state(10_000))
+
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.bytes <= 25_000
+    assert store.stats["evictions"] == 1
+
+
+def test_state_store_replaces_site_state_and_skips_oversized_state():
+    store = CrawlStateStore(max_sites=100, max_bytes=25_000)
+    store.put("a", _state(10_000))
+    store.put("a", _state(5_000))
+    assert len(store) == 1
+    assert store.bytes == _state(5_000).size
+
+    store.put("a", _state(30_000))
+
+    assert store.get("a") is None
+    assert store.bytes == 0
@@ -0,0 +1,87 @@
+"""
+Тесты движков извлечения текста: служебные блоки страницы, абстрактные базовые классы
+"""
+
+import pytest
+
+from app.services.extractors import (
+    BOILERPLATE_ATTR_MAX_CHARS, ExtractionSession, LxmlExtractor, StreamingExtractor, TextExtractor, etree
+)
+
+ARTICLE = "Мы продаем велосипеды и запчасти с доставкой по всей России. " * 5
+
+ENGINES = [StreamingExtractor]
+if etree is not None:
+    ENGINES.append(LxmlExtractor)
+
+
+def page(body_attrs: str = "", wrapper_attrs: str = "", extra: str = "") -> str:
+    return (
+        f"<html><body {body_attrs}><div {wrapper_attrs}>"
+        f"<header role=\"banner\"><h1>Велосипеды Урала</h1></header>"
+        f"<p>{ARTICLE}</p>{extra}</div></body></html>"
+    )
+
+
+@pytest.fixture(params=ENGINES, ids=lambda engine: engine.name)
+def extractor(request):
+    return request.param()
+
+
+@pytest.mark.parametrize("body_attrs, wrapper_attrs", [
+    ('class="page cookie-consent-pending"', ""),
+    ('class="modal-open"', ""),
+    ("", 'id="page" class="site has-social-menu"'),
+])
+def test_page_wrappers_are_not_dropped(extractor, body_attrs, wrapper_attrs):
+    text = extractor.extract(page(body_attrs, wrapper_attrs))
+
+    assert "Мы продаем велосипеды" in text
+    assert "Велосипеды Урала" in text
+
+
+def test_banner_header_keeps_h1(extractor):
+    assert "Велосипеды Урала" in extractor.extract(page())
+
+
+def test_small_boilerplate_blocks_are_dropped(extractor):
+    extra = (
+        '<div class="cookie-banner">Мы используем cookie <button>Принять</button></div>'
+        '<ul class="share_buttons"><li>VK</li><li>Telegram</li></ul>'
+        '<nav>Главная Каталог</nav>'
+    )
+    text = extractor.extract(page(extra=extra))
+
+    assert "Мы продаем велосипеды" in text
+    assert "cookie" not in text
+    assert "Telegram" not in text
+    assert "Каталог" not in text
+
+
+def test_large_block_with_boilerplate_class_is_kept(extractor):
+    long_text = "Подробное описание модели. " * (BOILERPLATE_ATTR_MAX_CHARS // 20)
+    text = extractor.extract(page(extra=f'<section class="modal-content"><p>{long_text}</p></section>'))
+
+    assert "Подробное описание модели" in text
+
+
+def test_budget_is_not_reached_inside_dropped_block(extractor):
+    extra = '<div class="popup">' + "Подпишитесь на рассылку! " * 10 + "</div><p>Финальный абзац</p>"
+    text = extractor.extract(page(extra=extra), max_chars=len(ARTICLE) + 100)
+
+    assert "Подпишитесь" not in text
+
+
+def test_incomplete_extractor_fails_on_instantiation():
+    class NoSession(TextExtractor):
+        name = "broken"
+
+    class FeedOnly(ExtractionSession):
+        def feed(self, chunk):
+            return False
+
+    with pytest.raises(TypeError):
+        NoSession()
+    with pytest.raises(TypeError):
+        FeedOnly()
+
@@ -0,0 +1,50 @@
+"""
+Тесты клиентов скачивания: соединения через кэш DNS и явный запрос HTTP/2 без пакета h2
+"""
+
+import asyncio
+import importlib.util
+
+import httpx
+import pytest
+
+from app.services import fetcher as fetcher_module
+from app.services.fetcher import DnsCache, Fetcher
+from benchmarks.mock_servers import MockSiteServer
+
+
+def test_connections_go_through_dns_cache_and_are_reused():
+    fetcher = Fetcher(max_per_host=2, dns=DnsCache(ttl=300))
+    url = "http://localhost:{port}/page"
+    with MockSiteServer(page_size=1000) as site:
+        target = url.format(port=site.httpd.server_address[1])
+        for _ in range(5):
+            assert fetcher.client.get(target).status_code == 200
+
+        async def fetch():
+            responses = await asyncio.gather(*(fetcher.async_client.get(target) for _ in range(5)))
+            await fetcher.aclose()
+            return responses
+
+        assert all(response.status_code == 200 for response in asyncio.run(fetch()))
+        fetcher.close()
+    assert fetcher.dns.stats["hits"] > 0
+    assert fetcher.stats["connections"] <= 1 + 2
+    assert site.connections_count == fetcher.stats["connections"]
+
+
+def test_network_errors_are_httpx_errors():
+    fetcher = Fetcher()
+    with pytest.raises(httpx.ConnectError):
+        fetcher.client.get("http://127.0.0.1:1/")
+    fetcher.close()
+
+
+def test_explicit_http2_without_h2_fails(monkeypatch):
+    real_find_spec = importlib.util.find_spec
+    monkeypatch.setattr(fetcher_module.importlib.util, "find_spec",
+                        lambda name, *args: None if name == "h2" else real_find_spec(name, *args))
+    with pytest.raises(Exception, match="h2"):
+        Fetcher(http2=True)
+    assert Fetcher().http2 is False
+    assert Fetcher(http2=False).http2 is False
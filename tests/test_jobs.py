@@ -0,0 +1,76 @@
+"""
+Тесты фоновой очереди задач: остановка во время выполнения и брошенные задачи в хранилище
+"""
+
+import asyncio
+import time
+
+from app.services.jobs import Job, JobQueue, SqliteJobStore
+from app.services.metrics import current_trace
+
+
+class SlowAnalyzer:
+
+    async def aanalyze_site(self, url, no_cache=False, priority=None):
+        await asyncio.sleep(60)
+
+
+def test_job_cancelled_on_shutdown_is_saved_as_failed(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+
+    async def run():
+        queue = JobQueue(lambda: SlowAnalyzer(), workers=1, store=SqliteJobStore(path))
+        job = queue.submit("http://example.com")
+        await asyncio.sleep(0.05)
+        assert job.status == Job.RUNNING
+        await queue.aclose(drain_timeout=0.05)
+        return job
+
+    job = asyncio.run(run())
+
+    stored = SqliteJobStore(path).load(job.id)
+    assert stored.status == Job.FAILED
+    assert "остановке" in stored.error
+
+
+def test_expire_removes_stale_unfinished_jobs(tmp_path):
+    store = SqliteJobStore(str(tmp_path / "jobs.sqlite3"))
+    stale, fresh = Job("http://a.example", False), Job("http://b.example", False)
+    stale.status, fresh.status = Job.RUNNING, Job.RUNNING
+    stale.updated_at = time.time() - 7200
+    store.save(stale)
+    store.save(fresh)
+
+    assert store.expire(time.time() - 3600) == 0
+    assert store.expire(time.time() - 3600, stale_deadline=time.time() - 3600) == 1
+    assert store.load(stale.id) is None
+    assert store.load(fresh.id) is not None
+
+
+class TracedAnalyzer:
+
+    def __init__(self):
+        self.trace = "not called"
+
+    async def aanalyze_site(self, url, no_cache=False, priority=None):
+        self.trace = current_trace.get()
+        return {"url": url, "questions": []}
+
+
+def test_job_does_not_inherit_request_trace():
+    analyzer = TracedAnalyzer()
+
+    async def run():
+        queue = JobQueue(lambda: analyzer, workers=1)
+        token = current_trace.set(object())
+        try:
+            job = queue.submit("http://example.com")
+        finally:
+            current_trace.reset(token)
+        while not job.finished:
+            await asyncio.sleep(0.01)
+        await queue.aclose()
+        return job
+
+    assert asyncio.run(run()).status == Job.DONE
+    assert analyzer.trace is None
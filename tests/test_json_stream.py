@@ -0,0 +1,50 @@
+"""
+Тесты инкрементального разбора JSON массива из потока фрагментов ответа LLM
+"""
+
+import json
+
+from app.services.json_stream import JsonArrayStream
+
+
+def feed_all(parser: JsonArrayStream, text: str, size: int) -> list:
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+def test_items_are_returned_as_soon_as_they_are_complete():
+    parser = JsonArrayStream("questions")
+
+    assert parser.feed('{"questions": ["Первый?", "Вто') == ["Первый?"]
+    assert parser.feed('рой?", "Третий?"') == ["Второй?"]
+    assert parser.feed("]}") == ["Третий?"]
+    assert parser.done
+
+
+def test_any_chunking_gives_the_same_items():
+    questions = ['Что такое "API"?', "Скобки [] и {} внутри строки?", "Обратный слэш \\ и запятая, тоже"]
+    text = "```json\n" + json.dumps({"questions": questions}, ensure_ascii=False) + "\n```"
+
+    for size in (1, 2, 3, 7, len(text)):
+        assert feed_all(JsonArrayStream("questions"), text, size) == questions
+
+
+def test_nested_objects_and_preceding_keys():
+    text = '{"note": "questions", "questions": [{"q": "a", "tags": ["x", "y"]}, {"q": "b"}]}'
+
+    assert feed_all(JsonArrayStream("questions"), text, 4) == [{"q": "a", "tags": ["x", "y"]}, {"q": "b"}]
+
+
+def test_key_with_non_array_value_is_skipped():
+    text = '{"meta": {"questions": 2}, "questions": ["a", "b"]}'
+
+    assert feed_all(JsonArrayStream("questions"), text, 5) == ["a", "b"]
+
+
+def test_missing_key_gives_no_items():
+    parser = JsonArrayStream("questions")
+
+    assert feed_all(parser, '{"answers": ["a"]}', 3) == []
+    assert not parser.done
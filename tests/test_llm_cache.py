@@ -0,0 +1,51 @@
+"""
+Тесты дискового уровня кэша ответов LLM: удаление устаревших записей и лимит строк
+"""
+
+import sqlite3
+
+from app.services import llm_cache
+from app.services.llm_cache import LLMResponseCache
+
+
+def disk_rows(path) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+def test_expired_disk_row_is_deleted_on_read(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMResponseCache(ttl=-1, db_path=path)
+    cache.set("key", {"questions": []})
+    cache._entries.clear()
+
+    assert cache.get("key") is None
+    assert disk_rows(path) == 0
+    assert cache.get_stats()["disk_expired"] == 1
+
+
+def test_disk_prune_removes_expired_and_caps_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "DISK_PRUNE_INTERVAL", 10)
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMResponseCache(ttl=-1, db_path=path, max_disk_rows=5)
+    for i in range(5):
+        cache.set(f"old{i}", i)
+    cache.ttl = 3600
+    for i in range(15):
+        cache.set(f"new{i}", i)
+
+    # Очистка на 10-й записи удалила 5 устаревших, на 20-й - лишние сверх 5
+    assert disk_rows(path) == 5
+    assert cache.get("new14") == 14
+    stats = cache.get_stats()
+    assert stats["disk_expired"] == 5
+    assert stats["disk_evictions"] == 10
+
+
+def test_expired_rows_of_previous_run_are_pruned_on_start(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    LLMResponseCache(ttl=-1, db_path=path).set("key", 1)
+
+    LLMResponseCache(db_path=path)
+
+    assert disk_rows(path) == 0
@@ -0,0 +1,60 @@
+"""
+Тесты потоковых маршрутов /api/v1/chat*-stream: перегрузка очереди и недоступность LLM
+возвращаются ответом 503 до начала потока, а не событием error после 200
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import container, model_pool, rate_limiter
+from app.services.rate_limiter import LLMScheduler
+from app.services.resilience import CircuitOpenError
+from benchmarks.mock_servers import MockLLMServer
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    with MockLLMServer() as server:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{server.url}/v1")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setattr(container, "_services", None)
+        monkeypatch.setattr(model_pool, "_pool", None)
+        monkeypatch.setattr(rate_limiter, "_scheduler", LLMScheduler())
+        yield server
+
+
+def test_stream_sends_deltas_then_done(llm):
+    with TestClient(app) as client:
+        response = client.post("/api/v1/chat-stream", json={"prompt": "ping"})
+
+    assert response.status_code == 200
+    assert response.text.count("data: {\"delta\"") > 1
+    assert response.text.endswith("event: done\ndata: {}\n\n")
+
+
+def test_overloaded_queue_returns_503_before_stream(llm, monkeypatch):
+    scheduler = LLMScheduler(rpm=1, max_wait=5)
+    scheduler.rpm.tokens = 0
+    monkeypatch.setattr(rate_limiter, "_scheduler", scheduler)
+
+    with TestClient(app) as client:
+        response = client.post("/api/v1/chat-with-system-stream",
+                               json={"system_prompt": "system", "user_prompt": "ping"})
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 5
+    assert llm.requests_count == 0
+
+
+def test_open_circuit_returns_503_before_stream(llm, monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise CircuitOpenError("LLM временно недоступен (выключатель разомкнут)")
+
+    with TestClient(app) as client:
+        monkeypatch.setattr(container.get_services().llm_client.pool, "acall", unavailable)
+        response = client.post("/api/v1/chat-stream", json={"prompt": "ping"})
+
+    assert response.status_code == 503
+    assert "выключатель" in response.json()["detail"]
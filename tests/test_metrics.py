@@ -0,0 +1,120 @@
+"""
+Тесты метрик: формат выгрузки /metrics (HELP/TYPE, экранирование меток, корзины гистограмм)
+и абстрактный базовый класс метрики
+"""
+
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import metrics
+from app.services.metrics import Counter, Histogram, _Metric
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+
+
+def _unescape(value):
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+def parse_exposition(text):
+    """Разбирает текстовый формат Prometheus: семейства с HELP, TYPE и сэмплами"""
+    families, current, family_name = {}, None, None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, _, documentation = line[len("# HELP "):].partition(" ")
+            assert name not in families, f"Повторное семейство {name}"
+            current = families[name] = {"help": documentation, "type": None, "samples": []}
+            family_name = name
+        elif line.startswith("# TYPE "):
+            name, _, kind = line[len("# TYPE "):].partition(" ")
+            assert name == family_name, f"TYPE {name} без HELP"
+            assert kind in ("counter", "gauge", "histogram")
+            current["type"] = kind
+        else:
+            match = SAMPLE_RE.match(line)
+            assert match, f"Некорректная строка: {line!r}"
+            name, raw_labels, value = match.groups()
+            labels = {}
+            if raw_labels:
+                pairs = LABEL_RE.findall(raw_labels)
+                assert ",".join(f'{k}="{v}"' for k, v in pairs) == raw_labels
+                labels = {key: _unescape(value) for key, value in pairs}
+            assert family_name is not None and name.startswith(family_name), f"Сэмпл {name} вне семейства"
+            current["samples"].append((name, labels, float(value)))
+    return families
+
+
+@pytest.fixture
+def scrape(monkeypatch):
+    counter = Counter("test_events_total", "Тестовый счетчик", ("path",))
+    histogram = Histogram("test_duration_seconds", "Тестовая гистограмма", ("stage",), buckets=(0.1, 1.0))
+    monkeypatch.setattr(metrics, "_METRICS", metrics._METRICS + [counter, histogram])
+    client = TestClient(app)
+
+    def run():
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        return parse_exposition(response.text)
+
+    return counter, histogram, client, run
+
+
+def test_every_family_has_help_and_type(scrape):
+    _, _, _, run = scrape
+    families = run()
+
+    assert "http_requests_total" in families
+    for name, family in families.items():
+        assert family["help"], name
+        assert family["type"], name
+
+
+def test_label_values_are_escaped(scrape):
+    counter, _, _, run = scrape
+    tricky = 'C:\\path "quoted"\nnext line'
+    counter.inc(2, path=tricky)
+
+    samples = run()["test_events_total"]["samples"]
+
+    assert samples == [("test_events_total", {"path": tricky}, 2.0)]
+
+
+def test_histogram_buckets_are_cumulative(scrape):
+    _, histogram, _, run = scrape
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="download")
+
+    samples = run()["test_duration_seconds"]["samples"]
+    buckets = [(labels["le"], value) for name, labels, value in samples if name.endswith("_bucket")]
+    totals = {name: value for name, _, value in samples if not name.endswith("_bucket")}
+
+    assert buckets == [("0.1", 2.0), ("1.0", 3.0), ("+Inf", 4.0)]
+    assert totals["test_duration_seconds_count"] == 4.0
+    assert totals["test_duration_seconds_sum"] == pytest.approx(3.65)
+    assert all(labels["stage"] == "download" for _, labels, _ in samples)
+
+
+def test_http_requests_are_counted_by_route_template(scrape):
+    _, _, client, run = scrape
+    before = run()["http_requests_total"]["samples"]
+    client.get("/api/v1/profiles/some-trace")
+
+    samples = run()["http_requests_total"]["samples"]
+    matching = [value for _, labels, value in samples
+                if labels.get("endpoint") == "/api/v1/profiles/{trace_id}" and labels.get("method") == "GET"]
+    previous = [value for _, labels, value in before
+                if labels.get("endpoint") == "/api/v1/profiles/{trace_id}" and labels.get("method") == "GET"]
+    assert sum(matching) == sum(previous) + 1
+
+
+def test_incomplete_metric_fails_on_instantiation():
+    class NoSamples(_Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        NoSamples("broken", "Метрика без samples")
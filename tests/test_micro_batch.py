@@ -0,0 +1,46 @@
+"""
+Тесты микропакетов: ожидающие элементы не зависают при отмене обработчика и неверном числе результатов
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.micro_batch import MicroBatcher
+
+
+async def _submit_all(batcher: MicroBatcher, count: int) -> list:
+    tasks = [asyncio.ensure_future(batcher.submit("key", i)) for i in range(count)]
+    return await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=2)
+
+
+def test_results_are_matched_to_items():
+    async def handler(key, items):
+        return [item * 10 for item in items]
+
+    results = asyncio.run(_submit_all(MicroBatcher(handler, window=0.01), 3))
+    assert results == [0, 10, 20]
+
+
+def test_short_result_list_fails_all_items():
+    async def handler(key, items):
+        return items[:-1]
+
+    results = asyncio.run(_submit_all(MicroBatcher(handler, window=0.01), 3))
+    assert all(isinstance(result, Exception) and "результатов" in str(result) for result in results)
+
+
+def test_cancelled_handler_fails_all_items():
+    async def handler(key, items):
+        raise asyncio.CancelledError()
+
+    results = asyncio.run(_submit_all(MicroBatcher(handler, window=0.01), 3))
+    assert all(isinstance(result, Exception) and "прервана" in str(result) for result in results)
+
+
+def test_handler_error_reaches_every_item():
+    async def handler(key, items):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(MicroBatcher(handler, window=0.01).submit("key", 1))
@@ -0,0 +1,85 @@
+"""
+Тесты пула моделей: маршрутизация, переключение при сбоях и пробный вызов полуоткрытого выключателя
+"""
+
+import asyncio
+
+import pytest
+from openai import APIConnectionError
+
+from app.services import model_pool
+from app.services.model_pool import ModelEndpoint, ModelPool, TASK_CHAT, TASK_JSON
+from app.services.resilience import CircuitBreaker, CircuitOpenError
+
+
+def endpoint(name: str, **kwargs) -> ModelEndpoint:
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    return ModelEndpoint(name, name, "http://llm.test/v1", "key", **kwargs)
+
+
+def half_open(entry: ModelEndpoint):
+    entry.breaker.record_failure()
+    assert entry.breaker.state == CircuitBreaker.OPEN
+
+
+def test_expired_deadline_releases_half_open_probe():
+    entry = endpoint("main")
+    pool = ModelPool([entry])
+    half_open(entry)
+
+    with pytest.raises(CircuitOpenError):
+        pool.call(TASK_CHAT, lambda e, timeout: "ok", timeout=0)
+
+    assert entry.breaker.state == CircuitBreaker.HALF_OPEN
+    assert pool.call(TASK_CHAT, lambda e, timeout: "ok", timeout=10) == "ok"
+    assert entry.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_expired_deadline_releases_half_open_probe():
+    entry = endpoint("main")
+    pool = ModelPool([entry])
+    half_open(entry)
+
+    async def request(e, timeout):
+        return "ok"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(pool.acall(TASK_CHAT, request, timeout=0))
+    assert asyncio.run(pool.acall(TASK_CHAT, request, timeout=10)) == "ok"
+
+
+def test_interrupted_sync_call_releases_probe():
+    entry = endpoint("main")
+    pool = ModelPool([entry])
+    half_open(entry)
+
+    def interrupted(e, timeout):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        pool.call(TASK_CHAT, interrupted, timeout=10)
+    assert pool.call(TASK_CHAT, lambda e, timeout: "ok", timeout=10) == "ok"
+
+
+def test_transient_error_fails_over_to_next_entry(monkeypatch):
+    first, second = endpoint("first", weight=10), endpoint("second", weight=1)
+    pool = ModelPool([first, second])
+    # Основная запись выбирается случайно по весам - фиксируем выбор первой
+    monkeypatch.setattr(model_pool.random, "choices", lambda population, weights: [population[0]])
+
+    def request(e, timeout):
+        if e is first:
+            raise APIConnectionError(request=None)
+        return e.name
+
+    assert pool.call(TASK_CHAT, request, timeout=10) == "second"
+    assert first.breaker.state == CircuitBreaker.OPEN
+    assert pool.get_stats()["failovers"] == 1
+
+
+def test_task_specific_entries_are_preferred():
+    general, json_model = endpoint("general"), endpoint("json", tasks=[TASK_JSON])
+    pool = ModelPool([general, json_model])
+
+    assert pool.route(TASK_JSON)[0] is json_model
+    assert pool.route(TASK_CHAT) == [general]
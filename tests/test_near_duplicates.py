@@ -0,0 +1,131 @@
+"""
+Тесты канонизации URL и индекса почти одинаковых страниц: порог расстояния,
+ограничения размера и срока жизни, хранение в sqlite
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from app.services.analyzer import SiteAnalyzer
+from app.services.near_duplicates import NearDuplicateIndex, canonicalize_url, simhash
+
+WORDS = [f"слово{i}" for i in range(400)]
+
+
+def page(seed: int, words: int = 300) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def flip_bits(fingerprint: int, count: int) -> int:
+    for bit in range(count):
+        fingerprint ^= 1 << (bit * 7)
+    return fingerprint
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTPS://Example.COM:443/path?b=2&a=1#top", "https://example.com/path?a=1&b=2"),
+    ("http://example.com:8080", "http://example.com:8080/"),
+    ("https://example.com/?utm_source=x&gclid=1&id=5&yclid=2", "https://example.com/?id=5"),
+    ("https://example.com/p?q=a%20b&Utm_Medium=y", "https://example.com/p?q=a%20b"),
+    # ref - настоящий параметр на многих сайтах (ветка, артикул)
+    ("https://git.example.com/tree?ref=main", "https://git.example.com/tree?ref=main"),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+def test_canonicalize_url_keeps_unsupported_urls():
+    assert canonicalize_url("mailto:info@example.com") == "mailto:info@example.com"
+    assert canonicalize_url("not a url") == "not a url"
+
+
+def test_simhash_of_similar_texts_is_close():
+    text = page(1)
+    changed = text.replace(text.split()[10], "другое", 1)
+
+    assert simhash("коротко") is None
+    assert bin(simhash(text) ^ simhash(changed)).count("1") <= 3
+    assert bin(simhash(text) ^ simhash(page(2))).count("1") > 10
+
+
+def test_lookup_respects_max_distance():
+    index = NearDuplicateIndex(max_distance=3)
+    fingerprint = simhash(page(1))
+    index.add("https://example.com/a", fingerprint, ["Вопрос?"])
+
+    entry, distance = index.lookup(flip_bits(fingerprint, 3))
+    assert entry.url == "https://example.com/a" and distance == 3
+    assert index.lookup(flip_bits(fingerprint, 4)) is None
+    assert index.get_stats()["hits"] == 1 and index.get_stats()["misses"] == 1
+
+
+def test_nearest_entry_wins():
+    index = NearDuplicateIndex(max_distance=3)
+    fingerprint = simhash(page(1))
+    index.add("https://example.com/far", flip_bits(fingerprint, 3), ["far"])
+    index.add("https://example.com/near", flip_bits(fingerprint, 1), ["near"])
+
+    entry, distance = index.lookup(fingerprint)
+    assert entry.url == "https://example.com/near" and distance == 1
+
+
+def test_max_entries_evicts_least_recently_used():
+    index = NearDuplicateIndex(max_entries=2)
+    fingerprints = [simhash(page(seed)) for seed in range(3)]
+    index.add("https://example.com/0", fingerprints[0], [])
+    index.add("https://example.com/1", fingerprints[1], [])
+    index.lookup(fingerprints[0])
+    index.add("https://example.com/2", fingerprints[2], [])
+
+    assert index.lookup(fingerprints[1]) is None
+    assert index.lookup(fingerprints[0]) is not None
+    assert index.get_stats()["evictions"] == 1
+
+
+def test_expired_entries_are_not_returned():
+    index = NearDuplicateIndex(ttl=-1)
+    fingerprint = simhash(page(1))
+    index.add("https://example.com/a", fingerprint, [])
+
+    assert index.lookup(fingerprint) is None
+    assert index.get_stats()["expired"] == 1
+
+
+def test_index_survives_restart(tmp_path):
+    path = str(tmp_path / "near.sqlite3")
+    fingerprint = simhash(page(1))
+    index = NearDuplicateIndex(db_path=path, max_entries=1)
+    index.add("https://example.com/old", simhash(page(2)), ["старый"])
+    index.add("https://example.com/a", fingerprint, ["Вопрос?"])
+
+    restored = NearDuplicateIndex(db_path=path)
+    entry, _ = restored.lookup(fingerprint)
+    assert entry.questions == ["Вопрос?"]
+    assert restored.get_stats()["entries"] == 1
+
+
+def test_analyzer_fetches_submitted_url(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    analyzer = SiteAnalyzer()
+    analyzer.near_duplicates = NearDuplicateIndex()
+    fetched = []
+
+    async def fetch(url, limits=None):
+        fetched.append(url)
+        return page(1)
+
+    async def generate(text, no_cache=False, priority=0):
+        return ["Вопрос?"]
+
+    monkeypatch.setattr(analyzer, "afetch_site_text", fetch)
+    monkeypatch.setattr(analyzer, "agenerate_questions", generate)
+    url = "https://Example.com/tree?ref=main&flag&utm_source=x#readme"
+
+    result = asyncio.run(analyzer.aanalyze_site(url))
+
+    assert fetched == ["https://Example.com/tree?ref=main&flag&utm_source=x"]
+    assert result["url"] == url
+    assert "https://example.com/tree?flag=&ref=main" in analyzer.near_duplicates._entries
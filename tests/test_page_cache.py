@@ -0,0 +1,73 @@
+"""
+Тесты кэша страниц на mock-сайте: повторное использование текста по 304 и вытеснение по объему
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.analyzer import SiteAnalyzer
+from app.services.page_cache import PageCache
+from benchmarks.mock_servers import MockSiteServer, build_page
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    monkeypatch.setenv("QUESTIONS_BATCH_ENABLED", "false")
+    analyzer = SiteAnalyzer()
+    analyzer.page_cache = PageCache()
+    yield analyzer
+    asyncio.run(analyzer.aclose())
+
+
+def test_not_modified_page_reuses_cached_text(analyzer):
+    with MockSiteServer(page_size=5000, validators=True) as site:
+        first = analyzer.fetch_site_text(site.url)
+        second = analyzer.fetch_site_text(site.url)
+        third = asyncio.run(analyzer.afetch_site_text(site.url))
+
+    assert first == second == third
+    assert site.not_modified_count == 2
+    stats = analyzer.page_cache.get_stats()
+    assert stats["downloads"] == 1
+    assert stats["not_modified"] == 2
+    assert stats["bytes_saved"] > 0
+
+
+def test_changed_page_is_downloaded_again(analyzer):
+    with MockSiteServer(page_size=5000, validators=True) as site:
+        first = analyzer.fetch_site_text(site.url)
+        site.set_page(build_page(6000).replace("<h1>", "<h1>Новая версия ", 1))
+        second = analyzer.fetch_site_text(site.url)
+
+    assert first != second
+    assert site.not_modified_count == 0
+    assert analyzer.page_cache.get_stats()["downloads"] == 2
+
+
+def test_pages_without_validators_are_not_cached(analyzer):
+    with MockSiteServer(page_size=5000) as site:
+        analyzer.fetch_site_text(site.url)
+        analyzer.fetch_site_text(site.url)
+
+    assert site.requests_count == 2
+    assert analyzer.page_cache.get_stats()["entries"] == 0
+
+
+def test_least_recently_used_page_is_evicted(analyzer):
+    with MockSiteServer(page_size=5000, validators=True) as site:
+        first, second = f"{site.url}/a?variant=1", f"{site.url}/b?variant=2"
+        analyzer.fetch_site_text(first)
+        # Объема хватает только на одну страницу
+        analyzer.page_cache.max_bytes = analyzer.page_cache.get_stats()["bytes"] * 3 // 2
+        analyzer.fetch_site_text(second)
+        analyzer.fetch_site_text(first)
+
+        stats = analyzer.page_cache.get_stats()
+        assert stats["evictions"] == 2
+        assert stats["entries"] == 1
+        # Вытесненная страница скачивается заново без условного запроса
+        assert site.not_modified_count == 0
+        assert analyzer.page_cache.get(first) is not None
+        assert analyzer.page_cache.get(second) is None
@@ -0,0 +1,54 @@
+"""
+Тесты доступа к профилям запросов: без токена и с неверным токеном эндпоинты закрыты
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import profiling
+from app.services.profiling import ADMIN_HEADER, PROFILE_HEADER, PROFILE_ID_HEADER, RequestProfiler
+
+TOKEN = "secret"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(profiling, "_profiler", RequestProfiler(admin_token=TOKEN))
+    # Без контекстного менеджера lifespan не запускается и общие сервисы не создаются
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path", ["/api/v1/slow-requests", "/api/v1/profiles/unknown"])
+def test_endpoints_are_closed_without_admin_token(client, path):
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={ADMIN_HEADER: "wrong"}).status_code == 403
+
+
+@pytest.mark.parametrize("path", ["/api/v1/slow-requests", "/api/v1/profiles/unknown"])
+def test_endpoints_are_closed_when_profiling_is_disabled(monkeypatch, path):
+    monkeypatch.setattr(profiling, "_profiler", RequestProfiler())
+    client = TestClient(app)
+
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={ADMIN_HEADER: ""}).status_code == 403
+
+
+def test_unknown_trace_returns_404(client):
+    response = client.get("/api/v1/profiles/unknown", headers={ADMIN_HEADER: TOKEN})
+
+    assert response.status_code == 404
+
+
+def test_profiled_request_is_available_to_admin_only(client):
+    response = client.get("/api/v1/stream-stats", headers={PROFILE_HEADER: TOKEN})
+    trace_id = response.headers[PROFILE_ID_HEADER]
+
+    assert client.get(f"/api/v1/profiles/{trace_id}").status_code == 403
+    profile = client.get(f"/api/v1/profiles/{trace_id}", headers={ADMIN_HEADER: TOKEN})
+    assert profile.status_code == 200
+    assert profile.json()["path"] == "/api/v1/stream-stats"
+
+    listing = client.get("/api/v1/slow-requests", headers={ADMIN_HEADER: TOKEN})
+    assert listing.status_code == 200
+    assert trace_id in [item["id"] for item in listing.json()["profiles"]]
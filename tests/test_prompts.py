@@ -0,0 +1,68 @@
+"""
+Тесты шаблонов промптов: побайтно стабильный префикс для кэширования промптов провайдером
+"""
+
+import json
+import os
+
+import pytest
+
+from app.services.analyzer import PACKED_QUESTIONS_PROMPT, QUESTIONS_PROMPT, SiteAnalyzer
+from app.services.prompts import PromptTemplate
+
+
+def request_body(system: str, user: str) -> bytes:
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    return json.dumps({"messages": messages}).encode("utf-8")
+
+
+def test_prefix_is_byte_identical_across_calls():
+    template = PromptTemplate("test", system="Инструкции", user="Вопрос про сайт.\n\nТекст:\n{site_text}")
+    first = template.render(site_text="Первый сайт")
+    second = template.render(site_text="Совсем другой сайт")
+
+    assert first[0].encode("utf-8") == second[0].encode("utf-8")
+    assert os.path.commonprefix([first[1], second[1]]) == "Вопрос про сайт.\n\nТекст:\n"
+    assert template.render(site_text="Первый сайт") == first
+
+
+@pytest.mark.parametrize("template, field", [(QUESTIONS_PROMPT, "site_text"), (PACKED_QUESTIONS_PROMPT, "pages")])
+def test_request_bodies_share_everything_before_site_data(template, field):
+    first = request_body(*template.render(**{field: "Текст первого сайта"}))
+    second = request_body(*template.render(**{field: "Другой текст"}))
+
+    # Тело с пустыми данными без закрывающих '"}]}' - системное сообщение и инструкции пользовательского
+    static_prefix = request_body(*template.render(**{field: ""}))[:-len(b'"}]}')]
+    assert first.startswith(static_prefix) and second.startswith(static_prefix)
+    assert first[len(static_prefix):] != second[len(static_prefix):]
+
+
+def test_analyzer_prompts_keep_template_prefix(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    analyzer = SiteAnalyzer()
+    first = analyzer._build_question_prompts("Магазин велосипедов с доставкой по России. " * 20)
+    second = analyzer._build_question_prompts("Онлайн-школа английского языка для детей. " * 20)
+
+    assert first[0] == second[0] == QUESTIONS_PROMPT.system
+    prefix = QUESTIONS_PROMPT.render(site_text="")[1]
+    assert first[1].startswith(prefix) and second[1].startswith(prefix)
+
+
+def test_prefix_hash_depends_only_on_system_message():
+    first = PromptTemplate("a", system="Инструкции", user="{x}")
+    second = PromptTemplate("b", system="Инструкции", user="Другой {y}")
+    changed = PromptTemplate("a", system="Инструкции.", user="{x}")
+
+    assert first.prefix_hash == second.prefix_hash
+    assert first.prefix_hash != changed.prefix_hash
+
+
+@pytest.mark.parametrize("user", ["{0}", "{value:>10}", "{value!r}", "{item[0]}"])
+def test_only_named_fields_are_allowed(user):
+    with pytest.raises(ValueError):
+        PromptTemplate("bad", system="", user=user)
+
+
+def test_missing_field_is_reported():
+    with pytest.raises(ValueError, match="site_text"):
+        QUESTIONS_PROMPT.render()
@@ -0,0 +1,65 @@
+"""
+Тесты планировщика запросов к LLM: оценка ожидания по бюджетам RPM и TPM
+и общая очередь для асинхронных и блокирующих вызовов
+"""
+
+import asyncio
+import threading
+import time
+
+from app.services.rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMScheduler
+
+
+def test_idle_bucket_is_refilled_before_estimate():
+    scheduler = LLMScheduler(rpm=60)
+    # Бюджет израсходован две минуты назад и с тех пор пополнился
+    scheduler.rpm.tokens = 0
+    scheduler.rpm._updated -= 120
+
+    started = time.monotonic()
+    assert scheduler.acquire_blocking(100) == 0.0
+    assert time.monotonic() - started < 0.5
+
+
+def test_request_larger_than_tpm_waits_for_full_bucket_only():
+    scheduler = LLMScheduler(tpm=1000, batch_max_wait=120)
+    scheduler.tpm.tokens = 0
+
+    wait = scheduler._estimate_wait(5000, PRIORITY_BATCH)
+
+    assert 59 <= wait <= 60.5
+
+
+def test_blocking_caller_queues_behind_interactive_requests():
+    scheduler = LLMScheduler(rpm=600)
+    scheduler.rpm.tokens = 0
+    granted = []
+
+    def blocking():
+        scheduler.acquire_blocking(10)
+        granted.append("batch")
+
+    async def main():
+        thread = threading.Thread(target=blocking)
+        thread.start()
+        while not scheduler._queue:
+            await asyncio.sleep(0.001)
+        await scheduler.acquire(10, PRIORITY_INTERACTIVE)
+        granted.append("interactive")
+        await asyncio.to_thread(thread.join)
+
+    asyncio.run(main())
+
+    assert granted == ["interactive", "batch"]
+    assert scheduler.get_stats()["queue_depth"] == 0
+
+
+def test_blocking_caller_is_served_without_event_loop():
+    scheduler = LLMScheduler(rpm=600)
+    scheduler.rpm.tokens = 0
+
+    started = time.monotonic()
+    waits = [scheduler.acquire_blocking(10) for _ in range(3)]
+
+    assert all(wait > 0 for wait in waits)
+    assert time.monotonic() - started < 1.0
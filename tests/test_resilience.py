@@ -0,0 +1,125 @@
+"""
+Тесты политики вызовов LLM на mock OpenAI-совместимом сервере:
+повторы временных ошибок, Retry-After и разомкнутый выключатель
+"""
+
+import asyncio
+import time
+
+import pytest
+from openai import APIStatusError
+
+from app.services.resilience import CallPolicy, CircuitBreaker, CircuitOpenError
+from benchmarks.mock_servers import MockLLMServer
+
+
+@pytest.fixture
+def llm():
+    with MockLLMServer() as server:
+        yield server
+
+
+@pytest.fixture
+def client(llm, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{llm.url}/v1")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    from app.services import model_pool
+    from app.services.openai_module import LLMClient
+
+    # Пул моделей общий для процесса: у каждого теста свой mock-сервер и свежие выключатели
+    monkeypatch.setattr(model_pool, "_pool", None)
+
+    return LLMClient()
+
+
+def _ask(client) -> str:
+    return asyncio.run(client._acomplete(client._build_chat_messages("ping"), "test"))
+
+
+def test_transient_errors_are_retried(llm, client):
+    client.policy = CallPolicy(max_retries=2, base_delay=0.01)
+    llm.fail_next(2, status=503)
+
+    assert "questions" in _ask(client)
+    assert llm.requests_count == 3
+    assert client.policy.get_stats()["retries"] == 2
+
+
+def test_sync_call_is_retried(llm, client):
+    client.policy = CallPolicy(max_retries=1, base_delay=0.01)
+    llm.fail_next(1, status=500)
+
+    assert "questions" in client._complete(client._build_chat_messages("ping"), "test")
+    assert llm.requests_count == 2
+
+
+def test_retries_are_limited(llm, client):
+    client.policy = CallPolicy(max_retries=1, base_delay=0.01)
+    llm.fail_next(5, status=503)
+
+    with pytest.raises(APIStatusError):
+        _ask(client)
+    assert llm.requests_count == 2
+    assert client.policy.get_stats()["failures"] == 1
+
+
+def test_request_errors_are_not_retried(llm, client):
+    client.policy = CallPolicy(max_retries=2, base_delay=0.01)
+    llm.fail_next(1, status=400)
+
+    with pytest.raises(APIStatusError):
+        _ask(client)
+    assert llm.requests_count == 1
+
+
+def test_retry_waits_for_retry_after(llm, client):
+    client.policy = CallPolicy(max_retries=1, base_delay=0.01)
+    llm.fail_next(1, status=429, retry_after=1)
+
+    started = time.monotonic()
+    assert "questions" in _ask(client)
+    assert time.monotonic() - started >= 1.0
+    assert llm.requests_count == 2
+
+
+def test_retry_after_beyond_deadline_is_not_waited(llm, client):
+    client.policy = CallPolicy(max_retries=2, base_delay=0.01, deadline=0.5)
+    llm.fail_next(1, status=429, retry_after=5)
+
+    started = time.monotonic()
+    with pytest.raises(APIStatusError):
+        _ask(client)
+    assert time.monotonic() - started < 1.0
+    assert llm.requests_count == 1
+
+
+def test_open_circuit_rejects_calls_without_requests(llm, client):
+    client.policy = CallPolicy(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    llm.fail_next(2, status=503)
+
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            _ask(client)
+    with pytest.raises(CircuitOpenError):
+        _ask(client)
+
+    assert llm.requests_count == 2
+    stats = client.policy.get_stats()
+    assert stats["breaker"] == CircuitBreaker.OPEN
+    assert stats["short_circuited"] == 1
+
+
+def test_half_open_probe_closes_circuit(llm, client):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.2)
+    client.policy = CallPolicy(max_retries=0, breaker=breaker)
+    llm.fail_next(1, status=503)
+
+    with pytest.raises(APIStatusError):
+        _ask(client)
+    with pytest.raises(CircuitOpenError):
+        _ask(client)
+    time.sleep(0.25)
+
+    assert "questions" in _ask(client)
+    assert breaker.state == CircuitBreaker.CLOSED
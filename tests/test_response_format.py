@@ -0,0 +1,102 @@
+"""
+Тесты режима структурированного ответа: json_schema понижается только для модели,
+которая его отклонила, и только при ошибке о неподдерживаемом response_format
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from openai import BadRequestError
+from pydantic import BaseModel
+
+from app.services import model_pool
+from app.services.model_pool import TASK_CHAT, TASK_JSON
+from app.services.openai_module import rejects_response_format
+from benchmarks.mock_servers import MockLLMServer
+
+
+class Questions(BaseModel):
+    questions: list
+
+
+def bad_request(message: str, param=None, code=None) -> BadRequestError:
+    response = httpx.Response(400, request=httpx.Request("POST", "http://llm.test/v1/chat/completions"))
+    body = {"message": message, "type": "invalid_request_error", "param": param, "code": code}
+    return BadRequestError(message, response=response, body=body)
+
+
+@pytest.fixture
+def llm():
+    with MockLLMServer() as server:
+        server.model_response_formats = {"mini": {"json_object"}}
+        yield server
+
+
+@pytest.fixture
+def client(llm, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{llm.url}/v1")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    monkeypatch.setenv("LLM_MODEL_POOL", json.dumps([
+        {"model": "gpt-4o", "tasks": [TASK_CHAT]},
+        {"model": "mini", "tasks": [TASK_JSON]},
+    ]))
+    monkeypatch.setattr(model_pool, "_pool", None)
+    from app.services.openai_module import LLMClient
+
+    return LLMClient()
+
+
+def entry(client, model: str):
+    return next(endpoint for endpoint in client.pool.entries if endpoint.model == model)
+
+
+def test_rejected_format_is_downgraded_for_that_model_only(llm, client):
+    result = client.chat_json("system", "user", schema=Questions, task=TASK_JSON, no_cache=True)
+    assert result["questions"]
+    assert llm.requests_count == 2
+    assert entry(client, "mini").unsupported_formats == {"json_schema"}
+
+    # Понижение запоминается для mini и не затрагивает другие модели пула
+    client.chat_json("system", "user", schema=Questions, task=TASK_JSON, no_cache=True)
+    client.chat_json("system", "user", schema=Questions, task=TASK_CHAT, no_cache=True)
+    assert llm.requests_count == 4
+    assert entry(client, "gpt-4o").unsupported_formats == set()
+    assert client.response_format == "json_schema"
+
+
+def test_streamed_json_downgrades_before_first_chunk(llm, client):
+    async def collect():
+        return [item async for item in client.astream_json_items(
+            "system", "user", "questions", schema=Questions, no_cache=True, task=TASK_JSON
+        )]
+
+    assert len(asyncio.run(collect())) == 5
+    assert entry(client, "mini").unsupported_formats == {"json_schema"}
+
+
+def test_model_without_any_format_gets_prompt_only(llm, client):
+    llm.model_response_formats = {"mini": set()}
+
+    async def ask():
+        return await client.achat_json("system", "user", schema=Questions, task=TASK_JSON, no_cache=True)
+
+    assert asyncio.run(ask())["questions"]
+    assert entry(client, "mini").unsupported_formats == {"json_schema", "json_object"}
+    assert llm.requests_count == 3
+
+
+def test_only_unsupported_format_errors_trigger_downgrade():
+    assert rejects_response_format(bad_request(
+        "Invalid parameter: 'response_format' of type 'json_schema' is not supported with this model.",
+        param="response_format"
+    ))
+    assert rejects_response_format(bad_request("Unknown parameter", param="response_format",
+                                               code="unsupported_parameter"))
+    # Ошибка в самой схеме или другом параметре - не повод отключать режим
+    assert not rejects_response_format(bad_request(
+        "Invalid schema for response_format 'Questions': 'required' is missing", param="response_format"
+    ))
+    assert not rejects_response_format(bad_request("max_tokens is too large: json_schema", param="max_tokens"))
@@ -0,0 +1,96 @@
+"""
+Тесты объединения одновременных одинаковых запросов и его использования в анализе сайтов
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.analyzer import SiteAnalyzer
+from app.services.rate_limiter import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    group = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(group.do("key", work) for _ in range(5)), group.do("other", work))
+
+    assert asyncio.run(main()) == ["result"] * 6
+    assert len(calls) == 2
+    assert group.get_stats() == {"calls": 6, "executions": 2, "coalesced": 4, "inflight": 0}
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    group = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(group.do("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+        async def ok():
+            return "ok"
+        return await group.do("key", ok)
+
+    assert asyncio.run(main()) == "ok"
+    assert group.get_stats()["executions"] == 2
+
+
+def test_cancelled_leader_does_not_cancel_work_for_followers():
+    group = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(group.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(group.do("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "result"
+    assert group.get_stats()["executions"] == 1
+
+
+def test_interactive_analysis_does_not_join_batch_flight(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    analyzer = SiteAnalyzer()
+    priorities = []
+
+    async def analyze(url, no_cache, limits, priority):
+        priorities.append(priority)
+        await asyncio.sleep(0.02)
+        return {"url": url, "questions": ["Вопрос?"]}
+
+    monkeypatch.setattr(analyzer, "_aanalyze_site", analyze)
+
+    async def main():
+        return await asyncio.gather(
+            analyzer.aanalyze_site("https://example.com/?utm_source=batch", priority=PRIORITY_BATCH),
+            analyzer.aanalyze_site("https://example.com/?utm_source=job", priority=PRIORITY_BATCH),
+            analyzer.aanalyze_site("https://example.com/", priority=PRIORITY_INTERACTIVE),
+        )
+
+    results = asyncio.run(main())
+
+    # Пакетные вызовы объединены, интерактивный выполнен отдельно со своим приоритетом
+    assert sorted(priorities) == [PRIORITY_INTERACTIVE, PRIORITY_BATCH]
+    assert [result["url"] for result in results] == [
+        "https://example.com/?utm_source=batch", "https://example.com/?utm_source=job", "https://example.com/"
+    ]
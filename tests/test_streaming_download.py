@@ -0,0 +1,66 @@
+"""
+Тесты потокового скачивания: разбор порций вне event loop и под лимитом стадии разбора
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from app.services.analyzer import SiteAnalyzer
+from app.services.batch import StageLimits
+from app.services.html_stream import HtmlStreamReader
+from benchmarks.mock_servers import MockSiteServer
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    monkeypatch.setenv("QUESTIONS_BATCH_ENABLED", "false")
+    monkeypatch.setenv("DOWNLOAD_STREAMING", "true")
+    analyzer = SiteAnalyzer()
+    analyzer.page_cache = None
+    yield analyzer
+    asyncio.run(analyzer.aclose())
+
+
+def _record_calls(monkeypatch, limits=None):
+    calls = []
+
+    def wrap(method):
+        def wrapper(reader, *args):
+            parse_held = limits is not None and limits.parse.locked()
+            calls.append((method.__name__, threading.current_thread(), parse_held))
+            return method(reader, *args)
+        return wrapper
+
+    monkeypatch.setattr(HtmlStreamReader, "feed", wrap(HtmlStreamReader.feed))
+    monkeypatch.setattr(HtmlStreamReader, "finish", wrap(HtmlStreamReader.finish))
+    return calls
+
+
+def test_chunks_are_parsed_outside_event_loop(analyzer, monkeypatch):
+    calls = _record_calls(monkeypatch)
+
+    with MockSiteServer(page_size=300_000) as site:
+        text = asyncio.run(analyzer.afetch_site_text(site.url))
+
+    assert text
+    assert {name for name, _, _ in calls} == {"feed", "finish"}
+    assert all(thread is not threading.main_thread() for _, thread, _ in calls)
+
+
+def test_streaming_extraction_holds_parse_limit(analyzer, monkeypatch):
+    async def run(url):
+        limits = StageLimits(parse=1)
+        calls = _record_calls(monkeypatch, limits)
+        text = await analyzer.afetch_site_text(url, limits)
+        return text, calls, limits
+
+    with MockSiteServer(page_size=300_000) as site:
+        text, calls, limits = asyncio.run(run(site.url))
+
+    assert text
+    assert calls and all(parse_held for _, _, parse_held in calls)
+    # Между порциями слот разбора освобождается
+    assert not limits.parse.locked()